@@ -29,32 +29,119 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-from deepcell import applications
-from deepcell import callbacks
-from deepcell import datasets
-from deepcell import layers
-from deepcell import losses
-from deepcell import initializers
-from deepcell import image_generators
-from deepcell import model_zoo
-from deepcell import notebooks
-from deepcell import running
-from deepcell import tracking
-from deepcell import training
-from deepcell import utils
-from deepcell import metrics
-
-from deepcell.layers import *
-from deepcell.image_generators import *
-from deepcell.model_zoo import *
-from deepcell.running import get_cropped_input_shape
-from deepcell.running import process_whole_image
-from deepcell.training import train_model_conv
-from deepcell.training import train_model_sample
-from deepcell.training import train_model_siamese_daughter
-from deepcell.training import train_model_retinanet
-from deepcell.utils import *
+import sys
+
+from deepcell.utils.misc_utils import LazyModule
+
+# Submodules are imported on first use, so that ``import deepcell`` does not
+# import TensorFlow until a model, layer or generator is needed.
+_SUBMODULES = [
+    'applications',
+    'callbacks',
+    'datasets',
+    'layers',
+    'losses',
+    'initializers',
+    'image_generators',
+    'model_zoo',
+    'notebooks',
+    'running',
+    'serving',
+    'tracking',
+    'training',
+    'utils',
+    'metrics',
+]
+
+_ATTRIBUTES = {
+    'get_cropped_input_shape': 'deepcell.running',
+    'process_whole_image': 'deepcell.running',
+    'process_tiled_image': 'deepcell.running',
+    'train_model_conv': 'deepcell.training',
+    'train_model_sample': 'deepcell.training',
+    'train_model_siamese_daughter': 'deepcell.training',
+    'train_model_retinanet': 'deepcell.training',
+}
+
+# public names of the modules that used to be imported with
+# ``from module import *``
+_STAR_ATTRIBUTES = {
+    'deepcell.layers': [
+        'Location2D',
+        'Location3D',
+        'ImageNormalization2D',
+        'ImageNormalization3D',
+        'DilatedMaxPool2D',
+        'DilatedMaxPool3D',
+        'Resize2D',
+        'TensorProduct',
+        'ReflectionPadding2D',
+        'ReflectionPadding3D',
+        'FilterDetections',
+        'Anchors',
+        'RegressBoxes',
+        'ClipBoxes',
+        'ConcatenateBoxes',
+        'RoiAlign',
+        'Shape',
+        'Cast',
+        'Upsample',
+        'UpsampleLike',
+        'ConvGRU2D',
+    ],
+    'deepcell.image_generators': [
+        'set_transform_cache',
+        'ImageFullyConvDataGenerator',
+        'ImageFullyConvIterator',
+        'MovieDataGenerator',
+        'MovieArrayIterator',
+        'RetinaNetGenerator',
+        'RetinaNetIterator',
+        'RetinaMovieIterator',
+        'RetinaMovieDataGenerator',
+        'SemanticDataGenerator',
+        'SemanticIterator',
+        'SampleDataGenerator',
+        'ImageSampleArrayIterator',
+        'SampleMovieDataGenerator',
+        'SampleMovieArrayIterator',
+        'ScaleIterator',
+        'ScaleDataGenerator',
+        'SiameseDataGenerator',
+        'SiameseIterator',
+    ],
+    'deepcell.model_zoo': [
+        'bn_feature_net_2D',
+        'bn_feature_net_skip_2D',
+        'bn_feature_net_3D',
+        'bn_feature_net_skip_3D',
+        'siamese_model',
+        'RetinaNet',
+        'retinanet',
+        'retinanet_bbox',
+        'RetinaMask',
+        'retinanet_mask',
+        'FPNet',
+        'PanopticNet',
+    ],
+    # deepcell.utils is lazy, so its names are known without importing it
+    'deepcell.utils': sys.modules['deepcell.utils'].__all__,
+}
+
+for _module, _names in _STAR_ATTRIBUTES.items():
+    for _name in _names:
+        _ATTRIBUTES.setdefault(_name, _module)
 
 del absolute_import
 del division
 del print_function
+
+_lazy_module = LazyModule(__name__, globals(),
+                          submodules=_SUBMODULES,
+                          attributes=_ATTRIBUTES)
+
+# the names used to install the lazy module are not part of the package
+del _lazy_module.sys
+del _lazy_module.LazyModule
+
+sys.modules[__name__] = _lazy_module
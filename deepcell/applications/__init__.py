@@ -36,6 +36,10 @@ from deepcell.applications.scale_detection import ScaleDetectionModel
 from deepcell.applications.phase_segmentation import PhaseSegmentationModel
 from deepcell.applications.fluorescent_cytoplasm_segmentation import \
     FluorCytoplasmSegmentationModel
+from deepcell.applications.registry import ModelRegistry
+from deepcell.applications.registry import get_model
+from deepcell.applications.registry import warm_up
+from deepcell.applications.application import Application
 
 del absolute_import
 del division
@@ -0,0 +1,224 @@
+# Copyright 2016-2019 The Van Valen Lab at the California Institute of
+# Technology (Caltech), with support from the Paul Allen Family Foundation,
+# Google, & National Institutes of Health (NIH) under Grant U24CA224309-01.
+# All rights reserved.
+#
+# Licensed under a modified Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.github.com/vanvalenlab/deepcell-tf/LICENSE
+#
+# The Work provided may be used for non-commercial academic purposes only.
+# For any other use of the Work, including commercial use, please contact:
+# vanvalenlab@gmail.com
+#
+# Neither the name of Caltech nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Batched prediction and post-processing for application models"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import functools
+
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+from tensorflow.python.keras import backend as K
+
+from deepcell_toolbox import pixelwise
+
+from deepcell.applications.registry import get_model
+from deepcell.running import predict_tta
+from deepcell.running import process_tiled_image
+
+
+# post-processing used for the segmentation models in the registry
+DEFAULT_POSTPROCESSING = {
+    'NuclearSegmentationModel': pixelwise,
+    'PhaseSegmentationModel': pixelwise,
+    'FluorCytoplasmSegmentationModel': pixelwise,
+}
+
+
+class Application(object):
+    """Run a model over a stack of images and post-process the outputs.
+
+    Images are streamed through the model in batches of ``batch_size``,
+    and the outputs of each batch are post-processed in a pool of workers
+    while the model predicts the next batch.
+
+    If the model has a fixed input size that does not match the images,
+    each batch is processed as overlapping tiles with
+    ``deepcell.running.process_tiled_image``.
+
+    Args:
+        model (tensorflow.keras.Model): model used for predictions
+        preprocessing_fn (function): optional function applied to each
+            batch of images before prediction.
+        postprocessing_fn (function): optional function applied to the
+            output of each image, such as ``deepcell_toolbox.pixelwise``.
+            If None, the model outputs are returned.
+        output_index (int): index of the model output to post-process,
+            if the model has multiple outputs.
+        num_workers (int): number of post-processing workers.
+        use_processes (bool): whether to post-process in a pool of processes
+            instead of threads. ``postprocessing_fn`` must be picklable.
+        tile_overlap (int): overlap between tiles, if the images are tiled.
+        tta (bool): whether to average the predictions of the rotated and
+            flipped images, see ``deepcell.running.predict_tta``.
+        max_pending_batches (int): maximum number of predicted batches
+            waiting to be post-processed. Bounds the memory used by the
+            predictions, whatever the number of images.
+
+    Raises:
+        ValueError: max_pending_batches is less than 1
+    """
+
+    def __init__(self,
+                 model,
+                 preprocessing_fn=None,
+                 postprocessing_fn=None,
+                 output_index=-1,
+                 num_workers=4,
+                 use_processes=False,
+                 tile_overlap=32,
+                 tta=False,
+                 max_pending_batches=2):
+        if max_pending_batches < 1:
+            raise ValueError('Expected `max_pending_batches` to be at least 1. '
+                             'Got {}.'.format(max_pending_batches))
+
+        self.model = model
+        self.preprocessing_fn = preprocessing_fn
+        self.postprocessing_fn = postprocessing_fn
+        self.output_index = output_index
+        self.num_workers = num_workers
+        self.use_processes = use_processes
+        self.tile_overlap = tile_overlap
+        self.tta = tta
+        self.max_pending_batches = int(max_pending_batches)
+
+    @classmethod
+    def from_registry(cls, name, input_shape=(None, None, 1), backbone=None,
+                      use_pretrained_weights=True, **kwargs):
+        """Create an Application with a model from the process-wide registry.
+
+        The segmentation models use ``DEFAULT_POSTPROCESSING`` unless a
+        ``postprocessing_fn`` is provided.
+
+        Args:
+            name (str): name of the application model,
+                e.g. "NuclearSegmentationModel"
+            input_shape (tuple): a 3-length tuple of the input data shape.
+            backbone (str): name of the backbone to use for the model.
+            use_pretrained_weights (bool): whether to load pre-trained weights.
+            kwargs (dict): other arguments passed to Application.
+
+        Returns:
+            Application: application using the cached model
+        """
+        model = get_model(name, input_shape=input_shape, backbone=backbone,
+                          use_pretrained_weights=use_pretrained_weights)
+        kwargs.setdefault('postprocessing_fn', DEFAULT_POSTPROCESSING.get(name))
+        return cls(model, **kwargs)
+
+    def _get_tile_size(self, images):
+        """Get the tile size if the model can not process the full images"""
+        if K.image_data_format() == 'channels_first':
+            image_shape = images.shape[-2:]
+            model_shape = self.model.input_shape[-2:]
+        else:
+            image_shape = images.shape[-3:-1]
+            model_shape = self.model.input_shape[-3:-1]
+
+        if None in model_shape or tuple(model_shape) == tuple(image_shape):
+            return None
+        return tuple(model_shape)
+
+    def _predict_batch(self, batch, tile_size):
+        if self.preprocessing_fn is not None:
+            batch = self.preprocessing_fn(batch)
+
+        if tile_size is not None:
+            return process_tiled_image(
+                self.model, batch,
+                tile_size=tile_size,
+                overlap=min(self.tile_overlap, min(tile_size) - 1),
+                tiles_per_batch=len(batch),
+                tta=self.tta,
+                output_index=self.output_index)
+
+        if self.tta:
+            return predict_tta(self.model, batch,
+                               output_index=self.output_index)
+
+        predicted = self.model.predict(batch, batch_size=len(batch))
+        if isinstance(predicted, list):
+            predicted = predicted[self.output_index]
+        return predicted
+
+    def predict(self, images, batch_size=4, **postprocess_kwargs):
+        """Predict and post-process a stack of images.
+
+        Args:
+            images (numpy.array): stack of images of any length
+            batch_size (int): number of images in each predict call
+            postprocess_kwargs (dict): keyword arguments passed to
+                ``postprocessing_fn``.
+
+        Returns:
+            numpy.array: post-processed output (e.g. label masks)
+                of each image.
+
+        Raises:
+            ValueError: batch_size is less than 1
+        """
+        if batch_size < 1:
+            raise ValueError('Expected `batch_size` to be at least 1. '
+                             'Got {}.'.format(batch_size))
+
+        tile_size = self._get_tile_size(images)
+
+        if self.postprocessing_fn is None:
+            return np.concatenate([
+                self._predict_batch(images[i:i + batch_size], tile_size)
+                for i in range(0, len(images), batch_size)], axis=0)
+
+        postprocess = functools.partial(self.postprocessing_fn,
+                                        **postprocess_kwargs)
+
+        pool = (Pool if self.use_processes else ThreadPool)(self.num_workers)
+        try:
+            results = []
+            pending = collections.deque()
+            for i in range(0, len(images), batch_size):
+                predicted = self._predict_batch(images[i:i + batch_size],
+                                                tile_size)
+                # post-process this batch while the next one is predicted
+                pending.append(pool.map_async(postprocess, list(predicted)))
+
+                # wait for the oldest batches, so the predictions held in
+                # memory are bounded by max_pending_batches
+                while len(pending) > self.max_pending_batches:
+                    results.extend(pending.popleft().get())
+
+            while pending:
+                results.extend(pending.popleft().get())
+        finally:
+            pool.terminate()
+            pool.join()
+
+        return np.stack(results, axis=0)
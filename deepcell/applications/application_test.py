@@ -0,0 +1,116 @@
+# Copyright 2016-2019 The Van Valen Lab at the California Institute of
+# Technology (Caltech), with support from the Paul Allen Family Foundation,
+# Google, & National Institutes of Health (NIH) under Grant U24CA224309-01.
+# All rights reserved.
+#
+# Licensed under a modified Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.github.com/vanvalenlab/deepcell-tf/LICENSE
+#
+# The Work provided may be used for non-commercial academic purposes only.
+# For any other use of the Work, including commercial use, please contact:
+# vanvalenlab@gmail.com
+#
+# Neither the name of Caltech nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for Application"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+from tensorflow.python import keras
+from tensorflow.python.platform import test
+
+from deepcell.applications import Application
+
+
+def _threshold(prediction, threshold=0.5):
+    return (prediction[..., :1] > threshold).astype('int32')
+
+
+class TestApplication(test.TestCase):
+
+    def _get_model(self, input_shape):
+        inputs = keras.layers.Input(shape=input_shape)
+        outputs = keras.layers.Lambda(lambda x: x * 1)(inputs)
+        return keras.models.Model(inputs=inputs, outputs=[outputs, outputs])
+
+    def test_predict(self):
+        keras.backend.set_image_data_format('channels_last')
+        images = np.random.random((10, 32, 32, 1))
+
+        with self.cached_session():
+            model = self._get_model((None, None, 1))
+
+            # without post-processing, the model output is returned
+            app = Application(model)
+            output = app.predict(images, batch_size=3)
+            self.assertAllClose(output, images)
+
+            for use_processes in [False, True]:
+                app = Application(model,
+                                  postprocessing_fn=_threshold,
+                                  num_workers=2,
+                                  use_processes=use_processes)
+                labels = app.predict(images, batch_size=4, threshold=0.3)
+                self.assertAllEqual(labels, images > 0.3)
+
+            app = Application(model, postprocessing_fn=_threshold, tta=True)
+            labels = app.predict(images, batch_size=4, threshold=0.3)
+            self.assertAllEqual(labels, images > 0.3)
+
+            # results are gathered in order while batches are predicted
+            app = Application(model, postprocessing_fn=_threshold,
+                              max_pending_batches=1)
+            labels = app.predict(images, batch_size=3, threshold=0.3)
+            self.assertAllEqual(labels, images > 0.3)
+
+            with self.assertRaises(ValueError):
+                app.predict(images, batch_size=0)
+            with self.assertRaises(ValueError):
+                Application(model, max_pending_batches=0)
+
+    def test_predict_tiled(self):
+        keras.backend.set_image_data_format('channels_last')
+        images = np.random.random((5, 40, 40, 1))
+
+        with self.cached_session():
+            # the model can only process 16x16 images
+            model = self._get_model((16, 16, 1))
+
+            app = Application(model,
+                              preprocessing_fn=lambda x: x * 2,
+                              postprocessing_fn=_threshold,
+                              tile_overlap=4)
+            labels = app.predict(images, batch_size=2)
+            self.assertEqual(labels.shape, images.shape)
+            self.assertAllEqual(labels, images * 2 > 0.5)
+
+            # the output_index is used for tiled predictions
+            inputs = keras.layers.Input(shape=(16, 16, 1))
+            outputs = [keras.layers.Lambda(lambda x: x * 1)(inputs),
+                       keras.layers.Lambda(lambda x: x * 3)(inputs)]
+            model = keras.models.Model(inputs=inputs, outputs=outputs)
+
+            for tta in [False, True]:
+                app = Application(model, output_index=0, tile_overlap=4,
+                                  tta=tta)
+                output = app.predict(images, batch_size=2)
+                self.assertAllClose(output, images, atol=1e-5)
+
+
+if __name__ == '__main__':
+    test.main()
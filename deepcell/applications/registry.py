@@ -0,0 +1,274 @@
+# Copyright 2016-2019 The Van Valen Lab at the California Institute of
+# Technology (Caltech), with support from the Paul Allen Family Foundation,
+# Google, & National Institutes of Health (NIH) under Grant U24CA224309-01.
+# All rights reserved.
+#
+# Licensed under a modified Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.github.com/vanvalenlab/deepcell-tf/LICENSE
+#
+# The Work provided may be used for non-commercial academic purposes only.
+# For any other use of the Work, including commercial use, please contact:
+# vanvalenlab@gmail.com
+#
+# Neither the name of Caltech nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Process-wide registry that builds each application model once"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import threading
+
+import numpy as np
+from tensorflow.python.keras import backend as K
+from tensorflow.python.util import tf_inspect
+
+from deepcell.applications.nuclear_segmentation import NuclearSegmentationModel
+from deepcell.applications.label_detection import LabelDetectionModel
+from deepcell.applications.scale_detection import ScaleDetectionModel
+from deepcell.applications.phase_segmentation import PhaseSegmentationModel
+from deepcell.applications.fluorescent_cytoplasm_segmentation import \
+    FluorCytoplasmSegmentationModel
+
+
+def get_model_size(model):
+    """Estimate the memory used by the weights of a model.
+
+    Args:
+        model (tensorflow.keras.Model): model to measure
+
+    Returns:
+        int: number of bytes used by the model weights
+    """
+    return int(sum(K.count_params(w) * np.dtype(K.dtype(w)).itemsize
+                   for w in model.weights))
+
+
+def _get_default_backbone(factory):
+    """Get the default value of the backbone argument of a model factory"""
+    argspec = tf_inspect.getargspec(factory)
+    defaults = argspec.defaults or ()
+    named_defaults = dict(zip(argspec.args[len(argspec.args) - len(defaults):],
+                              defaults))
+    return named_defaults.get('backbone')
+
+
+class ModelRegistry(object):
+    """Build application models once and keep them warm for reuse.
+
+    Building a model and loading its weights can take several seconds.
+    The registry builds each model the first time it is requested, and
+    returns the same model for every following request with the same
+    name, backbone, input_shape and weights.
+    When the total size of the cached weights is larger than ``max_bytes``,
+    the least recently used models are evicted.
+
+    Evicting a model only drops the reference held by the registry.
+    All models are built in the default Keras graph, which keeps their
+    variables until ``K.clear_session`` is called, so ``max_bytes`` limits
+    the models kept warm by the registry rather than the memory used.
+
+    Args:
+        max_bytes (int): maximum total size of the weights of the models
+            referenced by the registry. If None, models are never evicted.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self._factories = {}
+        self._models = collections.OrderedDict()
+        self._sizes = {}
+        self._lock = threading.RLock()
+
+    def register(self, name, factory):
+        """Register a function that builds a model.
+
+        Args:
+            name (str): name used to request the model
+            factory (function): called with ``input_shape``, ``backbone``
+                and ``use_pretrained_weights`` to build the model.
+        """
+        with self._lock:
+            self._factories[name] = factory
+
+    @property
+    def names(self):
+        """list: names of all registered models"""
+        return sorted(self._factories)
+
+    @property
+    def total_bytes(self):
+        """int: total size of the weights of all cached models"""
+        return sum(self._sizes.values())
+
+    def __len__(self):
+        return len(self._models)
+
+    def __contains__(self, key):
+        return key in self._models
+
+    def _get_key(self, name, input_shape, backbone, use_pretrained_weights):
+        if name not in self._factories:
+            raise ValueError('`{}` is not a registered model. Expected one of '
+                             '{}'.format(name, self.names))
+        if backbone is None:
+            backbone = _get_default_backbone(self._factories[name])
+        input_shape = tuple(None if d is None else int(d) for d in input_shape)
+        return (name, backbone, input_shape, bool(use_pretrained_weights))
+
+    def get(self, name, input_shape=(None, None, 1), backbone=None,
+            use_pretrained_weights=True):
+        """Get a model, building it if it is not already cached.
+
+        Args:
+            name (str): name of the registered model
+            input_shape (tuple): a 3-length tuple of the input data shape.
+            backbone (str): name of the backbone to use for the model.
+                If None, the default backbone of the model is used.
+            use_pretrained_weights (bool): whether to load pre-trained weights.
+
+        Returns:
+            tensorflow.keras.Model: the cached model
+
+        Raises:
+            ValueError: name is not a registered model
+        """
+        key = self._get_key(name, input_shape, backbone, use_pretrained_weights)
+
+        with self._lock:
+            if key in self._models:
+                self._models[key] = self._models.pop(key)  # most recently used
+                return self._models[key]
+
+            _, backbone, input_shape, use_pretrained_weights = key
+            kwargs = {
+                'input_shape': input_shape,
+                'use_pretrained_weights': use_pretrained_weights,
+            }
+            if backbone is not None:
+                kwargs['backbone'] = backbone
+
+            model = self._factories[name](**kwargs)
+
+            self._models[key] = model
+            self._sizes[key] = get_model_size(model)
+            self._evict()
+            return model
+
+    def _evict(self):
+        """Evict the least recently used models until the cache fits.
+        The most recently used model is always kept."""
+        if self.max_bytes is None:
+            return
+        while len(self._models) > 1 and self.total_bytes > self.max_bytes:
+            key, _ = self._models.popitem(last=False)
+            del self._sizes[key]
+
+    def evict(self, name=None):
+        """Remove cached models.
+
+        Args:
+            name (str): only remove the models with this name.
+                If None, all cached models are removed.
+        """
+        with self._lock:
+            for key in list(self._models):
+                if name is None or key[0] == name:
+                    del self._models[key]
+                    del self._sizes[key]
+
+    def warm_up(self, specs, sample_shape=(256, 256)):
+        """Build the given models and run a prediction on each of them.
+
+        Calling this when a process starts moves the cost of building the
+        models, loading their weights and creating the prediction function
+        out of the first requests.
+
+        Args:
+            specs (list): names of the models to build, or dicts of the
+                keyword arguments passed to ``get``.
+            sample_shape (tuple): size of the sample image used for any
+                undefined dimensions of the model input.
+
+        Returns:
+            list: the warmed up models, in the order of specs.
+        """
+        models = []
+        for spec in specs:
+            if not isinstance(spec, dict):
+                spec = {'name': spec}
+            model = self.get(**spec)
+
+            input_shape = list(model.input_shape[1:])
+            spatial = [i for i, s in enumerate(input_shape) if s is None]
+            for i, size in zip(spatial, sample_shape):
+                input_shape[i] = size
+
+            model.predict(np.zeros([1] + input_shape, dtype=K.floatx()))
+            models.append(model)
+        return models
+
+
+_REGISTRY = ModelRegistry()
+_REGISTRY.register('NuclearSegmentationModel', NuclearSegmentationModel)
+_REGISTRY.register('PhaseSegmentationModel', PhaseSegmentationModel)
+_REGISTRY.register('FluorCytoplasmSegmentationModel',
+                   FluorCytoplasmSegmentationModel)
+_REGISTRY.register('LabelDetectionModel', LabelDetectionModel)
+_REGISTRY.register('ScaleDetectionModel', ScaleDetectionModel)
+
+
+def get_registry():
+    """Get the process-wide model registry.
+
+    Returns:
+        ModelRegistry: the registry shared by the whole process
+    """
+    return _REGISTRY
+
+
+def get_model(name, input_shape=(None, None, 1), backbone=None,
+              use_pretrained_weights=True):
+    """Get a model from the process-wide registry.
+
+    Args:
+        name (str): name of the application model,
+            e.g. "NuclearSegmentationModel"
+        input_shape (tuple): a 3-length tuple of the input data shape.
+        backbone (str): name of the backbone to use for the model.
+            If None, the default backbone of the model is used.
+        use_pretrained_weights (bool): whether to load pre-trained weights.
+
+    Returns:
+        tensorflow.keras.Model: the cached model
+    """
+    return _REGISTRY.get(name, input_shape=input_shape, backbone=backbone,
+                         use_pretrained_weights=use_pretrained_weights)
+
+
+def warm_up(specs, sample_shape=(256, 256)):
+    """Build and run the given models in the process-wide registry.
+
+    Args:
+        specs (list): names of the models to build, or dicts of the
+            keyword arguments passed to ``get_model``.
+        sample_shape (tuple): size of the sample image used for any
+            undefined dimensions of the model input.
+
+    Returns:
+        list: the warmed up models, in the order of specs.
+    """
+    return _REGISTRY.warm_up(specs, sample_shape=sample_shape)
@@ -0,0 +1,121 @@
+# Copyright 2016-2019 The Van Valen Lab at the California Institute of
+# Technology (Caltech), with support from the Paul Allen Family Foundation,
+# Google, & National Institutes of Health (NIH) under Grant U24CA224309-01.
+# All rights reserved.
+#
+# Licensed under a modified Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.github.com/vanvalenlab/deepcell-tf/LICENSE
+#
+# The Work provided may be used for non-commercial academic purposes only.
+# For any other use of the Work, including commercial use, please contact:
+# vanvalenlab@gmail.com
+#
+# Neither the name of Caltech nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for the application ModelRegistry"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+from tensorflow.python import keras
+from tensorflow.python.platform import test
+
+from deepcell.applications import registry
+
+
+def _build_model(input_shape=(None, None, 1), backbone='small',
+                 use_pretrained_weights=True):
+    filters = {'small': 2, 'large': 64}[backbone]
+    inputs = keras.layers.Input(shape=input_shape)
+    outputs = keras.layers.Conv2D(filters, 3, padding='same')(inputs)
+    return keras.models.Model(inputs=inputs, outputs=outputs)
+
+
+class TestModelRegistry(test.TestCase):
+
+    def test_get(self):
+        with self.cached_session():
+            reg = registry.ModelRegistry()
+            reg.register('test', _build_model)
+            self.assertEqual(reg.names, ['test'])
+
+            model = reg.get('test')
+            self.assertIs(reg.get('test'), model)
+            self.assertEqual(len(reg), 1)
+
+            # each backbone and input_shape is a separate model
+            other = reg.get('test', input_shape=(32, 32, 1), backbone='large')
+            self.assertIsNot(other, model)
+            self.assertEqual(other.input_shape, (None, 32, 32, 1))
+            self.assertEqual(len(reg), 2)
+
+            # equivalent requests share the same model
+            self.assertIs(reg.get('test', input_shape=[None, None, 1],
+                                  backbone='small',
+                                  use_pretrained_weights=1), model)
+            self.assertEqual(len(reg), 2)
+
+            expected_size = (3 * 3 * 1 * 2 + 2) * 4
+            self.assertEqual(registry.get_model_size(model), expected_size)
+
+            reg.evict('test')
+            self.assertEqual(len(reg), 0)
+            self.assertEqual(reg.total_bytes, 0)
+
+            with self.assertRaises(ValueError):
+                reg.get('invalid')
+
+    def test_lru_eviction(self):
+        with self.cached_session():
+            small_size = (3 * 3 * 1 * 2 + 2) * 4
+            reg = registry.ModelRegistry(max_bytes=small_size * 2)
+            reg.register('test', _build_model)
+
+            first = reg.get('test', input_shape=(16, 16, 1))
+            reg.get('test', input_shape=(32, 32, 1))
+            # using the first model makes the second least recently used
+            self.assertIs(reg.get('test', input_shape=(16, 16, 1)), first)
+
+            reg.get('test', input_shape=(64, 64, 1))
+            self.assertEqual(len(reg), 2)
+            self.assertIn(('test', 'small', (16, 16, 1), True), reg)
+            self.assertNotIn(('test', 'small', (32, 32, 1), True), reg)
+
+            # models larger than max_bytes are still cached
+            large = reg.get('test', backbone='large')
+            self.assertEqual(len(reg), 1)
+            self.assertIs(reg.get('test', backbone='large'), large)
+
+    def test_warm_up(self):
+        with self.cached_session():
+            reg = registry.ModelRegistry()
+            reg.register('test', _build_model)
+
+            models = reg.warm_up(['test', {'name': 'test', 'backbone': 'large'}],
+                                 sample_shape=(16, 16))
+            self.assertEqual(len(models), 2)
+            self.assertIs(models[0], reg.get('test'))
+            self.assertIs(models[1], reg.get('test', backbone='large'))
+
+    def test_default_registry(self):
+        reg = registry.get_registry()
+        self.assertIn('NuclearSegmentationModel', reg.names)
+        self.assertIn('LabelDetectionModel', reg.names)
+
+
+if __name__ == '__main__':
+    test.main()
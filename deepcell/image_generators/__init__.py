@@ -33,27 +33,73 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import os
+import shutil
+import tempfile
 import warnings
 
+from multiprocessing import Pool
+from multiprocessing import cpu_count
+
 import numpy as np
 
 from tensorflow.python.keras import backend as K
 from tensorflow.python.keras.utils import to_categorical
 
 from deepcell.utils import transform_utils
+from deepcell.utils.cache_utils import ArrayCache
+from deepcell.utils.cache_utils import get_cache_key
+
+
+# Increment when the output of any transform changes, to invalidate
+# transformed masks that are already cached.
+_TRANSFORM_CACHE_VERSION = 1
+
+_TRANSFORM_CACHE = None
+
 
+def set_transform_cache(cache_dir=None, max_bytes=None):
+    """Cache the transformed masks of the data generators on disk.
 
-def _transform_masks(y, transform, data_format=None, **kwargs):
+    The transformed masks are keyed by a hash of the labels, the transform
+    and its keyword arguments, so repeated runs on the same data reuse the
+    cached masks instead of transforming all the labels again.
+
+    Args:
+        cache_dir (str): directory of the cached masks.
+            If None, transformed masks are not cached.
+        max_bytes (int): maximum total size of the cached masks.
+            If None, cached masks are never evicted.
+
+    Returns:
+        deepcell.utils.cache_utils.ArrayCache: the transform cache,
+            or None if caching is disabled.
+    """
+    global _TRANSFORM_CACHE  # pylint: disable=global-statement
+    if cache_dir is None:
+        _TRANSFORM_CACHE = None
+    else:
+        _TRANSFORM_CACHE = ArrayCache(cache_dir, max_bytes=max_bytes)
+    return _TRANSFORM_CACHE
+
+
+def _transform_masks(y, transform, data_format=None, n_jobs=1, **kwargs):
     """Based on the transform key, apply a transform function to the masks.
 
     Refer to :mod:`deepcell.utils.transform_utils` for more information about
     available transforms. Caution for unknown transform keys.
+    If a transform cache is set with ``set_transform_cache``, the
+    transformed masks are loaded from the cache if possible.
 
     Args:
         y (numpy.array): Labels of ndim 4 or 5
         transform (str): Name of the transform, one of
             {"deepcell", "disc", "watershed", None}
         data_format (str): One of 'channels_first', 'channels_last'.
+        n_jobs (int): number of processes transforming batches of masks
+            for the "pixelwise", "watershed", "watershed-cont" and
+            "centroid" transforms. If -1, all CPUs are used.
+            The output does not depend on n_jobs.
         kwargs (dict): Optional transform keyword arguments.
 
     Returns:
@@ -95,6 +141,118 @@ def _transform_masks(y, transform, data_format=None, **kwargs):
         if transform not in valid_transforms:
             raise ValueError('`{}` is not a valid transform'.format(transform))
 
+    # the per-sample transforms also accept lazy arrays, such as
+    # deepcell.utils.chunk_utils.IndexedArray, the others need all of y
+    if transform in {'disc', 'fgbg', None}:
+        y = np.asarray(y)
+
+    if n_jobs is None:
+        n_jobs = 1
+    elif n_jobs < 0:
+        n_jobs = max(cpu_count() + 1 + n_jobs, 1)
+
+    cache = _TRANSFORM_CACHE
+    if cache is None:
+        return _apply_transform(y, transform, data_format, n_jobs=n_jobs, **kwargs)
+
+    key = get_cache_key(y, transform=transform, data_format=data_format,
+                        version=_TRANSFORM_CACHE_VERSION, kwargs=kwargs)
+    y_transform = cache.get(key)
+    if y_transform is None:
+        y_transform = _apply_transform(y, transform, data_format,
+                                       n_jobs=n_jobs, **kwargs)
+        cache.put(key, y_transform)
+    return y_transform
+
+
+def _transform_batch(y, batch, function, args, kwargs, data_format):
+    """Apply function to the mask of one batch of y"""
+    if data_format == 'channels_first':
+        mask = y[batch, 0, ...]
+    else:
+        mask = y[batch, ..., 0]
+    return function(mask, *args, **kwargs)
+
+
+def _transform_batch_range(task):
+    """Transform a range of batches of the masks in the file y_path,
+    and write them into the shared output array in the file out_path"""
+    y_path, out_path, start, stop, function, args, kwargs, data_format = task
+    y = np.load(y_path, mmap_mode='r')
+    y_transform = np.load(out_path, mmap_mode='r+')
+    for batch in range(start, stop):
+        y_transform[batch] = _transform_batch(
+            y, batch, function, args, kwargs, data_format)
+    y_transform.flush()
+
+
+def _transform_batches(y, y_transform, function, args=(), kwargs=None,
+                       data_format=None, n_jobs=1):
+    """Write ``function(mask, *args, **kwargs)`` of the mask of each batch
+    of y into y_transform.
+
+    If n_jobs is more than 1, the batches are transformed in a pool of
+    processes. The masks are shared with the processes in a memory-mapped
+    file, and each process writes its batches directly into a memory-mapped
+    output array, so no masks are pickled. Every batch is transformed on
+    its own, so the output is the same as transforming serially.
+
+    Args:
+        y (numpy.array): Labels of ndim 4 or 5
+        y_transform (numpy.array): array to write the transformed batches to
+        function (function): transform of a single mask
+        args (tuple): positional arguments of function after the mask
+        kwargs (dict): keyword arguments of function
+        data_format (str): One of 'channels_first', 'channels_last'.
+        n_jobs (int): number of processes transforming batches.
+
+    Returns:
+        numpy.array: y_transform
+    """
+    kwargs = {} if kwargs is None else kwargs
+    num_batches = y_transform.shape[0]
+
+    if min(n_jobs, num_batches) <= 1:
+        for batch in range(num_batches):
+            y_transform[batch] = _transform_batch(
+                y, batch, function, args, kwargs, data_format)
+        return y_transform
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        y_path = os.path.join(temp_dir, 'y.npy')
+        np.save(y_path, np.asarray(y))
+
+        out_path = os.path.join(temp_dir, 'y_transform.npy')
+        out = np.lib.format.open_memmap(out_path, mode='w+',
+                                        dtype=y_transform.dtype,
+                                        shape=y_transform.shape)
+        del out  # flush the empty output array
+
+        # a few ranges of batches for each process to balance the load
+        num_tasks = min(num_batches, 4 * n_jobs)
+        bounds = np.linspace(0, num_batches, num_tasks + 1).astype('int')
+        tasks = [(y_path, out_path, start, stop, function, args, kwargs, data_format)
+                 for start, stop in zip(bounds[:-1], bounds[1:])]
+
+        pool = Pool(n_jobs)
+        try:
+            pool.map(_transform_batch_range, tasks)
+        finally:
+            pool.terminate()
+            pool.join()
+
+        y_transform[:] = np.load(out_path, mmap_mode='r')
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return y_transform
+
+
+def _apply_transform(y, transform, data_format, n_jobs=1, **kwargs):
+    """Apply a validated transform to the masks, see ``_transform_masks``"""
+    channel_axis = 1 if data_format == 'channels_first' else -1
+
     if transform == 'pixelwise':
         dilation_radius = kwargs.pop('dilation_radius', None)
         separate_edge_classes = kwargs.pop('separate_edge_classes', False)
@@ -106,15 +264,12 @@ def _transform_masks(y, transform, data_format=None, **kwargs):
         else:
             y_transform = np.zeros(tuple(list(y.shape[0:-1]) + [edge_class_shape]))
 
-        for batch in range(y_transform.shape[0]):
-            if data_format == 'channels_first':
-                mask = y[batch, 0, ...]
-            else:
-                mask = y[batch, ..., 0]
-
-            y_transform[batch] = transform_utils.pixelwise_transform(
-                mask, dilation_radius, data_format=data_format,
-                separate_edge_classes=separate_edge_classes)
+        _transform_batches(
+            y, y_transform, transform_utils.pixelwise_transform,
+            args=(dilation_radius,),
+            kwargs={'data_format': data_format,
+                    'separate_edge_classes': separate_edge_classes},
+            data_format=data_format, n_jobs=n_jobs)
 
     elif transform == 'watershed':
         distance_bins = kwargs.pop('distance_bins', 4)
@@ -130,14 +285,10 @@ def _transform_masks(y, transform, data_format=None, **kwargs):
         else:
             _distance_transform = transform_utils.distance_transform_2d
 
-        for batch in range(y_transform.shape[0]):
-            if data_format == 'channels_first':
-                mask = y[batch, 0, ...]
-            else:
-                mask = y[batch, ..., 0]
-
-            y_transform[batch] = _distance_transform(
-                mask, distance_bins, erosion)
+        _transform_batches(
+            y, y_transform, _distance_transform,
+            args=(distance_bins, erosion),
+            data_format=data_format, n_jobs=n_jobs)
 
         # convert to one hot notation
         y_transform = np.expand_dims(y_transform, axis=-1)
@@ -158,13 +309,9 @@ def _transform_masks(y, transform, data_format=None, **kwargs):
         else:
             _distance_transform = transform_utils.distance_transform_continuous_2d
 
-        for batch in range(y_transform.shape[0]):
-            if data_format == 'channels_first':
-                mask = y[batch, 0, ...]
-            else:
-                mask = y[batch, ..., 0]
-
-            y_transform[batch] = _distance_transform(mask, erosion)
+        _transform_batches(
+            y, y_transform, _distance_transform, args=(erosion,),
+            data_format=data_format, n_jobs=n_jobs)
 
         y_transform = np.expand_dims(y_transform, axis=-1)
 
@@ -184,13 +331,9 @@ def _transform_masks(y, transform, data_format=None, **kwargs):
         else:
             _transform = transform_utils.centroid_transform_continuous_2d
 
-        for batch in range(y_transform.shape[0]):
-            if data_format == 'channels_first':
-                mask = y[batch, 0, ...]
-            else:
-                mask = y[batch, ..., 0]
-
-            y_transform[batch] = _transform(mask, erosion)
+        _transform_batches(
+            y, y_transform, _transform, args=(erosion,),
+            data_format=data_format, n_jobs=n_jobs)
 
         y_transform = np.expand_dims(y_transform, axis=-1)
 
@@ -266,4 +409,5 @@ __all__ = [
     'ScaleDataGenerator',
     'SiameseDataGenerator',
     'SiameseIterator',
+    'set_transform_cache',
 ]
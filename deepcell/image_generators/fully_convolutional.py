@@ -53,6 +53,7 @@ except ImportError:
     scipy = None
 
 from deepcell.image_generators import _transform_masks
+from deepcell.utils.chunk_utils import IndexedArray
 
 
 class ImageFullyConvIterator(Iterator):
@@ -95,7 +96,11 @@ class ImageFullyConvIterator(Iterator):
             raise ValueError('Training batches and labels should have the same'
                              'length. Found X.shape: {} y.shape: {}'.format(
                                  X.shape, y.shape))
-        self.x = np.asarray(X, dtype=K.floatx())
+        # lazy arrays are read one batch at a time
+        if isinstance(X, IndexedArray):
+            self.x = X
+        else:
+            self.x = np.asarray(X, dtype=K.floatx())
 
         if self.x.ndim != 4:
             raise ValueError('Input data in `ImageFullyConvIterator` '
@@ -629,7 +634,11 @@ class MovieArrayIterator(Iterator):
 
         self.channel_axis = 4 if data_format == 'channels_last' else 1
         self.time_axis = 1 if data_format == 'channels_last' else 2
-        self.x = np.asarray(X, dtype=K.floatx())
+        # lazy arrays are read one batch at a time
+        if isinstance(X, IndexedArray):
+            self.x = X
+        else:
+            self.x = np.asarray(X, dtype=K.floatx())
         self.y = _transform_masks(y, transform, data_format=data_format, **transform_kwargs)
 
         if self.x.ndim != 5:
@@ -29,6 +29,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import os
+
 import numpy as np
 import skimage as sk
 
@@ -237,6 +239,72 @@ class TestTransformMasks(test.TestCase):
             mask = np.random.randint(3, size=(5, 10, 30, 30, 10, 1))
             image_generators._transform_masks(mask, transform=None)
 
+    def test_transform_masks_n_jobs(self):
+        for data_format in ('channels_last', 'channels_first'):
+            channel_axis = 1 if data_format == 'channels_first' else -1
+            mask = np.zeros((6, 30, 30, 1), dtype='int32')
+            for b in range(mask.shape[0]):
+                mask[b, ..., 0] = sk.measure.label(np.random.randint(2, size=(30, 30)))
+            mask = np.moveaxis(mask, -1, channel_axis)
+
+            for transform in ('pixelwise', 'watershed', 'watershed-cont', 'centroid'):
+                serial = image_generators._transform_masks(
+                    mask, transform=transform, data_format=data_format)
+                parallel = image_generators._transform_masks(
+                    mask, transform=transform, data_format=data_format,
+                    n_jobs=2)
+                self.assertEqual(parallel.dtype, serial.dtype)
+                self.assertAllEqual(parallel, serial)
+
+            # 3D masks
+            movie = np.stack([mask] * 3, axis=2 if data_format == 'channels_first' else 1)
+            serial = image_generators._transform_masks(
+                movie, transform='watershed', data_format=data_format)
+            parallel = image_generators._transform_masks(
+                movie, transform='watershed', data_format=data_format,
+                n_jobs=-1)
+            self.assertAllEqual(parallel, serial)
+
+    def test_transform_cache(self):
+        cache_dir = os.path.join(self.get_temp_dir(), 'transform_cache')
+        cache = image_generators.set_transform_cache(cache_dir)
+        self.addCleanup(image_generators.set_transform_cache, None)
+
+        mask = np.random.randint(3, size=(5, 30, 30, 1))
+        expected = image_generators._apply_transform(
+            mask, 'watershed', 'channels_last', distance_bins=3)
+
+        mask_transform = image_generators._transform_masks(
+            mask, transform='watershed', data_format='channels_last',
+            distance_bins=3)
+        self.assertAllEqual(mask_transform, expected)
+        self.assertEqual(len(cache), 1)
+
+        # the cached masks are loaded instead of transformed again
+        cached = image_generators._transform_masks(
+            mask, transform='watershed', data_format='channels_last',
+            distance_bins=3)
+        self.assertIsInstance(cached, np.memmap)
+        self.assertAllEqual(cached, expected)
+        self.assertEqual(len(cache), 1)
+
+        # other kwargs, transforms and masks are cached separately
+        image_generators._transform_masks(
+            mask, transform='watershed', data_format='channels_last',
+            distance_bins=4)
+        image_generators._transform_masks(
+            mask, transform='fgbg', data_format='channels_last')
+        image_generators._transform_masks(
+            mask + 1, transform='fgbg', data_format='channels_last')
+        self.assertEqual(len(cache), 4)
+
+        # no caching
+        image_generators.set_transform_cache(None)
+        mask_transform = image_generators._transform_masks(
+            mask, transform='watershed', data_format='channels_last',
+            distance_bins=3)
+        self.assertNotIsInstance(mask_transform, np.memmap)
+
 
 class TestSampleDataGenerator(test.TestCase):
 
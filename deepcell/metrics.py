@@ -57,12 +57,12 @@ from scipy.optimize import linear_sum_assignment
 
 import skimage.io
 from skimage.measure import regionprops
-from skimage.segmentation import relabel_sequential
 from skimage.external.tifffile import TiffFile
 from sklearn.metrics import confusion_matrix
 from tensorflow.python.platform import tf_logging as logging
 
 from deepcell.utils.compute_overlap import compute_overlap
+from deepcell.utils.misc_utils import relabel_sequential
 
 
 def stats_pixelbased(y_true, y_pred):
@@ -175,8 +175,8 @@ class ObjectAccuracy(object):  # pylint: disable=useless-object-inheritance
                                  y_pred.shape, y_true.shape))
 
         # Relabel y_true and y_pred so the labels are consecutive
-        y_true, _, _ = relabel_sequential(y_true)
-        y_pred, _, _ = relabel_sequential(y_pred)
+        y_true = relabel_sequential(y_true)
+        y_pred = relabel_sequential(y_pred)
 
         self.y_true = y_true
         self.y_pred = y_pred
@@ -29,11 +29,29 @@ from __future__ import absolute_import
 from __future__ import print_function
 from __future__ import division
 
+import threading
+import timeit
+
+from multiprocessing.pool import ThreadPool
+
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+
+try:
+    string_types = (str, unicode)  # python 2, pylint: disable=undefined-variable
+except NameError:
+    string_types = (str,)
+
 import numpy as np
 from tensorflow.python.keras import backend as K
 from tensorflow.python.keras.models import Model
+from tensorflow.python.keras.utils import conv_utils
 
 from deepcell.utils.data_utils import trim_padding
+from deepcell.utils.io_utils import get_image_memmap
+from deepcell.utils.transform_utils import get_dihedral_transforms
 
 
 def get_cropped_input_shape(images,
@@ -99,7 +117,158 @@ def get_padding_layers(model):
     return padding_layers
 
 
-def process_whole_image(model, images, num_crops=4, receptive_field=61, padding=None):
+def _cast_output(values, dtype):
+    """Cast model outputs to the output dtype.
+
+    Floating point outputs are cast directly. Integer outputs are treated as
+    quantized probabilities, so values in [0, 1] are scaled to the full range
+    of the integer type (e.g. [0, 255] for uint8).
+
+    Args:
+        values (numpy.array): model outputs
+        dtype (str): dtype of the output array
+
+    Returns:
+        numpy.array: values cast to dtype
+    """
+    dtype = np.dtype(dtype)
+    if np.issubdtype(dtype, np.integer):
+        max_value = np.iinfo(dtype).max
+        values = np.clip(np.rint(values * max_value), 0, max_value)
+    return values.astype(dtype, copy=False)
+
+
+def predict_tta(model, images, batch_size=None, data_format=None,
+                output_index=-1):
+    """Predict with test-time augmentation using the dihedral group.
+
+    The 8 rotations and flips of the images are stacked into a single batch
+    and predicted in one call. Each prediction is transformed back to the
+    original orientation and the results are averaged.
+    If the images are not square, only the 4 transforms that keep the
+    image shape are used.
+
+    Args:
+        model (tensorflow.keras.Model): fully convolutional model
+        images (numpy.array): batch of 2D or 3D images
+        batch_size (int): batch size passed to ``model.predict``.
+            If None, all transformed images are predicted as one batch.
+        data_format (str): "channels_first" or "channels_last"
+        output_index (int): index of the model output to average,
+            if the model has multiple outputs.
+
+    Returns:
+        numpy.array: the averaged prediction
+    """
+    if data_format is None:
+        data_format = K.image_data_format()
+
+    # the rotations are applied to the last two axes
+    channel_axis = 1 if data_format == 'channels_first' else images.ndim - 1
+    images = np.moveaxis(images, channel_axis, 1)
+
+    transforms = get_dihedral_transforms(
+        square=images.shape[-1] == images.shape[-2])
+
+    batch = np.concatenate([t(images) for t, _ in transforms], axis=0)
+    batch = np.moveaxis(batch, 1, channel_axis)
+
+    predicted = model.predict(batch, batch_size=batch_size or len(batch))
+    if isinstance(predicted, list):
+        predicted = predicted[output_index]
+
+    predicted = np.moveaxis(predicted, channel_axis, 1)
+    predicted = np.split(predicted, len(transforms), axis=0)
+
+    output = np.zeros(predicted[0].shape, dtype=predicted[0].dtype)
+    for (_, inverse), p in zip(transforms, predicted):
+        output += inverse(p)
+    output /= len(transforms)
+
+    return np.moveaxis(output, 1, channel_axis)
+
+
+def _predict_tile_batch(model, keys, tiles, batch_size=None, tta=False,
+                        data_format=None, output_index=-1):
+    """Run a single predict call on a list of tiles and split the results.
+
+    Args:
+        model (tensorflow.keras.Model): model that will process the tiles
+        keys (list): key used to identify each tile
+        tiles (list): tiles of the same shape, each with its own batch axis
+        batch_size (int): batch size passed to ``model.predict``
+        tta (bool): whether to use test-time augmentation
+        data_format (str): "channels_first" or "channels_last"
+        output_index (int): index of the model output to return,
+            if the model has multiple outputs.
+
+    Returns:
+        list: (key, prediction) for each tile
+    """
+    batch = tiles[0] if len(tiles) == 1 else np.concatenate(tiles, axis=0)
+    if tta:
+        predicted = predict_tta(model, batch, batch_size=batch_size,
+                                data_format=data_format,
+                                output_index=output_index)
+    else:
+        predicted = model.predict(batch, batch_size=batch_size)
+
+    # if using skip_connections, the final model output is used by default
+    if isinstance(predicted, list):
+        predicted = predicted[output_index]
+
+    sections = np.cumsum([len(t) for t in tiles])[:-1]
+    return list(zip(keys, np.split(predicted, sections, axis=0)))
+
+
+def predict_tiles(model, tiles, tiles_per_batch=1, batch_size=None, tta=False,
+                  data_format=None, output_index=-1):
+    """Gather tiles into batches and predict each batch with a single call.
+
+    Only ``tiles_per_batch`` tiles are held in memory at once,
+    so the peak memory is bounded regardless of the number of tiles.
+
+    Args:
+        model (tensorflow.keras.Model): model that will process the tiles
+        tiles (iterable): (key, tile) pairs, all tiles must be the same shape
+        tiles_per_batch (int): maximum number of tiles in each predict call
+        batch_size (int): batch size passed to ``model.predict``
+        tta (bool): whether to use test-time augmentation
+        data_format (str): "channels_first" or "channels_last"
+        output_index (int): index of the model output to return,
+            if the model has multiple outputs.
+
+    Returns:
+        generator: yields (key, prediction) for each tile, in order
+
+    Raises:
+        ValueError: tiles_per_batch is less than 1
+    """
+    if tiles_per_batch < 1:
+        raise ValueError('Expected `tiles_per_batch` to be at least 1. '
+                         'Got {}.'.format(tiles_per_batch))
+
+    keys, batch = [], []
+    for key, tile in tiles:
+        keys.append(key)
+        batch.append(tile)
+        if len(batch) >= tiles_per_batch:
+            for result in _predict_tile_batch(model, keys, batch,
+                                              batch_size, tta, data_format,
+                                              output_index):
+                yield result
+            keys, batch = [], []
+
+    if batch:
+        for result in _predict_tile_batch(model, keys, batch,
+                                          batch_size, tta, data_format,
+                                          output_index):
+            yield result
+
+
+def process_whole_image(model, images, num_crops=4, receptive_field=61,
+                        padding=None, tiles_per_batch=1, batch_size=None,
+                        output_dtype=None, output=None, tta=False):
     """Slice images into num_crops * num_crops pieces, and use the model to
     process each small image.
 
@@ -112,6 +281,16 @@ def process_whole_image(model, images, num_crops=4, receptive_field=61, padding=
             required to pad images
         padding (str): type of padding for input images,
             one of {'reflect', 'zero'}.
+        tiles_per_batch (int): number of sub-images gathered into
+            each predict call.
+        batch_size (int): batch size passed to ``model.predict``
+        output_dtype (str): dtype of the output, defaults to K.floatx().
+            Integer types such as "uint8" store quantized probabilities.
+        output (numpy.array): optional preallocated array that the
+            model outputs are written into. Its dtype is used
+            instead of output_dtype.
+        tta (bool): whether to average the predictions of the rotated
+            and flipped sub-images, see ``predict_tta``.
 
     Returns:
         numpy.array: model outputs for each sub-image
@@ -119,6 +298,7 @@ def process_whole_image(model, images, num_crops=4, receptive_field=61, padding=
     Raises:
         ValueError: invalid padding value
         ValueError: model input shape is different than expected_input_shape
+        ValueError: output is not the expected shape
     """
     if K.image_data_format() == 'channels_first':
         channel_axis = 1
@@ -148,11 +328,17 @@ def process_whole_image(model, images, num_crops=4, receptive_field=61, padding=
     # instantiate matrix for model output
     model_output_shape = tuple(list(model.layers[-1].output_shape)[1:])
     if channel_axis == 1:
-        output = np.zeros(tuple([images.shape[0], model_output_shape[0]] +
-                                list(images.shape[2:])))
+        output_shape = tuple([images.shape[0], model_output_shape[0]] +
+                             list(images.shape[2:]))
     else:
-        output = np.zeros(tuple(list(images.shape[0:-1]) +
-                                [model_output_shape[-1]]))
+        output_shape = tuple(list(images.shape[0:-1]) +
+                             [model_output_shape[-1]])
+
+    if output is None:
+        output = np.zeros(output_shape, dtype=output_dtype or K.floatx())
+    elif output.shape != output_shape:
+        raise ValueError('Expected `output` to have shape {}. Got {}.'.format(
+            output_shape, output.shape))
 
     expected_input_shape = get_cropped_input_shape(
         images, num_crops, receptive_field)
@@ -178,43 +364,641 @@ def process_whole_image(model, images, num_crops=4, receptive_field=61, padding=
     else:
         padded_images = np.pad(images, pad_width, mode='constant', constant_values=0)
 
-    for i in range(num_crops):
-        for j in range(num_crops):
-            e, f = i * crop_x, (i + 1) * crop_x + 2 * win_x
-            g, h = j * crop_y, (j + 1) * crop_y + 2 * win_y
+    def _get_crop_slices(i, j, win_x, win_y):
+        slices = [slice(None)] * images.ndim
+        slices[row_axis] = slice(i * crop_x, (i + 1) * crop_x + 2 * win_x)
+        slices[col_axis] = slice(j * crop_y, (j + 1) * crop_y + 2 * win_y)
+        return tuple(slices)
 
-            if images.ndim == 5:
-                if channel_axis == 1:
-                    predicted = model.predict(padded_images[:, :, :, e:f, g:h])
-                else:
-                    predicted = model.predict(padded_images[:, :, e:f, g:h, :])
+    crops = (((i, j), padded_images[_get_crop_slices(i, j, win_x, win_y)])
+             for i in range(num_crops) for j in range(num_crops))
+
+    predictions = predict_tiles(model, crops,
+                                tiles_per_batch=tiles_per_batch,
+                                batch_size=batch_size,
+                                tta=tta)
+
+    for (i, j), predicted in predictions:
+        # if the model uses padding, trim the output images to proper shape
+        # if model does not use padding, images should already be correct
+        if padding:
+            predicted = trim_padding(predicted, win_x, win_y)
+
+        output[_get_crop_slices(i, j, 0, 0)] = _cast_output(
+            predicted, output.dtype)
+
+    return output
+
+
+def get_tile_starts(image_size, tile_size, overlap=0):
+    """Get the start index of each tile along a single image axis.
+
+    Tiles are placed every ``tile_size - overlap`` pixels, and the final
+    tile is shifted back to end exactly on the image border, so any
+    ``image_size`` is covered without padding the image.
+    If the image is smaller than a single tile, only one tile is used.
+
+    Args:
+        image_size (int): size of the image along the axis
+        tile_size (int): size of each tile along the axis
+        overlap (int): minimum number of pixels shared by adjacent tiles
+
+    Returns:
+        list: start index of each tile
+
+    Raises:
+        ValueError: overlap is not smaller than tile_size
+    """
+    if not 0 <= overlap < tile_size:
+        raise ValueError('Expected `overlap` to be non-negative and smaller '
+                         'than `tile_size` ({}). Got {}.'.format(
+                             tile_size, overlap))
+
+    if image_size <= tile_size:
+        return [0]
+
+    stride = tile_size - overlap
+    starts = list(range(0, image_size - tile_size, stride))
+    starts.append(image_size - tile_size)
+    return starts
+
+
+def _get_blending_ramp(size, width):
+    """Get a 1D ramp that is 1 in the center and decreases over width pixels
+    at each border, without reaching 0."""
+    dist = np.minimum(np.arange(1, size + 1), np.arange(size, 0, -1))
+    return np.clip(dist / float(width + 1), 0, 1).astype('float32')
+
+
+def _get_blending_norm(image_size, starts, tile_size, width):
+    """Get the sum of the 1D ramps of all tiles at each pixel of an axis"""
+    ramp = _get_blending_ramp(tile_size, width)
+    norm = np.zeros((max(image_size, tile_size),), dtype='float32')
+    for start in starts:
+        norm[start:start + tile_size] += ramp
+    return norm[:image_size]
+
+
+def get_blending_window(tile_shape, overlap):
+    """Get a 2D weighting window used to blend overlapping tile predictions.
+
+    The window is 1 in the center of the tile and decreases linearly
+    over the ``overlap`` pixels at each border. The weights are strictly
+    positive, so pixels covered by only a single tile are still valid.
+
+    Args:
+        tile_shape (tuple): (rows, cols) of each tile
+        overlap (tuple): (rows, cols) overlap between adjacent tiles
+
+    Returns:
+        numpy.array: window of shape ``tile_shape``
+    """
+    return np.outer(_get_blending_ramp(tile_shape[0], overlap[0]),
+                    _get_blending_ramp(tile_shape[1], overlap[1]))
+
+
+def _get_image_axes(ndim, data_format):
+    """Get the channel, row and column axes of an image batch"""
+    if data_format == 'channels_first':
+        return 1, ndim - 2, ndim - 1
+    return ndim - 1, ndim - 3, ndim - 2
+
+
+class StageCounter(object):
+    """Thread-safe counter of the items processed by a pipeline stage
+    and the time spent processing them.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.
+        self._lock = threading.Lock()
+
+    def add(self, count, seconds):
+        with self._lock:
+            self.count += count
+            self.seconds += seconds
+
+    @property
+    def throughput(self):
+        """float: items processed per second of work in this stage"""
+        return self.count / self.seconds if self.seconds else 0.
+
+    def __repr__(self):
+        return '{}(count={}, seconds={:.3f}, throughput={:.2f}/s)'.format(
+            type(self).__name__, self.count, self.seconds, self.throughput)
+
+
+class InferencePipeline(object):
+    """Overlap tile loading, prediction and reassembly of model outputs.
+
+    Tiles are loaded by a pool of worker threads while the model runs,
+    and predictions are written back by a background thread, so the model
+    does not wait on numpy slicing and copying. Each stage is connected by
+    a bounded queue, so at most ``queue_size`` tiles are held between
+    stages. The model is always run in the calling thread, as Keras models
+    are bound to the graph of the thread that created them.
+
+    The time spent in each stage is recorded in ``stats``, which can be
+    used to find the bottleneck of the pipeline.
+
+    Args:
+        num_workers (int): number of threads loading tiles. If 0, every
+            stage is run serially in the calling thread.
+        queue_size (int): maximum number of tiles waiting between stages.
+    """
+
+    def __init__(self, num_workers=2, queue_size=16):
+        if queue_size < 1:
+            raise ValueError('Expected `queue_size` to be at least 1. '
+                             'Got {}.'.format(queue_size))
+        self.num_workers = int(num_workers)
+        self.queue_size = int(queue_size)
+        self.stats = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {
+            'load': StageCounter(),
+            'predict': StageCounter(),
+            'reassemble': StageCounter(),
+        }
+
+    def _load(self, load_tile, key):
+        start = timeit.default_timer()
+        tile = load_tile(key)
+        self.stats['load'].add(1, timeit.default_timer() - start)
+        return key, tile
+
+    def _predict(self, model, keys, tiles, batch_size, tta=False,
+                 data_format=None, output_index=-1):
+        start = timeit.default_timer()
+        results = _predict_tile_batch(model, keys, tiles, batch_size, tta,
+                                      data_format, output_index)
+        self.stats['predict'].add(len(tiles), timeit.default_timer() - start)
+        return results
+
+    def _reassemble(self, write_tile, key, predicted):
+        start = timeit.default_timer()
+        write_tile(key, predicted)
+        self.stats['reassemble'].add(1, timeit.default_timer() - start)
+
+    def _run_serial(self, model, keys, load_tile, write_tile,
+                    tiles_per_batch, batch_size, tta, data_format,
+                    output_index):
+        batch_keys, batch = [], []
+        for key in keys:
+            key, tile = self._load(load_tile, key)
+            batch_keys.append(key)
+            batch.append(tile)
+            if len(batch) >= tiles_per_batch:
+                for result in self._predict(model, batch_keys, batch, batch_size,
+                                            tta, data_format, output_index):
+                    self._reassemble(write_tile, *result)
+                batch_keys, batch = [], []
+
+        if batch:
+            for result in self._predict(model, batch_keys, batch, batch_size,
+                                        tta, data_format, output_index):
+                self._reassemble(write_tile, *result)
+
+    def run(self, model, keys, load_tile, write_tile,
+            tiles_per_batch=1, batch_size=None, tta=False, data_format=None,
+            output_index=-1):
+        """Load, predict and write back every tile.
+
+        Args:
+            model (tensorflow.keras.Model): model that will process the tiles
+            keys (iterable): key of each tile to process
+            load_tile (function): returns the tile for a given key.
+                Called concurrently from the worker threads.
+            write_tile (function): called with each key and its prediction.
+                Called from a single thread, in the order of ``keys``.
+            tiles_per_batch (int): maximum number of tiles in each
+                predict call
+            batch_size (int): batch size passed to ``model.predict``
+            tta (bool): whether to use test-time augmentation
+            data_format (str): "channels_first" or "channels_last"
+            output_index (int): index of the model output to write back,
+                if the model has multiple outputs.
+
+        Raises:
+            ValueError: tiles_per_batch is less than 1
+        """
+        if tiles_per_batch < 1:
+            raise ValueError('Expected `tiles_per_batch` to be at least 1. '
+                             'Got {}.'.format(tiles_per_batch))
+
+        if self.num_workers <= 0:
+            return self._run_serial(model, keys, load_tile, write_tile,
+                                    tiles_per_batch, batch_size, tta,
+                                    data_format, output_index)
+
+        # bound the number of loaded tiles waiting to be predicted
+        in_flight = threading.Semaphore(self.queue_size + tiles_per_batch)
+        stopped = threading.Event()
+
+        def _bounded_keys():
+            for key in keys:
+                in_flight.acquire()
+                if stopped.is_set():
+                    return
+                yield key
+
+        results = queue.Queue(maxsize=self.queue_size)
+        errors = []
+
+        def _write_results():
+            while True:
+                item = results.get()
+                if item is None:
+                    return
+                if errors:
+                    continue  # drain the queue so the producer never blocks
+                try:
+                    self._reassemble(write_tile, *item)
+                except Exception as err:  # pylint: disable=broad-except
+                    errors.append(err)
+
+        writer = threading.Thread(target=_write_results)
+        writer.daemon = True
+        writer.start()
+
+        pool = ThreadPool(self.num_workers)
+        try:
+            loaded = pool.imap(lambda k: self._load(load_tile, k),
+                               _bounded_keys())
+
+            batch_keys, batch = [], []
+            for key, tile in loaded:
+                batch_keys.append(key)
+                batch.append(tile)
+                if len(batch) >= tiles_per_batch:
+                    for result in self._predict(model, batch_keys, batch, batch_size,
+                                                tta, data_format, output_index):
+                        results.put(result)
+                    for _ in batch:
+                        in_flight.release()
+                    batch_keys, batch = [], []
+
+                if errors:
+                    break
+
+            if batch and not errors:
+                for result in self._predict(model, batch_keys, batch, batch_size,
+                                            tta, data_format, output_index):
+                    results.put(result)
+        finally:
+            # unblock the key generator so the pool can shut down
+            stopped.set()
+            for _ in range(self.queue_size + tiles_per_batch):
+                in_flight.release()
+            pool.terminate()
+            pool.join()
+            results.put(None)
+            writer.join()
+
+        if errors:
+            raise errors[0]
+
+
+def process_tiled_image(model, images, tile_size=512, overlap=64,
+                        padding='reflect', data_format=None,
+                        tiles_per_batch=1, batch_size=None,
+                        output_file=None, preprocess=None, pipeline=None,
+                        output_dtype=None, output=None, tta=False,
+                        output_index=-1):
+    """Use the model to process images of any size as overlapping tiles.
+
+    Each tile has the same shape, so a fully convolutional model
+    (e.g. ``input_shape=(None, None, 1)``) is only ever run on a single
+    input shape, regardless of the size of ``images``.
+    The predictions of overlapping tiles are blended together with the
+    window from ``get_blending_window`` to remove seams.
+
+    Tiles are read and padded one at a time, so ``images`` can be a
+    memory-mapped array or a path to a .npy or .tif file. Together with
+    ``output_file``, the memory used is set by the tile size rather than
+    the size of the images.
+
+    Args:
+        model (tensorflow.keras.Model): model that will process each tile
+        images (numpy.array or str): numpy array of images of any size,
+            or the path to a .npy or .tif file that will be memory-mapped.
+            Files with a single 2D image are expanded to a batch of one
+            image with a single channel.
+        tile_size (int or tuple): size of the (rows, cols) of each tile
+        overlap (int or tuple): number of (rows, cols) pixels shared by
+            adjacent tiles
+        padding (str): type of padding used when the images are smaller
+            than a tile, one of {'reflect', 'zero'}.
+        data_format (str): "channels_first" or "channels_last"
+        tiles_per_batch (int): number of tiles gathered into each
+            predict call. Bounds the number of tiles held in memory.
+        batch_size (int): batch size passed to ``model.predict``
+        output_file (str): if provided, the output is written to a
+            memory-mapped .npy file at this path instead of memory.
+            Can not be used with ``output``.
+        preprocess (function): optional function applied to each tile
+            before prediction, such as a normalization.
+        pipeline (InferencePipeline): runs the loading, prediction and
+            reassembly of the tiles concurrently. If not provided, every
+            tile is processed serially.
+        output_dtype (str): dtype of the output, defaults to K.floatx().
+            Integer types such as "uint8" store the probabilities
+            quantized to [0, 255].
+        output (numpy.array): optional preallocated array that the
+            blended outputs are written into. Its dtype is used
+            instead of output_dtype.
+        tta (bool): whether to average the predictions of the rotated
+            and flipped tiles, see ``predict_tta``.
+        output_index (int): index of the model output to blend,
+            if the model has multiple outputs.
+
+    Returns:
+        numpy.array: blended model output for the full images
+
+    Raises:
+        ValueError: invalid padding value
+        ValueError: overlap is not smaller than tile_size
+        ValueError: output is not the expected shape
+        ValueError: both output and output_file are given
+    """
+    if data_format is None:
+        data_format = K.image_data_format()
+
+    if str(padding).lower() not in {'reflect', 'zero'}:
+        raise ValueError('Expected `padding` to be either `zero` or '
+                         '`reflect`.  Got ', padding)
+
+    if output is not None and output_file is not None:
+        raise ValueError('Expected only one of `output` and `output_file`.')
+
+    if isinstance(images, string_types):
+        images = get_image_memmap(images)
+        if images.ndim == 2:
+            images = images[np.newaxis, ..., np.newaxis]
+
+    tile_size = conv_utils.normalize_tuple(tile_size, 2, 'tile_size')
+    overlap = conv_utils.normalize_tuple(overlap, 2, 'overlap')
+
+    channel_axis, row_axis, col_axis = _get_image_axes(images.ndim, data_format)
+    image_x, image_y = images.shape[row_axis], images.shape[col_axis]
+
+    starts_x = get_tile_starts(image_x, tile_size[0], overlap[0])
+    starts_y = get_tile_starts(image_y, tile_size[1], overlap[1])
+
+    # The window is separable and the tiles lie on a grid, so the sum of
+    # the windows at each pixel is the outer product of the 1D sums.
+    norm_x = _get_blending_norm(image_x, starts_x, tile_size[0], overlap[0])
+    norm_y = _get_blending_norm(image_y, starts_y, tile_size[1], overlap[1])
+
+    # broadcast the window over all non-spatial axes
+    window_shape = [1] * images.ndim
+    window_shape[row_axis], window_shape[col_axis] = tile_size
+    window = get_blending_window(tile_size, overlap).reshape(window_shape)
+
+    def _get_tile_slices(x, y):
+        slices = [slice(None)] * images.ndim
+        slices[row_axis] = slice(x, x + tile_size[0])
+        slices[col_axis] = slice(y, y + tile_size[1])
+        return tuple(slices)
+
+    def _load_tile(key):
+        x, y = key
+        tile = np.asarray(images[_get_tile_slices(x, y)])
+
+        # images smaller than a tile are padded up to the tile size
+        pad_width = [(0, 0)] * images.ndim
+        pad_width[row_axis] = (0, tile_size[0] - tile.shape[row_axis])
+        pad_width[col_axis] = (0, tile_size[1] - tile.shape[col_axis])
+        if any(p[1] for p in pad_width):
+            if str(padding).lower() == 'reflect':
+                tile = np.pad(tile, pad_width, mode='reflect')
             else:
-                if channel_axis == 1:
-                    predicted = model.predict(padded_images[:, :, e:f, g:h])
+                tile = np.pad(tile, pad_width, mode='constant')
+
+        if preprocess is not None:
+            tile = preprocess(tile)
+        return tile
+
+    # crop any padding back out of each tile
+    valid = [slice(None)] * images.ndim
+    valid[row_axis] = slice(0, min(tile_size[0], image_x))
+    valid[col_axis] = slice(0, min(tile_size[1], image_y))
+    valid = tuple(valid)
+
+    if output is not None:
+        output_dtype = output.dtype
+    elif output_dtype is None:
+        output_dtype = K.floatx()
+
+    # Float32 outputs are blended in place. Otherwise, the tiles are blended
+    # in a float32 band of rows, and each row is cast and written to the
+    # output once every tile overlapping it has been added.
+    use_band = np.dtype(output_dtype) != np.dtype('float32')
+
+    # the output is created once the number of output channels is known
+    state = {'output': output, 'band': None, 'band_start': 0, 'ready': False}
+
+    def _get_row_slices(start, stop):
+        slices = [slice(None)] * images.ndim
+        slices[row_axis] = slice(start, stop)
+        return tuple(slices)
+
+    def _init_output(x, predicted):
+        output_shape = list(images.shape)
+        output_shape[channel_axis] = predicted.shape[channel_axis]
+        output_shape = tuple(output_shape)
+
+        if state['output'] is None:
+            if output_file is not None:
+                state['output'] = np.lib.format.open_memmap(
+                    output_file, mode='w+', dtype=output_dtype,
+                    shape=output_shape)
+            else:
+                state['output'] = np.zeros(output_shape, dtype=output_dtype)
+        elif state['output'].shape != output_shape:
+            raise ValueError('Expected `output` to have shape {}. Got {}.'.format(
+                output_shape, state['output'].shape))
+        elif not use_band:
+            state['output'].fill(0)  # blended in place
+
+        if use_band:
+            band_shape = list(output_shape)
+            band_shape[row_axis] = min(tile_size[0], image_x)
+            state['band'] = np.zeros(band_shape, dtype='float32')
+            state['band_start'] = x
+
+        state['ready'] = True
+
+    def _flush_band(stop):
+        band, start = state['band'], state['band_start']
+        rows = stop - start
+        state['output'][_get_row_slices(start, stop)] = _cast_output(
+            band[_get_row_slices(0, rows)], output_dtype)
+
+        # shift the rows still being blended to the top of the band
+        band[_get_row_slices(0, band.shape[row_axis] - rows)] = \
+            band[_get_row_slices(rows, None)]
+        band[_get_row_slices(band.shape[row_axis] - rows, None)] = 0
+        state['band_start'] = stop
+
+    def _write_tile(key, predicted):
+        x, y = key
+        if not state['ready']:
+            _init_output(x, predicted)
+
+        slices = _get_tile_slices(x, y)
+
+        weights = window[valid] / np.outer(
+            norm_x[slices[row_axis]],
+            norm_y[slices[col_axis]]).reshape(window[valid].shape)
+
+        if not use_band:
+            state['output'][slices] += predicted[valid] * weights
+            return
+
+        if x != state['band_start']:
+            _flush_band(x)
+
+        band_slices = list(slices)
+        band_slices[row_axis] = slice(0, valid[row_axis].stop)
+        state['band'][tuple(band_slices)] += predicted[valid] * weights
+
+    if pipeline is None:
+        pipeline = InferencePipeline(num_workers=0)
+
+    pipeline.run(model, [(x, y) for x in starts_x for y in starts_y],
+                 _load_tile, _write_tile,
+                 tiles_per_batch=tiles_per_batch,
+                 batch_size=batch_size,
+                 tta=tta,
+                 data_format=data_format,
+                 output_index=output_index)
+
+    if use_band:
+        _flush_band(image_x)
+
+    output = state['output']
+    if isinstance(output, np.memmap):
+        output.flush()
+
+    return output
+
+
+def get_bucket_shape(image_shape, bucket_shapes):
+    """Get the smallest bucket shape that an image fits inside.
+
+    Args:
+        image_shape (tuple): (rows, cols) of the image
+        bucket_shapes (list): (rows, cols) of each bucket
+
+    Returns:
+        tuple: (rows, cols) of the smallest bucket that fits the image,
+            or None if the image does not fit in any bucket.
+    """
+    fits = [tuple(b) for b in bucket_shapes
+            if b[0] >= image_shape[0] and b[1] >= image_shape[1]]
+    if not fits:
+        return None
+    return min(fits, key=lambda b: (b[0] * b[1], b))
+
+
+def predict_bucketed(model, images, bucket_shapes=((256, 256), (512, 512)),
+                     batch_size=4, padding='reflect', overlap=64,
+                     data_format=None):
+    """Predict images of different sizes with a fixed set of input shapes.
+
+    Every time a model with undefined spatial dimensions is given a new
+    input shape, the graph is re-optimized for that shape. Each image is
+    instead padded to the smallest bucket shape it fits in, and images in
+    the same bucket are predicted together in batches. The predictions are
+    cropped back to the size of each image.
+    Images larger than every bucket are processed as overlapping tiles
+    of the largest bucket shape.
+
+    Args:
+        model (tensorflow.keras.Model): fully convolutional model
+        images (list): images of any size, each without a batch axis
+        bucket_shapes (list): (rows, cols) of each allowed input shape
+        batch_size (int): maximum number of images in each predict call
+        padding (str): type of padding for the images,
+            one of {'reflect', 'zero'}.
+        overlap (int): overlap between tiles of images that are larger
+            than every bucket.
+        data_format (str): "channels_first" or "channels_last"
+
+    Returns:
+        list: the prediction of each image, in the same order as images
+
+    Raises:
+        ValueError: invalid padding value
+        ValueError: bucket_shapes is empty
+    """
+    if data_format is None:
+        data_format = K.image_data_format()
+
+    if str(padding).lower() not in {'reflect', 'zero'}:
+        raise ValueError('Expected `padding` to be either `zero` or '
+                         '`reflect`.  Got ', padding)
+
+    bucket_shapes = [conv_utils.normalize_tuple(b, 2, 'bucket_shape')
+                     for b in bucket_shapes]
+    if not bucket_shapes:
+        raise ValueError('Expected at least one bucket shape.')
+
+    largest_bucket = max(bucket_shapes, key=lambda b: (b[0] * b[1], b))
+
+    # each image is stored without a batch axis
+    ndim = images[0].ndim + 1 if images else 0
+    _, row_axis, col_axis = _get_image_axes(ndim, data_format)
+    row_axis, col_axis = row_axis - 1, col_axis - 1
+
+    buckets = {}
+    results = [None] * len(images)
+    for i, image in enumerate(images):
+        image_shape = (image.shape[row_axis], image.shape[col_axis])
+        bucket = get_bucket_shape(image_shape, bucket_shapes)
+
+        if bucket is None:
+            predicted = process_tiled_image(
+                model, image[np.newaxis],
+                tile_size=largest_bucket,
+                overlap=min(overlap, min(largest_bucket) - 1),
+                padding=padding,
+                data_format=data_format,
+                tiles_per_batch=batch_size)
+            results[i] = predicted[0]
+        else:
+            buckets.setdefault(bucket, []).append(i)
+
+    for bucket in sorted(buckets):
+        indices = buckets[bucket]
+        for start in range(0, len(indices), batch_size):
+            batch_indices = indices[start:start + batch_size]
+
+            batch = []
+            for i in batch_indices:
+                pad_width = [(0, 0)] * images[i].ndim
+                pad_width[row_axis] = (0, bucket[0] - images[i].shape[row_axis])
+                pad_width[col_axis] = (0, bucket[1] - images[i].shape[col_axis])
+                if str(padding).lower() == 'reflect':
+                    batch.append(np.pad(images[i], pad_width, mode='reflect'))
                 else:
-                    predicted = model.predict(padded_images[:, e:f, g:h, :])
+                    batch.append(np.pad(images[i], pad_width, mode='constant'))
+
+            predicted = model.predict(np.stack(batch, axis=0),
+                                      batch_size=len(batch))
 
             # if using skip_connections, get the final model output
             if isinstance(predicted, list):
                 predicted = predicted[-1]
 
-            # if the model uses padding, trim the output images to proper shape
-            # if model does not use padding, images should already be correct
-            if padding:
-                predicted = trim_padding(predicted, win_x, win_y)
+            for i, p in zip(batch_indices, predicted):
+                crop = [slice(None)] * p.ndim
+                crop[row_axis] = slice(0, images[i].shape[row_axis])
+                crop[col_axis] = slice(0, images[i].shape[col_axis])
+                results[i] = p[tuple(crop)]
 
-            a, b = i * crop_x, (i + 1) * crop_x
-            c, d = j * crop_y, (j + 1) * crop_y
-
-            if images.ndim == 5:
-                if channel_axis == 1:
-                    output[:, :, :, a:b, c:d] = predicted
-                else:
-                    output[:, :, a:b, c:d, :] = predicted
-            else:
-                if channel_axis == 1:
-                    output[:, :, a:b, c:d] = predicted
-                else:
-                    output[:, a:b, c:d, :] = predicted
-
-    return output
+    return results
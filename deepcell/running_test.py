@@ -29,6 +29,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import os
+
 from absl.testing import parameterized
 
 import numpy as np
@@ -169,6 +171,53 @@ class RunningTests(test.TestCase, parameterized.TestCase):
                     receptive_field=receptive_field,
                     padding=padding)
 
+                # all crops in a single predict call
+                batched_output = running.process_whole_image(
+                    model, images,
+                    num_crops=num_crops,
+                    receptive_field=receptive_field,
+                    padding=padding,
+                    tiles_per_batch=num_crops ** 2)
+                self.assertAllClose(output, batched_output)
+
+                tta_output = running.process_whole_image(
+                    model, images,
+                    num_crops=num_crops,
+                    receptive_field=receptive_field,
+                    padding=padding,
+                    tiles_per_batch=num_crops ** 2,
+                    tta=True)
+                self.assertAllClose(output, tta_output, atol=1e-5)
+                self.assertEqual(output.dtype, np.dtype(keras.backend.floatx()))
+
+                # compact output dtypes and preallocated outputs
+                float16_output = running.process_whole_image(
+                    model, images,
+                    num_crops=num_crops,
+                    receptive_field=receptive_field,
+                    padding=padding,
+                    output_dtype='float16')
+                self.assertEqual(float16_output.dtype, np.float16)
+                self.assertAllClose(output, float16_output, atol=1e-2)
+
+                buffer = np.zeros(output.shape, dtype='float32')
+                buffered_output = running.process_whole_image(
+                    model, images,
+                    num_crops=num_crops,
+                    receptive_field=receptive_field,
+                    padding=padding,
+                    output=buffer)
+                self.assertIs(buffered_output, buffer)
+                self.assertAllClose(output, buffer)
+
+                with self.assertRaises(ValueError):
+                    running.process_whole_image(
+                        model, images,
+                        num_crops=num_crops,
+                        receptive_field=receptive_field,
+                        padding=padding,
+                        output=np.zeros((1, 2, 3)))
+
                 if data_format == 'channels_first':
                     expected_shape = tuple([images.shape[0], features] +
                                            list(images.shape[2:]))
@@ -201,6 +250,358 @@ class RunningTests(test.TestCase, parameterized.TestCase):
                 receptive_field=receptive_field,
                 padding=None)
 
+    def test_predict_tiles(self):
+        keras.backend.set_image_data_format('channels_last')
+        features = 3
+        tiles = [(i, np.random.random((2, 8, 8, 1))) for i in range(5)]
+
+        with self.cached_session():
+            inputs = keras.layers.Input(shape=(8, 8, 1))
+            outputs = layers.TensorProduct(features)(inputs)
+            model = keras.models.Model(inputs=inputs, outputs=outputs)
+
+            expected = [model.predict(t) for _, t in tiles]
+
+            for tiles_per_batch in [1, 2, 5, 10]:
+                predictions = list(running.predict_tiles(
+                    model, iter(tiles), tiles_per_batch=tiles_per_batch))
+                self.assertEqual([k for k, _ in predictions], list(range(5)))
+                for (_, predicted), e in zip(predictions, expected):
+                    self.assertAllClose(predicted, e)
+
+            with self.assertRaises(ValueError):
+                list(running.predict_tiles(model, tiles, tiles_per_batch=0))
+
+    def test_inference_pipeline(self):
+        keras.backend.set_image_data_format('channels_last')
+        features = 3
+        tiles = {i: np.random.random((2, 8, 8, 1)) for i in range(7)}
+
+        with self.cached_session():
+            inputs = keras.layers.Input(shape=(8, 8, 1))
+            outputs = layers.TensorProduct(features)(inputs)
+            model = keras.models.Model(inputs=inputs, outputs=outputs)
+
+            for num_workers in [0, 1, 3]:
+                pipeline = running.InferencePipeline(
+                    num_workers=num_workers, queue_size=2)
+
+                results = []
+                pipeline.run(model, sorted(tiles), tiles.get,
+                             lambda k, p: results.append((k, p)),
+                             tiles_per_batch=3)
+
+                # results are written back in order
+                self.assertEqual([k for k, _ in results], sorted(tiles))
+                for k, predicted in results:
+                    self.assertAllClose(predicted, model.predict(tiles[k]))
+
+                for stage in ('load', 'predict', 'reassemble'):
+                    self.assertEqual(pipeline.stats[stage].count, len(tiles))
+
+            # errors in any stage are raised in the calling thread
+            def _raise(*_):
+                raise IOError('bad stage')
+
+            pipeline = running.InferencePipeline(num_workers=2, queue_size=2)
+            with self.assertRaises(IOError):
+                pipeline.run(model, sorted(tiles), _raise, lambda k, p: p)
+            with self.assertRaises(IOError):
+                pipeline.run(model, sorted(tiles), tiles.get, _raise)
+
+            with self.assertRaises(ValueError):
+                pipeline.run(model, sorted(tiles), tiles.get, _raise,
+                             tiles_per_batch=0)
+
+        with self.assertRaises(ValueError):
+            running.InferencePipeline(queue_size=0)
+
+    @parameterized.named_parameters([
+        {
+            'testcase_name': '2d_channels_last',
+            'data_format': 'channels_last',
+            'shape': (2, 16, 16, 2)
+        }, {
+            'testcase_name': '2d_channels_last_not_square',
+            'data_format': 'channels_last',
+            'shape': (2, 16, 12, 2)
+        }, {
+            'testcase_name': '3d_channels_last',
+            'data_format': 'channels_last',
+            'shape': (2, 3, 16, 16, 2)
+        }, {
+            'testcase_name': '2d_channels_first',
+            'data_format': 'channels_first',
+            'shape': (2, 2, 16, 16)
+        }, {
+            'testcase_name': '3d_channels_first',
+            'data_format': 'channels_first',
+            'shape': (2, 2, 3, 16, 16)
+        },
+    ])
+    def test_predict_tta(self, data_format, shape):
+        keras.backend.set_image_data_format(data_format)
+        features = 3
+        channel_axis = 1 if data_format == 'channels_first' else -1
+
+        images = np.random.random(shape)
+
+        input_shape = [None] * (len(shape) - 1)
+        input_shape[channel_axis] = shape[channel_axis]
+
+        with self.cached_session():
+            inputs = keras.layers.Input(shape=tuple(input_shape))
+            outputs = layers.TensorProduct(features)(inputs)
+            model = keras.models.Model(inputs=inputs,
+                                       outputs=[outputs, outputs])
+
+            # TensorProduct is pixelwise, so every transform agrees
+            output = running.predict_tta(model, images, data_format=data_format)
+            self.assertAllClose(output, model.predict(images)[-1], atol=1e-5)
+
+            output = running.process_tiled_image(
+                model, images,
+                tile_size=8,
+                overlap=2,
+                data_format=data_format,
+                tiles_per_batch=2,
+                tta=True)
+            self.assertAllClose(output, model.predict(images)[-1], atol=1e-5)
+
+    def test_predict_tta_explicit_data_format(self):
+        keras.backend.set_image_data_format('channels_first')
+        images = np.random.random((2, 2, 16, 16))
+
+        with self.cached_session():
+            inputs = keras.layers.Input(shape=(2, None, None))
+            outputs = layers.TensorProduct(3)(inputs)
+            model = keras.models.Model(inputs=inputs, outputs=outputs)
+            expected = model.predict(images)
+
+            # the data_format argument is used over the global default
+            keras.backend.set_image_data_format('channels_last')
+            output = running.process_tiled_image(
+                model, images,
+                tile_size=8,
+                overlap=2,
+                data_format='channels_first',
+                tiles_per_batch=2,
+                tta=True)
+            self.assertAllClose(output, expected, atol=1e-5)
+
+            tiles = [((i,), images[i:i + 1]) for i in range(len(images))]
+            results = list(running.predict_tiles(
+                model, tiles, tta=True, data_format='channels_first'))
+            self.assertAllClose(np.concatenate([r for _, r in results]),
+                                expected, atol=1e-5)
+
+    def test_predict_bucketed(self):
+        keras.backend.set_image_data_format('channels_last')
+        shapes = [(10, 20), (30, 30), (32, 5), (70, 40), (12, 12)]
+        images = [np.random.random(s + (2,)) for s in shapes]
+
+        buckets = running.get_bucket_shape((10, 20), [(32, 32), (16, 64)])
+        self.assertEqual(buckets, (16, 64))
+        self.assertIsNone(running.get_bucket_shape((40, 10), [(32, 32)]))
+
+        with self.cached_session():
+            inputs = keras.layers.Input(shape=(None, None, 2))
+            outputs = layers.TensorProduct(3)(inputs)
+            model = keras.models.Model(inputs=inputs, outputs=outputs)
+
+            for padding in ('reflect', 'zero'):
+                outputs = running.predict_bucketed(
+                    model, images,
+                    bucket_shapes=[(16, 16), 32],
+                    batch_size=2,
+                    padding=padding,
+                    overlap=8)
+
+                self.assertEqual(len(outputs), len(images))
+                for image, output in zip(images, outputs):
+                    self.assertEqual(output.shape, image.shape[:-1] + (3,))
+                    expected = model.predict(image[np.newaxis])[0]
+                    self.assertAllClose(output, expected, atol=1e-5)
+
+            with self.assertRaises(ValueError):
+                running.predict_bucketed(model, images, padding='other')
+            with self.assertRaises(ValueError):
+                running.predict_bucketed(model, images, bucket_shapes=[])
+
+    def test_get_tile_starts(self):
+        # image divides evenly into tiles
+        starts = running.get_tile_starts(64, 32, overlap=0)
+        self.assertEqual(starts, [0, 32])
+
+        # last tile is shifted back to the image border
+        starts = running.get_tile_starts(100, 32, overlap=8)
+        self.assertEqual(starts, [0, 24, 48, 68])
+
+        # image is smaller than the tile
+        starts = running.get_tile_starts(20, 32, overlap=8)
+        self.assertEqual(starts, [0])
+
+        with self.assertRaises(ValueError):
+            running.get_tile_starts(100, 32, overlap=32)
+
+    def test_get_blending_window(self):
+        window = running.get_blending_window((16, 12), (4, 0))
+        self.assertEqual(window.shape, (16, 12))
+        self.assertGreater(window.min(), 0)
+        self.assertEqual(window.max(), 1)
+        # no overlap in the columns means no tapering
+        self.assertAllEqual(window[8], np.ones((12,)))
+        self.assertAllClose(window[:4, 0], np.arange(1, 5) / 5.)
+
+    @parameterized.named_parameters([
+        {
+            'testcase_name': '2d_channels_last',
+            'data_format': 'channels_last',
+            'shape': (2, 45, 77, 2)
+        }, {
+            'testcase_name': '3d_channels_last',
+            'data_format': 'channels_last',
+            'shape': (2, 3, 20, 77, 2)
+        }, {
+            'testcase_name': '2d_channels_first',
+            'data_format': 'channels_first',
+            'shape': (2, 2, 45, 77)
+        }, {
+            'testcase_name': '3d_channels_first',
+            'data_format': 'channels_first',
+            'shape': (2, 2, 3, 20, 77)
+        },
+    ])
+    def test_process_tiled_image(self, data_format, shape):
+        keras.backend.set_image_data_format(data_format)
+
+        features = 3
+        tile_size = 32
+        channel_axis = 1 if data_format == 'channels_first' else -1
+
+        images = np.random.random(shape)
+
+        input_shape = [None] * (len(shape) - 1)
+        input_shape[channel_axis] = shape[channel_axis]
+
+        for padding in ['reflect', 'zero']:
+            with self.cached_session():
+                inputs = keras.layers.Input(shape=tuple(input_shape))
+                outputs = layers.TensorProduct(features)(inputs)
+                model = keras.models.Model(inputs=inputs,
+                                           outputs=[outputs, outputs])
+
+                output = running.process_tiled_image(
+                    model, images,
+                    tile_size=tile_size,
+                    overlap=8,
+                    padding=padding,
+                    data_format=data_format,
+                    tiles_per_batch=3)
+
+                # TensorProduct is pixelwise, so tiling should be seamless
+                expected = model.predict(images)[-1]
+                self.assertEqual(output.shape, expected.shape)
+                self.assertEqual(output.dtype, np.dtype(keras.backend.floatx()))
+                self.assertAllClose(output, expected, atol=1e-5)
+
+        # test compact output dtypes and preallocated outputs
+        with self.cached_session():
+            for output_dtype in ['float16', 'uint8']:
+                output = running.process_tiled_image(
+                    model, images,
+                    tile_size=tile_size,
+                    overlap=8,
+                    data_format=data_format,
+                    output_dtype=output_dtype)
+
+                self.assertEqual(output.dtype, np.dtype(output_dtype))
+                self.assertEqual(output.shape, expected.shape)
+
+            # uint8 outputs are quantized probabilities
+            probabilities = np.clip(expected, 0, 1)
+            output = running.process_tiled_image(
+                keras.models.Model(inputs=inputs, outputs=keras.layers.Lambda(
+                    lambda x: keras.backend.clip(x, 0, 1))(outputs)),
+                images,
+                tile_size=tile_size,
+                overlap=8,
+                data_format=data_format,
+                output_dtype='uint8')
+            self.assertAllClose(output, np.rint(probabilities * 255), atol=1)
+
+            buffer = np.ones(expected.shape, dtype='float32')
+            output = running.process_tiled_image(
+                model, images,
+                tile_size=tile_size,
+                overlap=8,
+                data_format=data_format,
+                output=buffer)
+            self.assertIs(output, buffer)
+            self.assertAllClose(buffer, expected, atol=1e-5)
+
+            with self.assertRaises(ValueError):
+                running.process_tiled_image(
+                    model, images,
+                    tile_size=tile_size,
+                    overlap=8,
+                    data_format=data_format,
+                    output=np.zeros((1, 2, 3)))
+
+        # test pipelined loading, prediction and reassembly
+        with self.cached_session():
+            pipeline = running.InferencePipeline(num_workers=2, queue_size=2)
+            output = running.process_tiled_image(
+                model, images,
+                tile_size=tile_size,
+                overlap=8,
+                data_format=data_format,
+                tiles_per_batch=2,
+                pipeline=pipeline)
+
+            self.assertAllClose(output, expected, atol=1e-5)
+            self.assertGreater(pipeline.stats['predict'].count, 0)
+
+        # test memory-mapped input and output files
+        temp_dir = self.get_temp_dir()
+        input_file = os.path.join(temp_dir, 'images.npy')
+        output_file = os.path.join(temp_dir, 'output.npy')
+        np.save(input_file, images)
+
+        with self.cached_session():
+            output = running.process_tiled_image(
+                model, input_file,
+                tile_size=tile_size,
+                overlap=8,
+                data_format=data_format,
+                output_file=output_file)
+
+            self.assertIsInstance(output, np.memmap)
+            self.assertAllClose(np.load(output_file), expected, atol=1e-5)
+
+            # the path may be a unicode string on python 2
+            output = running.process_tiled_image(
+                model, u'{}'.format(input_file),
+                tile_size=tile_size,
+                overlap=8,
+                data_format=data_format)
+            self.assertAllClose(output, expected, atol=1e-5)
+
+            with self.assertRaises(ValueError):
+                running.process_tiled_image(
+                    model, images,
+                    tile_size=tile_size,
+                    overlap=8,
+                    data_format=data_format,
+                    output=np.zeros(expected.shape, dtype='float32'),
+                    output_file=output_file)
+
+        with self.assertRaises(ValueError):
+            running.process_tiled_image(model, images, padding='invalid')
+
+        with self.assertRaises(ValueError):
+            running.process_tiled_image(model, images, tile_size=8, overlap=8)
+
 
 if __name__ == '__main__':
     test.main()
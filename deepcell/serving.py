@@ -0,0 +1,353 @@
+# Copyright 2016-2019 The Van Valen Lab at the California Institute of
+# Technology (Caltech), with support from the Paul Allen Family Foundation,
+# Google, & National Institutes of Health (NIH) under Grant U24CA224309-01.
+# All rights reserved.
+#
+# Licensed under a modified Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.github.com/vanvalenlab/deepcell-tf/LICENSE
+#
+# The Work provided may be used for non-commercial academic purposes only.
+# For any other use of the Work, including commercial use, please contact:
+# vanvalenlab@gmail.com
+#
+# Neither the name of Caltech nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Serve exported models in-process, batching concurrent requests"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import os
+import threading
+import timeit
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.python.saved_model import signature_constants
+from tensorflow.python.saved_model import tag_constants
+
+
+def get_latest_version(export_path):
+    """Get the directory of the latest version of an exported model.
+
+    Args:
+        export_path (str): directory passed to ``export_model``,
+            or the directory of a single model version.
+
+    Returns:
+        str: directory of the latest model version
+
+    Raises:
+        ValueError: no saved model was found in export_path
+    """
+    if os.path.isfile(os.path.join(export_path, 'saved_model.pb')):
+        return export_path
+
+    versions = [int(d) for d in os.listdir(export_path) if d.isdigit() and
+                os.path.isfile(os.path.join(export_path, d, 'saved_model.pb'))]
+    if not versions:
+        raise ValueError('No saved model found in {}'.format(export_path))
+    return os.path.join(export_path, str(max(versions)))
+
+
+class PendingRequest(object):
+    """The result of a request submitted to a ``BatchingServer``.
+
+    Args:
+        inputs (dict): data of a single sample for each signature input
+    """
+
+    def __init__(self, inputs):
+        self.inputs = inputs
+        self.start_time = timeit.default_timer()
+        self.latency = None
+        self._outputs = None
+        self._error = None
+        self._done = threading.Event()
+
+    def done(self):
+        """bool: whether the request has finished"""
+        return self._done.is_set()
+
+    def set_result(self, outputs=None, error=None):
+        self._outputs = outputs
+        self._error = error
+        self.latency = timeit.default_timer() - self.start_time
+        self._done.set()
+
+    def result(self, timeout=None):
+        """Wait for the outputs of the request.
+
+        Args:
+            timeout (float): maximum seconds to wait, or None to block
+
+        Returns:
+            dict: data of the sample for each signature output
+
+        Raises:
+            RuntimeError: the request did not finish before the timeout
+        """
+        if not self._done.wait(timeout):
+            raise RuntimeError('Request did not finish after {} seconds.'.format(
+                timeout))
+        if self._error is not None:
+            raise self._error
+        return self._outputs
+
+
+class BatchingServer(object):
+    """Serve a model written by ``export_model`` from the current process.
+
+    Concurrent single-sample requests are queued and a background thread
+    runs them as batches: it waits up to ``max_wait_ms`` for the queue to
+    fill a batch of ``max_batch_size`` samples, runs the model once and
+    sends each output back to its request. Requests with different input
+    shapes are run in separate batches.
+
+    Args:
+        export_path (str): directory of an exported model. If it holds
+            several versions, the latest version is loaded.
+        max_batch_size (int): largest number of samples in each batch
+        max_wait_ms (float): longest time to wait for a batch to fill,
+            in milliseconds.
+        signature_name (str): name of the signature to serve
+        max_latency_samples (int): number of the latest request latencies
+            used to compute the latency percentiles.
+
+    Raises:
+        ValueError: max_batch_size is less than 1
+    """
+
+    def __init__(self,
+                 export_path,
+                 max_batch_size=8,
+                 max_wait_ms=5,
+                 signature_name=signature_constants.DEFAULT_SERVING_SIGNATURE_DEF_KEY,
+                 max_latency_samples=10000):
+        if max_batch_size < 1:
+            raise ValueError('Expected `max_batch_size` to be at least 1. '
+                             'Got {}.'.format(max_batch_size))
+
+        self.export_path = get_latest_version(export_path)
+        self.max_batch_size = int(max_batch_size)
+        self.max_wait_ms = max_wait_ms
+        self.signature_name = signature_name
+
+        self._graph = tf.Graph()
+        self._sess = tf.Session(graph=self._graph)
+        with self._graph.as_default():
+            meta_graph = tf.saved_model.loader.load(
+                self._sess, [tag_constants.SERVING], self.export_path)
+        signature = meta_graph.signature_def[signature_name]
+        self.input_names = {k: v.name for k, v in signature.inputs.items()}
+        self.output_names = {k: v.name for k, v in signature.outputs.items()}
+
+        self.batch_sizes = collections.Counter()
+        self._latencies = collections.deque(maxlen=max_latency_samples)
+        self._stats_lock = threading.Lock()
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stopped = False
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """Start the thread that runs the batches.
+
+        Raises:
+            RuntimeError: the server has been stopped
+        """
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError('The server has been stopped.')
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def stop(self):
+        """Finish the queued requests, stop the thread and close the model.
+
+        Requests that can not be run, as the thread was never started,
+        fail with a RuntimeError.
+        """
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            # no request can be queued after the sentinel
+            self._queue.put(None)
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                request.set_result(error=RuntimeError(
+                    'The server was stopped before the request was run.'))
+
+        self._sess.close()
+
+    @property
+    def queue_depth(self):
+        """int: number of requests waiting to be batched"""
+        return self._queue.qsize()
+
+    def get_latency(self, percentile):
+        """Get a percentile of the latency of the latest requests.
+
+        Args:
+            percentile (float): percentile in the range [0, 100]
+
+        Returns:
+            float: seconds from submitting a request to its result
+        """
+        with self._stats_lock:
+            latencies = list(self._latencies)
+        return float(np.percentile(latencies, percentile)) if latencies else 0.
+
+    def get_stats(self):
+        """Get the counters of the server.
+
+        Returns:
+            dict: queue depth, batch size histogram, number of requests
+                and the p50 and p99 request latency in seconds.
+        """
+        with self._stats_lock:
+            batch_sizes = dict(self.batch_sizes)
+        return {
+            'queue_depth': self.queue_depth,
+            'batch_sizes': batch_sizes,
+            'requests': sum(k * v for k, v in batch_sizes.items()),
+            'latency_p50': self.get_latency(50),
+            'latency_p99': self.get_latency(99),
+        }
+
+    def submit(self, inputs):
+        """Queue a request without waiting for its result.
+
+        Args:
+            inputs (numpy.array): a single sample, without a batch axis.
+                A dict of samples by signature input name for models with
+                multiple inputs.
+
+        Returns:
+            PendingRequest: the request, whose result can be waited on
+
+        Raises:
+            ValueError: inputs do not match the signature inputs
+            RuntimeError: the server has been stopped
+        """
+        if not isinstance(inputs, dict):
+            if len(self.input_names) != 1:
+                raise ValueError('Expected a dict of inputs for the signature '
+                                 'inputs {}.'.format(sorted(self.input_names)))
+            inputs = {next(iter(self.input_names)): inputs}
+
+        if set(inputs) != set(self.input_names):
+            raise ValueError('Expected inputs {}. Got {}.'.format(
+                sorted(self.input_names), sorted(inputs)))
+
+        request = PendingRequest({k: np.asarray(v) for k, v in inputs.items()})
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError('The server has been stopped.')
+            self._queue.put(request)
+        return request
+
+    def predict(self, inputs, timeout=None):
+        """Predict a single sample, batched with any concurrent requests.
+
+        Args:
+            inputs (numpy.array): a single sample, without a batch axis.
+                A dict of samples by signature input name for models with
+                multiple inputs.
+            timeout (float): maximum seconds to wait, or None to block
+
+        Returns:
+            dict: the output of the sample for each signature output
+        """
+        return self.submit(inputs).result(timeout)
+
+    def _run(self):
+        running = True
+        while running:
+            request = self._queue.get()
+            if request is None:
+                break
+
+            batch = [request]
+            deadline = timeit.default_timer() + self.max_wait_ms / 1000.
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - timeit.default_timer()
+                try:
+                    if timeout > 0:
+                        request = self._queue.get(timeout=timeout)
+                    else:
+                        request = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                if request is None:
+                    running = False
+                    break
+                batch.append(request)
+
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        # only samples with the same shapes can be stacked
+        groups = collections.OrderedDict()
+        for request in batch:
+            key = tuple((k, v.shape, v.dtype.str)
+                        for k, v in sorted(request.inputs.items()))
+            groups.setdefault(key, []).append(request)
+
+        for requests in groups.values():
+            try:
+                feed_dict = {
+                    name: np.stack([r.inputs[k] for r in requests], axis=0)
+                    for k, name in self.input_names.items()}
+                keys = list(self.output_names)
+                outputs = self._sess.run([self.output_names[k] for k in keys],
+                                         feed_dict=feed_dict)
+            except Exception as err:  # pylint: disable=broad-except
+                for request in requests:
+                    request.set_result(error=err)
+            else:
+                for i, request in enumerate(requests):
+                    request.set_result({k: o[i] for k, o in zip(keys, outputs)})
+
+            with self._stats_lock:
+                self.batch_sizes[len(requests)] += 1
+                self._latencies.extend(r.latency for r in requests)
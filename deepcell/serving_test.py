@@ -0,0 +1,135 @@
+# Copyright 2016-2019 The Van Valen Lab at the California Institute of
+# Technology (Caltech), with support from the Paul Allen Family Foundation,
+# Google, & National Institutes of Health (NIH) under Grant U24CA224309-01.
+# All rights reserved.
+#
+# Licensed under a modified Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.github.com/vanvalenlab/deepcell-tf/LICENSE
+#
+# The Work provided may be used for non-commercial academic purposes only.
+# For any other use of the Work, including commercial use, please contact:
+# vanvalenlab@gmail.com
+#
+# Neither the name of Caltech nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for serving"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import threading
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.python import keras
+from tensorflow.python.keras import backend as K
+from tensorflow.python.platform import test
+
+from deepcell import layers
+from deepcell import serving
+from deepcell.utils.export_utils import export_model
+
+
+class ServingTest(test.TestCase):
+
+    def _export_model(self, export_path):
+        with tf.Graph().as_default():
+            inputs = keras.layers.Input(shape=(None, None, 2))
+            outputs = layers.TensorProduct(3)(inputs)
+            model = keras.models.Model(inputs=inputs, outputs=outputs)
+            export_model(model, export_path, model_version=2)
+            weights = model.get_weights()
+            K.clear_session()
+        return weights
+
+    def test_get_latest_version(self):
+        export_path = os.path.join(self.get_temp_dir(), 'versions')
+        for version in ('1', '10', '2', 'other'):
+            os.makedirs(os.path.join(export_path, version))
+            open(os.path.join(export_path, version, 'saved_model.pb'), 'w').close()
+
+        latest = os.path.join(export_path, '10')
+        self.assertEqual(serving.get_latest_version(export_path), latest)
+        self.assertEqual(serving.get_latest_version(latest), latest)
+
+        with self.assertRaises(ValueError):
+            serving.get_latest_version(self.get_temp_dir())
+
+    def test_batching_server(self):
+        export_path = os.path.join(self.get_temp_dir(), 'model')
+        kernel, bias = self._export_model(export_path)
+
+        images = [np.random.random((8, 8, 2)) for _ in range(10)]
+        expected = [np.dot(x, kernel) + bias for x in images]
+
+        with self.assertRaises(ValueError):
+            serving.BatchingServer(export_path, max_batch_size=0)
+
+        with serving.BatchingServer(export_path,
+                                    max_batch_size=4,
+                                    max_wait_ms=100) as server:
+            # requests queued together are run in full batches
+            requests = [server.submit(x) for x in images]
+            for request, y in zip(requests, expected):
+                output = request.result(timeout=10)
+                self.assertAllClose(output['prediction'], y, atol=1e-5)
+
+            self.assertEqual(server.get_stats()['batch_sizes'], {4: 2, 2: 1})
+
+            # concurrent requests of different shapes
+            results = {}
+
+            def _predict(i):
+                results[i] = server.predict(images[i][:i + 1])
+
+            threads = [threading.Thread(target=_predict, args=(i,))
+                       for i in range(len(images))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            for i, y in enumerate(expected):
+                self.assertAllClose(results[i]['prediction'], y[:i + 1],
+                                    atol=1e-5)
+
+            with self.assertRaises(ValueError):
+                server.submit({'other': images[0]})
+
+            stats = server.get_stats()
+            self.assertEqual(stats['requests'], 2 * len(images))
+            self.assertEqual(stats['queue_depth'], 0)
+            self.assertGreater(stats['latency_p99'], 0)
+            self.assertGreaterEqual(stats['latency_p99'], stats['latency_p50'])
+
+        # requests can not be submitted once the server is stopped
+        with self.assertRaises(RuntimeError):
+            server.submit(images[0])
+        with self.assertRaises(RuntimeError):
+            server.start()
+
+        # requests queued to a server that never started fail on stop
+        server = serving.BatchingServer(export_path)
+        request = server.submit(images[0])
+        server.stop()
+        self.assertTrue(request.done())
+        with self.assertRaises(RuntimeError):
+            request.result(timeout=1)
+        server.stop()  # stopping twice is a no-op
+
+
+if __name__ == '__main__':
+    test.main()
@@ -29,19 +29,10 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import sys
 import warnings
 
-from deepcell.utils import backbone_utils
-from deepcell.utils import data_utils
-from deepcell.utils import export_utils
-from deepcell.utils import io_utils
-from deepcell.utils import misc_utils
-from deepcell.utils import plot_utils
-from deepcell.utils import testing_utils
-from deepcell.utils import tracking_utils
-from deepcell.utils import train_utils
-from deepcell.utils import transform_utils
-from deepcell.utils import retinanet_anchor_utils
+from deepcell.utils.misc_utils import LazyModule
 
 try:
     from deepcell.utils import compute_overlap
@@ -49,23 +40,52 @@ except ImportError:
     warnings.warn('To use `compute_overlap`, the C extensions must be built '
                   'using `python setup.py build_ext --inplace`')
 
+# Submodules are imported on first use, as most of them import TensorFlow.
+_SUBMODULES = [
+    'backbone_utils',
+    'cache_utils',
+    'chunk_utils',
+    'data_utils',
+    'export_utils',
+    'io_utils',
+    'misc_utils',
+    'plot_utils',
+    'testing_utils',
+    'tracking_utils',
+    'train_utils',
+    'transform_utils',
+    'retinanet_anchor_utils',
+]
+
 # Globally-importable utils.
-from deepcell.utils.data_utils import get_data
-from deepcell.utils.data_utils import make_training_data
-from deepcell.utils.export_utils import export_model
-from deepcell.utils.io_utils import get_immediate_subdirs
-from deepcell.utils.io_utils import get_image
-from deepcell.utils.io_utils import nikon_getfiles
-from deepcell.utils.io_utils import get_image_sizes
-from deepcell.utils.io_utils import get_images_from_directory
-from deepcell.utils.misc_utils import sorted_nicely
-from deepcell.utils.train_utils import rate_scheduler
-from deepcell.utils.transform_utils import distance_transform_2d
-from deepcell.utils.transform_utils import distance_transform_3d
-from deepcell.utils.transform_utils import pixelwise_transform
+_ATTRIBUTES = {
+    'get_data': 'deepcell.utils.data_utils',
+    'make_training_data': 'deepcell.utils.data_utils',
+    'export_model': 'deepcell.utils.export_utils',
+    'get_immediate_subdirs': 'deepcell.utils.io_utils',
+    'get_image': 'deepcell.utils.io_utils',
+    'nikon_getfiles': 'deepcell.utils.io_utils',
+    'get_image_sizes': 'deepcell.utils.io_utils',
+    'get_images_from_directory': 'deepcell.utils.io_utils',
+    'sorted_nicely': 'deepcell.utils.misc_utils',
+    'rate_scheduler': 'deepcell.utils.train_utils',
+    'distance_transform_2d': 'deepcell.utils.transform_utils',
+    'distance_transform_3d': 'deepcell.utils.transform_utils',
+    'pixelwise_transform': 'deepcell.utils.transform_utils',
+}
 
 del warnings
 
 del absolute_import
 del division
 del print_function
+
+_lazy_module = LazyModule(__name__, globals(),
+                          submodules=_SUBMODULES,
+                          attributes=_ATTRIBUTES)
+
+# the names used to install the lazy module are not part of the package
+del _lazy_module.sys
+del _lazy_module.LazyModule
+
+sys.modules[__name__] = _lazy_module
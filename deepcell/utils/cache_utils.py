@@ -0,0 +1,198 @@
+# Copyright 2016-2019 The Van Valen Lab at the California Institute of
+# Technology (Caltech), with support from the Paul Allen Family Foundation,
+# Google, & National Institutes of Health (NIH) under Grant U24CA224309-01.
+# All rights reserved.
+#
+# Licensed under a modified Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.github.com/vanvalenlab/deepcell-tf/LICENSE
+#
+# The Work provided may be used for non-commercial academic purposes only.
+# For any other use of the Work, including commercial use, please contact:
+# vanvalenlab@gmail.com
+#
+# Neither the name of Caltech nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""On-disk cache of arrays, keyed by the content of their inputs"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+
+def get_cache_key(array, chunk_size=64, **params):
+    """Hash the content of an array and the parameters used to transform it.
+
+    Args:
+        array (numpy.array): input array
+        chunk_size (int): number of samples hashed at a time, so only a
+            small part of array is copied at once.
+        params (dict): JSON serializable parameters of the transform
+
+    Returns:
+        str: hex digest identifying array and params
+    """
+    hasher = hashlib.sha1()
+    header = {
+        'shape': list(array.shape),
+        'dtype': np.dtype(array.dtype).str,
+        'params': params,
+    }
+    hasher.update(json.dumps(header, sort_keys=True, default=repr).encode('utf-8'))
+
+    for i in range(0, max(len(array), 1), chunk_size):
+        chunk = np.ascontiguousarray(array[i:i + chunk_size])
+        hasher.update(chunk.view('uint8'))
+    return hasher.hexdigest()
+
+
+def _replace_file(src, dst):
+    """Move src to dst, atomically replacing dst if it exists"""
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    elif os.name == 'nt' and os.path.exists(dst):
+        # python 2 can not rename over an existing file on Windows
+        os.remove(dst)
+        os.rename(src, dst)
+    else:
+        os.rename(src, dst)
+
+
+class ArrayCache(object):
+    """Cache arrays as .npy files in a directory.
+
+    Cached arrays are memory-mapped copy-on-write, so they can be
+    modified in memory without changing the cache. When the total size
+    of the cached files is larger than ``max_bytes``, the least recently
+    used arrays are removed. The cache directory can be shared by many
+    processes.
+
+    Args:
+        cache_dir (str): directory of the cached arrays
+        max_bytes (int): maximum total size of the cached arrays.
+            If None, arrays are never evicted.
+    """
+
+    def __init__(self, cache_dir, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _get_path(self, key):
+        return os.path.join(self.cache_dir, '{}.npy'.format(key))
+
+    def _get_files(self):
+        """Get the path, size and last use of each cached array"""
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npy'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:  # removed by another process
+                continue
+            files.append((path, stat.st_size, stat.st_mtime))
+        return files
+
+    @property
+    def total_bytes(self):
+        """int: total size of the cached arrays"""
+        return sum(size for _, size, _ in self._get_files())
+
+    def __len__(self):
+        return len(self._get_files())
+
+    def __contains__(self, key):
+        return os.path.isfile(self._get_path(key))
+
+    def get(self, key):
+        """Get a cached array.
+
+        Args:
+            key (str): key of the array, e.g. from ``get_cache_key``
+
+        Returns:
+            numpy.memmap: the cached array, or None if it is not cached
+        """
+        path = self._get_path(key)
+        try:
+            array = np.load(path, mmap_mode='c')
+        except (IOError, OSError, ValueError):
+            return None
+
+        # Another process may evict the file once it is loaded. The memory
+        # map keeps the data readable, so only the last use is not updated.
+        try:
+            os.utime(path, None)  # most recently used
+        except OSError:
+            pass
+        return array
+
+    def put(self, key, array):
+        """Add an array to the cache.
+
+        Args:
+            key (str): key of the array, e.g. from ``get_cache_key``
+            array (numpy.array): array to cache
+        """
+        with self._lock:
+            # write to a temporary file first, so other processes never
+            # read a partially written array
+            fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, np.asarray(array))
+                _replace_file(temp_path, self._get_path(key))
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            self._evict(keep=self._get_path(key))
+
+    def _evict(self, keep=None):
+        """Remove the least recently used arrays until the cache fits.
+        The array at the path keep is never removed."""
+        if self.max_bytes is None:
+            return
+        files = sorted(self._get_files(), key=lambda f: f[2])
+        total_bytes = sum(size for _, size, _ in files)
+        for path, size, _ in files:
+            if total_bytes <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:  # removed by another process
+                pass
+            total_bytes -= size
+
+    def clear(self):
+        """Remove all cached arrays."""
+        with self._lock:
+            for path, _, _ in self._get_files():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,119 @@
+# Copyright 2016-2019 The Van Valen Lab at the California Institute of
+# Technology (Caltech), with support from the Paul Allen Family Foundation,
+# Google, & National Institutes of Health (NIH) under Grant U24CA224309-01.
+# All rights reserved.
+#
+# Licensed under a modified Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.github.com/vanvalenlab/deepcell-tf/LICENSE
+#
+# The Work provided may be used for non-commercial academic purposes only.
+# For any other use of the Work, including commercial use, please contact:
+# vanvalenlab@gmail.com
+#
+# Neither the name of Caltech nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for cache_utils"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import numpy as np
+from tensorflow.python.platform import test
+
+from deepcell.utils import cache_utils
+
+
+class CacheUtilsTest(test.TestCase):
+
+    def test_get_cache_key(self):
+        array = np.random.randint(10, size=(10, 8, 8, 1))
+        key = cache_utils.get_cache_key(array, transform='fgbg')
+        # the key does not depend on the chunk size or params order
+        self.assertEqual(key, cache_utils.get_cache_key(
+            array.copy(), chunk_size=3, transform='fgbg'))
+        self.assertEqual(
+            cache_utils.get_cache_key(array, a=1, b={'x': 2, 'y': 3}),
+            cache_utils.get_cache_key(array, b={'y': 3, 'x': 2}, a=1))
+        # the key depends on the content, shape, dtype and params
+        changed = array.copy()
+        changed[9, 7, 7, 0] += 1
+        self.assertNotEqual(key, cache_utils.get_cache_key(changed, transform='fgbg'))
+        self.assertNotEqual(key, cache_utils.get_cache_key(
+            array.reshape((10, 64, 1, 1)), transform='fgbg'))
+        self.assertNotEqual(key, cache_utils.get_cache_key(
+            array.astype('int16'), transform='fgbg'))
+        self.assertNotEqual(key, cache_utils.get_cache_key(array, transform=None))
+
+    def test_array_cache(self):
+        cache_dir = os.path.join(self.get_temp_dir(), 'cache')
+        cache = cache_utils.ArrayCache(cache_dir)
+        array = np.random.random((4, 8, 8, 3))
+
+        self.assertIsNone(cache.get('a'))
+        self.assertNotIn('a', cache)
+
+        cache.put('a', array)
+        self.assertIn('a', cache)
+        self.assertEqual(len(cache), 1)
+        cached = cache.get('a')
+        self.assertIsInstance(cached, np.memmap)
+        self.assertAllEqual(cached, array)
+
+        # cached arrays are copy-on-write
+        cached[0] = 0
+        self.assertAllEqual(cache.get('a'), array)
+
+        # the cache can be shared with another process
+        self.assertAllEqual(cache_utils.ArrayCache(cache_dir).get('a'), array)
+
+        # putting an existing key replaces the array
+        cache.put('a', array * 2)
+        self.assertAllEqual(cache.get('a'), array * 2)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(os.listdir(cache_dir), ['a.npy'])
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertIsNone(cache.get('a'))
+
+    def test_array_cache_eviction(self):
+        array = np.random.random((4, 8, 8, 3))
+        cache = cache_utils.ArrayCache(
+            os.path.join(self.get_temp_dir(), 'evict'),
+            max_bytes=int(array.nbytes * 2.5))
+
+        for i, key in enumerate(['a', 'b']):
+            cache.put(key, array)
+            os.utime(os.path.join(cache.cache_dir, key + '.npy'), (i, i))
+
+        # using a makes b the least recently used array
+        self.assertIsNotNone(cache.get('a'))
+        cache.put('c', array)
+        self.assertEqual(len(cache), 2)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+        self.assertLessEqual(cache.total_bytes, cache.max_bytes)
+
+        # the newest array is kept even if it is too large
+        cache.put('d', np.zeros((64, 8, 8, 3)))
+        self.assertEqual(len(cache), 1)
+        self.assertIn('d', cache)
+
+
+if __name__ == '__main__':
+    test.main()
@@ -0,0 +1,315 @@
+# Copyright 2016-2019 The Van Valen Lab at the California Institute of
+# Technology (Caltech), with support from the Paul Allen Family Foundation,
+# Google, & National Institutes of Health (NIH) under Grant U24CA224309-01.
+# All rights reserved.
+#
+# Licensed under a modified Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.github.com/vanvalenlab/deepcell-tf/LICENSE
+#
+# The Work provided may be used for non-commercial academic purposes only.
+# For any other use of the Work, including commercial use, please contact:
+# vanvalenlab@gmail.com
+#
+# Neither the name of Caltech nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Lazy arrays and chunked on-disk datasets that are read one batch at a time"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import numbers
+import os
+
+import numpy as np
+
+
+INDEX_FILE = 'index.json'
+
+
+class ChunkedArrayWriter(object):
+    """Write an array to a directory of .npy files of ``chunk_size`` samples.
+
+    Samples are appended in blocks of any size, so an array larger than
+    memory can be written piece by piece.
+
+    Args:
+        path (str): directory of the chunked dataset
+        name (str): name of the array, e.g. "X"
+        chunk_size (int): number of samples in each chunk file
+
+    Raises:
+        ValueError: chunk_size is less than 1
+    """
+
+    def __init__(self, path, name, chunk_size=64):
+        if chunk_size < 1:
+            raise ValueError('Expected `chunk_size` to be at least 1. '
+                             'Got {}.'.format(chunk_size))
+        self.path = path
+        self.name = name
+        self.chunk_size = int(chunk_size)
+        self.files = []
+        self.num_samples = 0
+        self.sample_shape = None
+        self.dtype = None
+        self._buffer = []
+        self._buffered = 0
+
+        if not os.path.isdir(os.path.join(path, name)):
+            os.makedirs(os.path.join(path, name))
+
+    def write(self, samples):
+        """Append a block of samples to the array.
+
+        Args:
+            samples (numpy.array): samples to write, in the first dimension
+
+        Raises:
+            ValueError: the samples do not match the shape or dtype of the
+                samples already written.
+        """
+        samples = np.asarray(samples)
+        if self.sample_shape is None:
+            self.sample_shape = samples.shape[1:]
+            self.dtype = samples.dtype
+        elif samples.shape[1:] != self.sample_shape or samples.dtype != self.dtype:
+            raise ValueError('Expected samples of shape {} and dtype {}. Got '
+                             '{} and {}.'.format(self.sample_shape, self.dtype,
+                                                 samples.shape[1:], samples.dtype))
+
+        start = 0
+        while start < len(samples):
+            stop = start + self.chunk_size - self._buffered
+            self._buffer.append(samples[start:stop])
+            self._buffered += len(self._buffer[-1])
+            start = stop
+            if self._buffered == self.chunk_size:
+                self._write_chunk()
+
+    def _write_chunk(self):
+        file_name = os.path.join(self.name, '{:06d}.npy'.format(len(self.files)))
+        np.save(os.path.join(self.path, file_name),
+                np.concatenate(self._buffer, axis=0))
+        self.files.append(file_name)
+        self.num_samples += self._buffered
+        self._buffer = []
+        self._buffered = 0
+
+    def close(self):
+        """Write any remaining samples.
+
+        Returns:
+            dict: metadata of the array for the dataset index
+        """
+        if self._buffered:
+            self._write_chunk()
+        return {
+            'shape': [self.num_samples] + list(self.sample_shape or ()),
+            'dtype': np.dtype(self.dtype).str if self.dtype else None,
+            'chunk_size': self.chunk_size,
+            'files': self.files,
+        }
+
+
+def write_index(path, arrays):
+    """Write the index of a chunked dataset.
+
+    Args:
+        path (str): directory of the chunked dataset
+        arrays (dict): metadata of each array by name, as returned by
+            ``ChunkedArrayWriter.close``.
+    """
+    with open(os.path.join(path, INDEX_FILE), 'w') as f:
+        json.dump({'version': 1, 'arrays': arrays}, f, indent=2)
+
+
+def save_chunked(path, chunk_size=64, **arrays):
+    """Save arrays as a chunked dataset, like ``numpy.savez``.
+
+    Args:
+        path (str): directory of the chunked dataset
+        chunk_size (int): number of samples in each chunk file
+        arrays (dict): arrays to save by name, e.g. ``X=X, y=y``
+    """
+    metadata = {}
+    for name, array in arrays.items():
+        writer = ChunkedArrayWriter(path, name, chunk_size=chunk_size)
+        for i in range(0, len(array), chunk_size):
+            writer.write(array[i:i + chunk_size])
+        metadata[name] = writer.close()
+    write_index(path, metadata)
+
+
+def is_chunked(path):
+    """Whether a path is a chunked dataset.
+
+    Args:
+        path (str): path to check
+
+    Returns:
+        bool: whether path is a directory with a chunked dataset index
+    """
+    return os.path.isfile(os.path.join(path, INDEX_FILE))
+
+
+def load_chunked(path):
+    """Open the arrays of a chunked dataset without reading them.
+
+    Args:
+        path (str): directory of the chunked dataset
+
+    Returns:
+        dict: a ChunkedArray for each array in the dataset
+    """
+    with open(os.path.join(path, INDEX_FILE)) as f:
+        index = json.load(f)
+
+    return {name: ChunkedArray(path, **metadata)
+            for name, metadata in index['arrays'].items()}
+
+
+class IndexedArray(object):
+    """A lazy view of some of the samples of an array.
+
+    The samples are only copied out of data when the view is indexed or
+    converted to an array, so views of a memory-mapped array do not read
+    anything from disk until they are used. ``subset`` creates a view of
+    some of the samples without reading any data.
+
+    Args:
+        data (numpy.array): array of all samples, e.g. a numpy.memmap
+        index (numpy.array): indices of the samples of data in this view.
+            Defaults to all of the samples.
+    """
+
+    def __init__(self, data, index=None):
+        self.data = data
+        self.dtype = np.dtype(data.dtype)
+        self._stored_shape = tuple(data.shape)
+        if index is None:
+            index = np.arange(self._stored_shape[0])
+        self.index = np.asarray(index, dtype='int64')
+
+    @property
+    def shape(self):
+        return (len(self.index),) + self._stored_shape[1:]
+
+    @property
+    def ndim(self):
+        return len(self._stored_shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __len__(self):
+        return len(self.index)
+
+    def __repr__(self):
+        return '{}(shape={}, dtype={})'.format(
+            type(self).__name__, self.shape, self.dtype)
+
+    def subset(self, indices):
+        """Get a view of some of the samples, without reading any data.
+
+        Args:
+            indices (numpy.array): indices of the samples in this array
+
+        Returns:
+            IndexedArray: view of the selected samples
+        """
+        return IndexedArray(self.data, index=self.index[indices])
+
+    def _read(self, stored_indices):
+        """Read samples by their index in the stored array"""
+        return np.asarray(self.data[stored_indices])
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        samples, rest = key[0], key[1:]
+
+        if isinstance(samples, numbers.Integral):
+            data = self._read(self.index[[samples]])[0]
+            return data[rest] if rest else data
+
+        data = self._read(self.index[samples])
+        return data[(slice(None),) + rest] if rest else data
+
+    def __array__(self, dtype=None):
+        data = self._read(self.index)
+        return data if dtype is None else data.astype(dtype)
+
+    def astype(self, dtype):
+        return np.asarray(self, dtype=dtype)
+
+
+class ChunkedArray(IndexedArray):
+    """A lazy array of samples stored in chunk files.
+
+    Indexing the array reads only the chunks of the selected samples,
+    and the chunks are memory-mapped so only the selected samples are
+    read from disk.
+
+    Args:
+        path (str): directory of the chunked dataset
+        shape (tuple): shape of the stored array
+        dtype (str): dtype of the stored array
+        chunk_size (int): number of samples in each chunk file
+        files (list): chunk file names, relative to path
+        index (numpy.array): indices of the stored samples in this view.
+            Defaults to all of the samples.
+    """
+
+    def __init__(self, path, shape, dtype, chunk_size, files, index=None):
+        self.path = path
+        self.chunk_size = int(chunk_size)
+        self.files = list(files)
+        self.data = None
+        self.dtype = np.dtype(dtype)
+        self._stored_shape = tuple(shape)
+        if index is None:
+            index = np.arange(self._stored_shape[0])
+        self.index = np.asarray(index, dtype='int64')
+
+    def __repr__(self):
+        return '{}(shape={}, dtype={}, path={})'.format(
+            type(self).__name__, self.shape, self.dtype, self.path)
+
+    def subset(self, indices):
+        """Get a view of some of the samples, without reading any data.
+
+        Args:
+            indices (numpy.array): indices of the samples in this array
+
+        Returns:
+            ChunkedArray: view of the selected samples
+        """
+        return ChunkedArray(self.path, self._stored_shape, self.dtype,
+                            self.chunk_size, self.files,
+                            index=self.index[indices])
+
+    def _read(self, stored_indices):
+        """Read samples by their index in the stored array"""
+        out = np.empty((len(stored_indices),) + self._stored_shape[1:],
+                       dtype=self.dtype)
+        chunks = stored_indices // self.chunk_size
+        for chunk in np.unique(chunks):
+            positions = np.where(chunks == chunk)[0]
+            data = np.load(os.path.join(self.path, self.files[chunk]),
+                           mmap_mode='r')
+            out[positions] = data[stored_indices[positions] - chunk * self.chunk_size]
+        return out
@@ -0,0 +1,125 @@
+# Copyright 2016-2019 The Van Valen Lab at the California Institute of
+# Technology (Caltech), with support from the Paul Allen Family Foundation,
+# Google, & National Institutes of Health (NIH) under Grant U24CA224309-01.
+# All rights reserved.
+#
+# Licensed under a modified Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.github.com/vanvalenlab/deepcell-tf/LICENSE
+#
+# The Work provided may be used for non-commercial academic purposes only.
+# For any other use of the Work, including commercial use, please contact:
+# vanvalenlab@gmail.com
+#
+# Neither the name of Caltech nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for chunk_utils"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import numpy as np
+from tensorflow.python.platform import test
+
+from deepcell.utils import chunk_utils
+
+
+class ChunkUtilsTest(test.TestCase):
+
+    def test_save_chunked(self):
+        X = np.random.random((10, 8, 8, 2)).astype('float32')
+        y = np.random.randint(3, size=(10, 8, 8, 1))
+
+        path = os.path.join(self.get_temp_dir(), 'dataset')
+        self.assertFalse(chunk_utils.is_chunked(path))
+
+        chunk_utils.save_chunked(path, chunk_size=4, X=X, y=y)
+        self.assertTrue(chunk_utils.is_chunked(path))
+
+        arrays = chunk_utils.load_chunked(path)
+        self.assertEqual(set(arrays), {'X', 'y'})
+        self.assertEqual(len(arrays['X'].files), 3)
+        self.assertEqual(arrays['X'].shape, X.shape)
+        self.assertEqual(arrays['X'].dtype, X.dtype)
+        self.assertAllEqual(np.asarray(arrays['X']), X)
+        self.assertAllEqual(np.asarray(arrays['y']), y)
+
+    def test_chunked_array_writer(self):
+        X = np.random.random((11, 4, 4, 1))
+        path = self.get_temp_dir()
+
+        # write blocks that do not line up with the chunks
+        writer = chunk_utils.ChunkedArrayWriter(path, 'X', chunk_size=3)
+        for block in (X[:2], X[2:7], X[7:]):
+            writer.write(block)
+        metadata = writer.close()
+
+        self.assertEqual(metadata['shape'], list(X.shape))
+        self.assertEqual(len(metadata['files']), 4)
+
+        array = chunk_utils.ChunkedArray(path, **metadata)
+        self.assertAllEqual(np.asarray(array), X)
+
+        # mismatched samples
+        with self.assertRaises(ValueError):
+            writer.write(np.zeros((2, 5, 5, 1)))
+
+        with self.assertRaises(ValueError):
+            chunk_utils.ChunkedArrayWriter(path, 'bad', chunk_size=0)
+
+    def test_indexed_array(self):
+        X = np.random.random((10, 8, 8, 1))
+        array = chunk_utils.IndexedArray(X)
+
+        self.assertEqual(array.shape, X.shape)
+        self.assertEqual(array.dtype, X.dtype)
+        self.assertAllEqual(np.asarray(array), X)
+        self.assertAllEqual(array[2:5, 1], X[2:5, 1])
+
+        indices = np.array([3, 9, 0])
+        subset = array.subset(indices)
+        self.assertIs(subset.data, X)
+        self.assertEqual(len(subset), 3)
+        self.assertAllEqual(subset[1], X[9])
+        self.assertAllEqual(subset[::2, ..., 0], X[indices[::2], ..., 0])
+        self.assertAllEqual(subset.subset([2, 0]), X[[0, 3]])
+
+    def test_chunked_array(self):
+        X = np.random.random((10, 8, 8, 1))
+        path = os.path.join(self.get_temp_dir(), 'dataset')
+        chunk_utils.save_chunked(path, chunk_size=3, X=X)
+        array = chunk_utils.load_chunked(path)['X']
+
+        self.assertEqual(len(array), 10)
+        self.assertEqual(array.ndim, 4)
+        self.assertAllEqual(array[4], X[4])
+        self.assertAllEqual(array[2:8], X[2:8])
+        self.assertAllEqual(array[[9, 0, 5]], X[[9, 0, 5]])
+        self.assertAllEqual(array[1:4, 2:4, ..., 0], X[1:4, 2:4, ..., 0])
+        self.assertAllEqual(array[3, ..., 0], X[3, ..., 0])
+        self.assertEqual(array.astype('float16').dtype, np.float16)
+
+        # subsets index the samples of the view
+        indices = np.array([7, 1, 4, 8])
+        subset = array.subset(indices)
+        self.assertEqual(subset.shape, (4, 8, 8, 1))
+        self.assertAllEqual(np.asarray(subset), X[indices])
+        self.assertAllEqual(subset[1:3], X[indices[1:3]])
+        self.assertAllEqual(subset.subset([0, 3])[1], X[8])
+
+
+if __name__ == '__main__':
+    test.main()
@@ -33,30 +33,71 @@ import os
 import random
 
 from fnmatch import fnmatch
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 
 import numpy as np
 from sklearn.model_selection import train_test_split
 from tensorflow.python.keras import backend as K
 from tensorflow.python.keras.utils import conv_utils
 
+from deepcell.utils.chunk_utils import IndexedArray
+from deepcell.utils.chunk_utils import is_chunked
+from deepcell.utils.chunk_utils import load_chunked
+from deepcell.utils.chunk_utils import save_chunked
 from deepcell.utils.io_utils import get_image
 from deepcell.utils.io_utils import get_image_sizes
+from deepcell.utils.io_utils import get_npz_memmap
 from deepcell.utils.io_utils import nikon_getfiles
 from deepcell.utils.io_utils import get_immediate_subdirs
 from deepcell.utils.io_utils import count_image_files
+from deepcell.utils.misc_utils import relabel_sequential
 from deepcell.utils.misc_utils import sorted_nicely
 from deepcell.utils.tracking_utils import load_trks
 
 
-def get_data(file_name, mode='sample', test_size=.2, seed=0):
+def train_test_split_indices(num_samples, test_size=.2, seed=0):
+    """Randomly split sample indices into train and test indices.
+
+    The split is the same as ``sklearn.model_selection.train_test_split``
+    with the same test_size and seed, without copying any data.
+
+    Args:
+        num_samples (int): number of samples to split
+        test_size (float): fraction of the samples in the test split,
+            or the number of test samples if an int.
+        seed (int): seed number for random train/test split repeatability
+
+    Returns:
+        (numpy.array, numpy.array): indices of the train and test samples
+    """
+    if isinstance(test_size, float):
+        num_test = int(np.ceil(test_size * num_samples))
+    else:
+        num_test = int(test_size)
+
+    permutation = np.random.RandomState(seed).permutation(num_samples)
+    return permutation[num_test:], permutation[:num_test]
+
+
+def get_data(file_name, mode='sample', test_size=.2, seed=0, lazy=False):
     """Load data from NPZ file and split into train and test sets
 
+    If lazy, the data is split by index instead of being copied into
+    separate train and test arrays. X and y are lazy ``IndexedArray``
+    views of the train and test samples, which are read when indexed.
+    The NPZ file is memory-mapped, so no data is read until it is used.
+    Chunked datasets, written by ``make_training_data`` with a
+    ``chunk_size``, are always loaded lazily.
+
     Args:
-        file_name (str): path to NPZ file to load
+        file_name (str): path to NPZ file or chunked dataset to load
         mode (str): if 'siamese_daughters', returns lineage information from
             .trk file otherwise, returns the same data that was loaded.
         test_size (float): percent of data to leave as testing holdout
         seed (int): seed number for random train/test split repeatability
+        lazy (bool): whether to split the data by index, without copying it.
+            The samples in each split are the same as if lazy is False.
 
     Returns:
         (dict, dict): dict of training data, and a dict of testing data
@@ -82,8 +123,18 @@ def get_data(file_name, mode='sample', test_size=.2, seed=0):
                       for cell, fields in tracks.items()}
                      for tracks in training_data['lineages']]
 
-        X_train, X_test, y_train, y_test, ln_train, ln_test = train_test_split(
-            X, y, daughters, test_size=test_size, random_state=seed)
+        if lazy:
+            train_index, test_index = train_test_split_indices(
+                X.shape[0], test_size=test_size, seed=seed)
+
+            X, y = IndexedArray(X), IndexedArray(y)
+            X_train, X_test = X.subset(train_index), X.subset(test_index)
+            y_train, y_test = y.subset(train_index), y.subset(test_index)
+            ln_train = [daughters[i] for i in train_index]
+            ln_test = [daughters[i] for i in test_index]
+        else:
+            X_train, X_test, y_train, y_test, ln_train, ln_test = train_test_split(
+                X, y, daughters, test_size=test_size, random_state=seed)
 
         train_dict = {
             'X': X_train,
@@ -98,12 +149,29 @@ def get_data(file_name, mode='sample', test_size=.2, seed=0):
         }
         return train_dict, test_dict
 
-    training_data = np.load(file_name)
-    X = training_data['X']
-    y = training_data['y']
+    if is_chunked(file_name):
+        training_data = load_chunked(file_name)
+        X = training_data['X']
+        y = training_data['y']
+        lazy = True
+    elif lazy:
+        training_data = get_npz_memmap(file_name)
+        X = IndexedArray(training_data['X'])
+        y = IndexedArray(training_data['y'])
+    else:
+        training_data = np.load(file_name)
+        X = training_data['X']
+        y = training_data['y']
+
+    if lazy:
+        train_index, test_index = train_test_split_indices(
+            X.shape[0], test_size=test_size, seed=seed)
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=test_size, random_state=seed)
+        X_train, X_test = X.subset(train_index), X.subset(test_index)
+        y_train, y_test = y.subset(train_index), y.subset(test_index)
+    else:
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=test_size, random_state=seed)
 
     train_dict = {
         'X': X_train,
@@ -438,14 +506,7 @@ def relabel_movie(y):
     Returns:
         numpy.array: relabeled tensor with sequential labels
     """
-    new_y = np.zeros(y.shape)
-    unique_cells = np.unique(y)  # get all unique values of y
-    unique_cells = np.delete(unique_cells, 0)  # remove 0, as it is background
-    relabel_ids = np.arange(1, len(unique_cells) + 1)
-    for cell_id, relabel_id in zip(unique_cells, relabel_ids):
-        cell_loc = np.where(y == cell_id)
-        new_y[cell_loc] = relabel_id
-    return new_y
+    return relabel_sequential(y)
 
 
 def reshape_movie(X, y, reshape_size=256):
@@ -515,11 +576,71 @@ def reshape_movie(X, y, reshape_size=256):
     return new_X, new_y
 
 
+def get_file_index(directories):
+    """List the files of each directory once.
+
+    Args:
+        directories (str[]): directories to list
+
+    Returns:
+        dict: the list of files in each directory
+    """
+    return {d: os.listdir(d) for d in set(directories)}
+
+
+def _read_image(task):
+    """Read the image file of an (index, file_path) task"""
+    index, file_path = task
+    # the image is cast to the dtype of the array when it is written
+    return index, get_image(file_path, dtype=None)
+
+
+def load_images_into(array, tasks, num_workers=4, use_processes=False):
+    """Decode image files in parallel into a preallocated array.
+
+    Images are written into the array as soon as they are decoded,
+    while the workers decode the next images.
+
+    Args:
+        array (numpy.array): array to fill with the images
+        tasks (list): (index, file_path) of each image file, where the
+            index selects the part of the array to write the image to.
+            Indices are pickled for processes, so they can not use
+            ``Ellipsis`` on Python 2.
+        num_workers (int): number of threads or processes decoding images.
+            If 0, the images are decoded serially.
+        use_processes (bool): whether to decode in a pool of processes
+            instead of threads.
+
+    Returns:
+        numpy.array: the filled array
+    """
+    if not num_workers:
+        for task in tasks:
+            index, image = _read_image(task)
+            array[index] = image
+        return array
+
+    pool = (Pool if use_processes else ThreadPool)(num_workers)
+    try:
+        chunksize = max(1, len(tasks) // (4 * num_workers))
+        for index, image in pool.imap_unordered(_read_image, tasks,
+                                                chunksize=chunksize):
+            array[index] = image
+    finally:
+        pool.terminate()
+        pool.join()
+
+    return array
+
+
 def load_training_images_2d(direc_name,
                             training_direcs,
                             raw_image_direc,
                             channel_names,
-                            image_size):
+                            image_size,
+                            num_workers=4,
+                            use_processes=False):
     """Load each image in the training_direcs into a numpy array.
 
     Args:
@@ -531,6 +652,8 @@ def load_training_images_2d(direc_name,
         channel_names (str[]): Loads all raw images
             with a channel_name in the filename
         image_size (tuple): size of each image as tuple (x, y)
+        num_workers (int): number of threads or processes decoding images
+        use_processes (bool): whether to decode images in processes
 
     Returns:
         numpy.array: 4D tensor of image data
@@ -547,33 +670,30 @@ def load_training_images_2d(direc_name,
 
     X = np.zeros(X_shape, dtype=K.floatx())
 
-    # Load training images
-    for b, direc in enumerate(training_direcs):
-        # e.g. "/data/ecoli/kc", "set1", "RawImages",
-        imglist = os.listdir(os.path.join(direc_name, direc, raw_image_direc))
+    # Index each directory once, the last matching file is used
+    direcs = [os.path.join(direc_name, d, raw_image_direc) for d in training_direcs]
+    file_index = get_file_index(direcs)
 
+    tasks = []
+    for b, direc in enumerate(direcs):
         for c, channel in enumerate(channel_names):
-            for img in imglist:
-                # if channel string is NOT in image file name, skip it.
-                if not fnmatch(img, '*{}*'.format(channel)):
-                    continue
+            matches = [f for f in file_index[direc]
+                       if fnmatch(f, '*{}*'.format(channel))]
+            if matches:
+                index = (b, c) if is_channels_first else (b, slice(None), slice(None), c)
+                tasks.append((index, os.path.join(direc, matches[-1])))
 
-                image_file = os.path.join(direc_name, direc, raw_image_direc, img)
-                image_data = np.asarray(get_image(image_file), dtype=K.floatx())
-
-                if is_channels_first:
-                    X[b, c, :, :] = image_data
-                else:
-                    X[b, :, :, c] = image_data
-
-    return X
+    return load_images_into(X, tasks, num_workers=num_workers,
+                            use_processes=use_processes)
 
 
 def load_annotated_images_2d(direc_name,
                              training_direcs,
                              annotation_direc,
                              annotation_name,
-                             image_size):
+                             image_size,
+                             num_workers=4,
+                             use_processes=False):
     """Load each annotated image in the training_direcs into a numpy array.
 
     Args:
@@ -585,6 +705,8 @@ def load_annotated_images_2d(direc_name,
         annotation_name (str): Loads all masks with
             annotation_name in the filename
         image_size (tuple): size of each image as tuple (x, y)
+        num_workers (int): number of threads or processes decoding images
+        use_processes (bool): whether to decode images in processes
 
     Returns:
         numpy.array: 4D tensor of label masks
@@ -605,23 +727,21 @@ def load_annotated_images_2d(direc_name,
 
     y = np.zeros(y_shape, dtype='int32')
 
-    for b, direc in enumerate(training_direcs):
-        imglist = os.listdir(os.path.join(direc_name, direc, annotation_direc))
+    # Index each directory once, the last matching file is used
+    direcs = [os.path.join(direc_name, d, annotation_direc) for d in training_direcs]
+    file_index = get_file_index(direcs)
 
+    tasks = []
+    for b, direc in enumerate(direcs):
         for l, annotation in enumerate(annotation_name):
-            for img in imglist:
-                # if annotation_name is NOT in image file name, skip it.
-                if not fnmatch(img, '*{}*'.format(annotation)):
-                    continue
-
-                image_data = get_image(os.path.join(direc_name, direc, annotation_direc, img))
+            matches = [f for f in file_index[direc]
+                       if fnmatch(f, '*{}*'.format(annotation))]
+            if matches:
+                index = (b, l) if is_channels_first else (b, slice(None), slice(None), l)
+                tasks.append((index, os.path.join(direc, matches[-1])))
 
-                if is_channels_first:
-                    y[b, l, :, :] = image_data
-                else:
-                    y[b, :, :, l] = image_data
-
-    return y
+    return load_images_into(y, tasks, num_workers=num_workers,
+                            use_processes=use_processes)
 
 
 def make_training_data_2d(direc_name,
@@ -631,7 +751,10 @@ def make_training_data_2d(direc_name,
                           annotation_direc='annotated',
                           annotation_name='feature',
                           training_direcs=None,
-                          reshape_size=None):
+                          reshape_size=None,
+                          num_workers=4,
+                          use_processes=False,
+                          chunk_size=None):
     """Read all images in training directories and save as npz file.
 
     Args:
@@ -649,6 +772,13 @@ def make_training_data_2d(direc_name,
         annotation_name (str): Loads all masks with
             annotation_name in the filename
         reshape_size (int): If provided, reshapes the images to the given size
+        num_workers (int): number of threads or processes decoding images.
+            If 0, the images are decoded serially.
+        use_processes (bool): whether to decode images in a pool of
+            processes instead of threads.
+        chunk_size (int): If provided, file_name_save is written as a
+            chunked dataset directory with chunk_size samples per file,
+            which can be read lazily by ``get_data``.
     """
     # Load one file to get image sizes (assumes all images same size)
     image_path = os.path.join(direc_name, random.choice(training_direcs), raw_image_direc)
@@ -657,18 +787,25 @@ def make_training_data_2d(direc_name,
     X = load_training_images_2d(direc_name, training_direcs,
                                 raw_image_direc=raw_image_direc,
                                 channel_names=channel_names,
-                                image_size=image_size)
+                                image_size=image_size,
+                                num_workers=num_workers,
+                                use_processes=use_processes)
 
     y = load_annotated_images_2d(direc_name, training_direcs,
                                  annotation_direc=annotation_direc,
                                  annotation_name=annotation_name,
-                                 image_size=image_size)
+                                 image_size=image_size,
+                                 num_workers=num_workers,
+                                 use_processes=use_processes)
 
     if reshape_size is not None:
         X, y = reshape_matrix(X, y, reshape_size=reshape_size)
 
-    # Save training data in npz format
-    np.savez(file_name_save, X=X, y=y)
+    # Save training data in npz or chunked format
+    if chunk_size is not None:
+        save_chunked(file_name_save, chunk_size=chunk_size, X=X, y=y)
+    else:
+        np.savez(file_name_save, X=X, y=y)
 
 
 def load_training_images_3d(direc_name,
@@ -677,7 +814,9 @@ def load_training_images_3d(direc_name,
                             channel_names,
                             image_size,
                             num_frames,
-                            montage_mode=False):
+                            montage_mode=False,
+                            num_workers=4,
+                            use_processes=False):
     """Load each image in the training_direcs into a numpy array.
 
     Args:
@@ -693,6 +832,8 @@ def load_training_images_3d(direc_name,
             training directory
         montage_mode (bool): load masks from "montaged" subdirs
             inside annotation_direc
+        num_workers (int): number of threads or processes decoding images
+        use_processes (bool): whether to decode images in processes
 
     Returns:
         numpy.array: 5D tensor of raw image data
@@ -714,31 +855,28 @@ def load_training_images_3d(direc_name,
 
     X = np.zeros(X_shape, dtype=K.floatx())
 
-    # Load 3D training images
-    for b, direc in enumerate(X_dirs):
+    # Load 3D training images, indexing each directory once
+    file_index = get_file_index(X_dirs)
 
+    tasks = []
+    for b, direc in enumerate(X_dirs):
         for c, channel in enumerate(channel_names):
+            imglist = sorted_nicely([f for f in file_index[direc] if channel in f])
 
-            imglist = nikon_getfiles(direc, channel)
-
-            for i, img in enumerate(imglist):
-                if i >= num_frames:
-                    print('Skipped final {skip} frames of {dir}, as num_frames '
-                          'is {num} but there are {total} total frames'.format(
-                              skip=len(imglist) - num_frames,
-                              dir=direc,
-                              num=num_frames,
-                              total=len(imglist)))
-                    break
+            if len(imglist) > num_frames:
+                print('Skipped final {skip} frames of {dir}, as num_frames '
+                      'is {num} but there are {total} total frames'.format(
+                          skip=len(imglist) - num_frames,
+                          dir=direc,
+                          num=num_frames,
+                          total=len(imglist)))
 
-                image_data = np.asarray(get_image(os.path.join(direc, img)))
-
-                if is_channels_first:
-                    X[b, c, i, :, :] = image_data
-                else:
-                    X[b, i, :, :, c] = image_data
+            for i, img in enumerate(imglist[:num_frames]):
+                index = (b, c, i) if is_channels_first else (b, i, slice(None), slice(None), c)
+                tasks.append((index, os.path.join(direc, img)))
 
-    return X
+    return load_images_into(X, tasks, num_workers=num_workers,
+                            use_processes=use_processes)
 
 
 def load_annotated_images_3d(direc_name,
@@ -747,7 +885,9 @@ def load_annotated_images_3d(direc_name,
                              annotation_name,
                              image_size,
                              num_frames,
-                             montage_mode=False):
+                             montage_mode=False,
+                             num_workers=4,
+                             use_processes=False):
     """Load each annotated image in the training_direcs into a numpy array.
 
     Args:
@@ -762,6 +902,8 @@ def load_annotated_images_3d(direc_name,
         num_frames (int): number of frames to load from each training directory
         montage_mode (bool): load masks from "montaged" subdirs
             inside annotation_direc
+        num_workers (int): number of threads or processes decoding images
+        use_processes (bool): whether to decode images in processes
 
     Returns:
         numpy.array: 5D tensor of image label masks
@@ -785,27 +927,28 @@ def load_annotated_images_3d(direc_name,
 
     y = np.zeros(y_shape, dtype='int32')
 
+    # Index each directory once
+    file_index = get_file_index(y_dirs)
+
+    tasks = []
     for b, direc in enumerate(y_dirs):
         for c, name in enumerate(annotation_name):
-            imglist = nikon_getfiles(direc, name)
-
-            for z, img_file in enumerate(imglist):
-                if z >= num_frames:
-                    print('Skipped final {skip} frames of {dir}, as num_frames '
-                          'is {num} but there are {total} total frames'.format(
-                              skip=len(imglist) - num_frames,
-                              dir=direc,
-                              num=num_frames,
-                              total=len(imglist)))
-                    break
-
-                annotation_img = get_image(os.path.join(direc, img_file))
-                if is_channels_first:
-                    y[b, c, z, :, :] = annotation_img
-                else:
-                    y[b, z, :, :, c] = annotation_img
+            imglist = sorted_nicely([f for f in file_index[direc] if name in f])
 
-    return y
+            if len(imglist) > num_frames:
+                print('Skipped final {skip} frames of {dir}, as num_frames '
+                      'is {num} but there are {total} total frames'.format(
+                          skip=len(imglist) - num_frames,
+                          dir=direc,
+                          num=num_frames,
+                          total=len(imglist)))
+
+            for z, img_file in enumerate(imglist[:num_frames]):
+                index = (b, c, z) if is_channels_first else (b, z, slice(None), slice(None), c)
+                tasks.append((index, os.path.join(direc, img_file)))
+
+    return load_images_into(y, tasks, num_workers=num_workers,
+                            use_processes=use_processes)
 
 
 def make_training_data_3d(direc_name,
@@ -817,7 +960,10 @@ def make_training_data_3d(direc_name,
                           annotation_direc='annotated',
                           reshape_size=None,
                           num_frames=None,
-                          montage_mode=True):
+                          montage_mode=True,
+                          num_workers=4,
+                          use_processes=False,
+                          chunk_size=None):
     """Read all images in training directories and save as npz file.
     3D image sets are "stacks" of images. For annotation purposes, these images
     have been sliced into "montages", where a section of each stack has been
@@ -843,6 +989,13 @@ def make_training_data_3d(direc_name,
         num_frames (int): number of frames to load from each training directory
         montage_mode (bool): load masks from "montaged" subdirs
             inside annotation_direc
+        num_workers (int): number of threads or processes decoding images.
+            If 0, the images are decoded serially.
+        use_processes (bool): whether to decode images in a pool of
+            processes instead of threads.
+        chunk_size (int): If provided, file_name_save is written as a
+            chunked dataset directory with chunk_size samples per file,
+            which can be read lazily by ``get_data``.
     """
     # Load one file to get image sizes
     rand_train_dir = os.path.join(direc_name, random.choice(training_direcs), raw_image_direc)
@@ -869,20 +1022,27 @@ def make_training_data_3d(direc_name,
                                 channel_names=channel_names,
                                 image_size=image_size,
                                 num_frames=num_frames,
-                                montage_mode=montage_mode)
+                                montage_mode=montage_mode,
+                                num_workers=num_workers,
+                                use_processes=use_processes)
 
     y = load_annotated_images_3d(direc_name, training_direcs,
                                  annotation_direc=annotation_direc,
                                  annotation_name=annotation_name,
                                  image_size=image_size,
                                  num_frames=num_frames,
-                                 montage_mode=montage_mode)
+                                 montage_mode=montage_mode,
+                                 num_workers=num_workers,
+                                 use_processes=use_processes)
 
     # Reshape X and y
     if reshape_size is not None:
         X, y = reshape_movie(X, y, reshape_size=reshape_size)
 
-    np.savez(file_name_save, X=X, y=y)
+    if chunk_size is not None:
+        save_chunked(file_name_save, chunk_size=chunk_size, X=X, y=y)
+    else:
+        np.savez(file_name_save, X=X, y=y)
 
 
 def make_training_data(direc_name,
@@ -918,7 +1078,10 @@ def make_training_data(direc_name,
                               reshape_size=reshape_size,
                               raw_image_direc=raw_image_direc,
                               annotation_name=annotation_name,
-                              annotation_direc=annotation_direc)
+                              annotation_direc=annotation_direc,
+                              num_workers=kwargs.get('num_workers', 4),
+                              use_processes=kwargs.get('use_processes', False),
+                              chunk_size=kwargs.get('chunk_size'))
 
     elif dimensionality == 3:
         make_training_data_3d(direc_name, file_name_save, channel_names,
@@ -928,7 +1091,10 @@ def make_training_data(direc_name,
                               annotation_direc=annotation_direc,
                               reshape_size=reshape_size,
                               montage_mode=kwargs.get('montage_mode', False),
-                              num_frames=kwargs.get('num_frames', 50))
+                              num_frames=kwargs.get('num_frames', 50),
+                              num_workers=kwargs.get('num_workers', 4),
+                              use_processes=kwargs.get('use_processes', False),
+                              chunk_size=kwargs.get('chunk_size'))
 
     else:
         raise NotImplementedError('make_training_data is not implemented for '
@@ -36,6 +36,7 @@ import tempfile
 import numpy as np
 from tensorflow.python.keras import backend as K
 from tensorflow.python.platform import test
+from skimage.external import tifffile as tiff
 
 from deepcell.utils import data_utils
 
@@ -93,6 +94,15 @@ class TestDataUtils(test.TestCase):
         with self.assertRaises(KeyError):
             _, _ = data_utils.get_data(bad_file)
 
+        # test lazy split of a memory-mapped file
+        lazy_train, lazy_test = data_utils.get_data(
+            good_file, test_size=test_size, lazy=True)
+        for k in ('X', 'y'):
+            self.assertIsInstance(lazy_train[k], data_utils.IndexedArray)
+            self.assertIsInstance(lazy_train[k].data, np.memmap)
+            self.assertAllEqual(np.asarray(lazy_train[k]), train_dict[k])
+            self.assertAllEqual(np.asarray(lazy_test[k]), test_dict[k])
+
         # test siamese_daughters mode
         good_file = os.path.join(temp_dir, 'siamese.trks')
         self._write_test_trks(good_file)
@@ -112,6 +122,135 @@ class TestDataUtils(test.TestCase):
         self.assertEqual(len(d_test), X_test.shape[0])
         self.assertAlmostEqual(X_test.size / (X_test.size + X_train.size), test_size)
 
+        lazy_train, lazy_test = data_utils.get_data(
+            good_file, mode='siamese_daughters', test_size=test_size,
+            lazy=True)
+        self.assertEqual(lazy_train['daughters'], d_train)
+        self.assertEqual(lazy_test['daughters'], d_test)
+        self.assertAllEqual(np.asarray(lazy_train['X']), X_train)
+        self.assertAllEqual(np.asarray(lazy_test['y']), test_dict['y'])
+
+    def test_get_data_chunked(self):
+        test_size = .2
+        X = np.random.random((10, 30, 30, 1))
+        y = np.random.randint(3, size=(10, 30, 30, 1))
+
+        temp_dir = self.get_temp_dir()
+        npz_file = os.path.join(temp_dir, 'data.npz')
+        chunked_dir = os.path.join(temp_dir, 'chunked')
+        np.savez(npz_file, X=X, y=y)
+        data_utils.save_chunked(chunked_dir, chunk_size=3, X=X, y=y)
+
+        train_dict, test_dict = data_utils.get_data(
+            chunked_dir, test_size=test_size)
+        npz_train, npz_test = data_utils.get_data(
+            npz_file, test_size=test_size)
+
+        # the split is the same as for the npz file
+        for k in ('X', 'y'):
+            self.assertEqual(train_dict[k].shape, npz_train[k].shape)
+            self.assertEqual(test_dict[k].shape, npz_test[k].shape)
+            self.assertAllEqual(np.asarray(train_dict[k]), npz_train[k])
+            self.assertAllEqual(np.asarray(test_dict[k]), npz_test[k])
+
+        train_index, test_index = data_utils.train_test_split_indices(10, .2)
+        self.assertEqual(len(test_index), 2)
+        self.assertEqual(len(train_index), 8)
+        self.assertEqual(len(set(train_index) | set(test_index)), 10)
+
+    def test_load_images_into(self):
+        images = np.random.randint(255, size=(2, 3, 16, 12)).astype('float32')
+        direc_name = os.path.join(self.get_temp_dir(), 'load_images_into')
+        os.makedirs(direc_name)
+
+        tasks = []
+        for b in range(images.shape[0]):
+            for c in range(images.shape[1]):
+                path = os.path.join(direc_name, 'img_{}_{}.tif'.format(b, c))
+                tiff.imsave(path, images[b, c])
+                # the indices of channels_last arrays must be picklable
+                tasks.append(((b, slice(None), slice(None), c), path))
+
+        expected = np.moveaxis(images, 1, -1)
+        for num_workers, use_processes in ((0, False), (2, False), (2, True)):
+            X = data_utils.load_images_into(
+                np.zeros(expected.shape, dtype='float32'), tasks,
+                num_workers=num_workers,
+                use_processes=use_processes)
+            self.assertAllEqual(X, expected)
+
+    def test_make_training_data(self):
+        K.set_image_data_format('channels_last')
+        num_direcs, num_frames, img_w, img_h = 3, 4, 16, 12
+        channels = ['nuclear', 'phase']
+        direc_name = os.path.join(self.get_temp_dir(), 'training_data')
+
+        X = np.random.randint(255, size=(num_direcs, num_frames, img_w, img_h, 2))
+        y = np.random.randint(10, size=(num_direcs, num_frames, img_w, img_h, 1))
+
+        for b in range(num_direcs):
+            for direc in ('raw', 'annotated'):
+                os.makedirs(os.path.join(direc_name, 'set{}'.format(b), direc))
+            for z in range(num_frames):
+                for c, channel in enumerate(channels):
+                    tiff.imsave(os.path.join(
+                        direc_name, 'set{}'.format(b), 'raw',
+                        'img_{}_{}.tif'.format(z, channel)),
+                        X[b, z, ..., c].astype('float32'))
+                tiff.imsave(os.path.join(
+                    direc_name, 'set{}'.format(b), 'annotated',
+                    'feature_{}.tif'.format(z)),
+                    y[b, z, ..., 0].astype('float32'))
+
+        training_direcs = ['set{}'.format(b) for b in range(num_direcs)]
+
+        for num_workers, use_processes in ((0, False), (2, False), (2, True)):
+            X_3d = data_utils.load_training_images_3d(
+                direc_name, training_direcs, 'raw', channels,
+                image_size=(img_w, img_h),
+                num_frames=num_frames - 1,
+                num_workers=num_workers,
+                use_processes=use_processes)
+            self.assertAllEqual(X_3d, X[:, :-1])
+
+            y_3d = data_utils.load_annotated_images_3d(
+                direc_name, training_direcs, 'annotated', 'feature',
+                image_size=(img_w, img_h),
+                num_frames=num_frames - 1,
+                num_workers=num_workers,
+                use_processes=use_processes)
+            self.assertEqual(y_3d.dtype, np.int32)
+            self.assertAllEqual(y_3d, y[:, :-1])
+
+            # only the last frame matches these names
+            names = ['img_{}_{}'.format(num_frames - 1, c) for c in channels]
+            X_2d = data_utils.load_training_images_2d(
+                direc_name, training_direcs, 'raw', names,
+                image_size=(img_w, img_h),
+                num_workers=num_workers,
+                use_processes=use_processes)
+            self.assertAllEqual(X_2d, X[:, -1])
+
+            y_2d = data_utils.load_annotated_images_2d(
+                direc_name, training_direcs, 'annotated',
+                'feature_{}'.format(num_frames - 1),
+                image_size=(img_w, img_h),
+                num_workers=num_workers,
+                use_processes=use_processes)
+            self.assertAllEqual(y_2d, y[:, -1])
+
+        file_name = os.path.join(self.get_temp_dir(), 'training_data.npz')
+        data_utils.make_training_data(
+            direc_name, file_name, channels,
+            dimensionality=3,
+            annotation_name='feature',
+            num_frames=num_frames,
+            num_workers=2)
+
+        data = np.load(file_name)
+        self.assertAllEqual(data['X'], X)
+        self.assertAllEqual(data['y'], y)
+
     def test_load_trks(self):
         temp_dir = self.get_temp_dir()
         good_file = os.path.join(temp_dir, 'siamese.trks')
@@ -339,6 +478,7 @@ class TestDataUtils(test.TestCase):
         y = np.array([[0, 3, 5], [4, 99, 123]])
         relabeled = data_utils.relabel_movie(y)
         self.assertAllEqual(relabeled, np.array([[0, 1, 3], [2, 4, 5]]))
+        self.assertEqual(relabeled.dtype, y.dtype)
 
     def test_reshape_movie(self):
         K.set_image_data_format('channels_last')
@@ -30,15 +30,593 @@ from __future__ import print_function
 from __future__ import division
 
 import os
+import re
+import shutil
+import tempfile
+import timeit
 
+import numpy as np
 import tensorflow as tf
+from tensorflow.core.protobuf import config_pb2
+from tensorflow.core.protobuf import meta_graph_pb2
+from tensorflow.core.protobuf import rewriter_config_pb2
+from tensorflow.python.framework import graph_util
+from tensorflow.python.framework import tensor_util
+from tensorflow.python.grappler import tf_optimizer
 from tensorflow.python.keras import backend as K
+from tensorflow.python.platform import tf_logging as logging
 from tensorflow.python.saved_model import tag_constants
 from tensorflow.python.saved_model import signature_constants
 from tensorflow.python.saved_model.builder import SavedModelBuilder
+from tensorflow.python.training import saver as tf_saver
+from tensorflow.tools.graph_transforms import TransformGraph
 
+from deepcell.utils.io_utils import get_npz_memmap
 
-def export_model(keras_model, export_path, model_version=0, weights_path=None):
+
+# Grappler passes run on the frozen graph. The loop optimizer removes the
+# branches of Switch nodes with a constant predicate (e.g. the training
+# branches of BatchNormalization and Dropout).
+GRAPPLER_OPTIMIZERS = [
+    'constfold',
+    'loop',
+    'dependency',
+    'arithmetic',
+    'constfold',
+]
+
+# Graph transforms run after grappler, folding BatchNormalization into the
+# preceding convolutions and any remaining constant subgraphs, such as the
+# ImageNormalization2D kernels and the Location2D grids.
+GRAPH_TRANSFORMS = [
+    'remove_nodes(op=Identity, op=CheckNumerics)',
+    'fold_constants(ignore_errors=true)',
+    'fold_batch_norms',
+    'fold_old_batch_norms',
+    'fold_constants(ignore_errors=true)',
+    'sort_by_execution_order',
+]
+
+
+def _get_node_name(tensor_name):
+    """Get the name of the node that produces a tensor"""
+    return tensor_name.split(':')[0]
+
+
+def _get_signature_keys(signature_map):
+    """Get the keys of a signature map in the order of their index.
+
+    Keys such as ``input10`` are sorted after ``input2``, so the order
+    matches the order of the model inputs or outputs.
+    """
+    def _key(name):
+        match = re.match(r'^(.*?)(\d*)$', name)
+        return match.group(1), int(match.group(2) or -1)
+
+    return sorted(signature_map, key=_key)
+
+
+def get_signature_maps(keras_model, dynamic_spatial_dims=False):
+    """Get the inputs and outputs of the serving signature of a model.
+
+    The batch dimension of each input is always dynamic. If the model
+    was built with a fixed batch size or if ``dynamic_spatial_dims``
+    is set, the model is called on new input placeholders.
+
+    Args:
+        keras_model (tensorflow.keras.Model): model to export
+        dynamic_spatial_dims (bool): whether to also leave every dimension
+            but the channel dimension undefined, so the exported model can
+            predict images of any size.
+
+    Returns:
+        tuple: dictionaries of the input and output tensors by their
+            signature names.
+    """
+    inputs = list(keras_model.inputs)
+    outputs = keras_model.output
+
+    serving_inputs = []
+    for tensor in inputs:
+        shape = tensor.shape.as_list()
+        shape[0] = None
+        if dynamic_spatial_dims:
+            channel_axis = 1 if K.image_data_format() == 'channels_first' else -1
+            shape = [d if i == channel_axis % len(shape) else None
+                     for i, d in enumerate(shape)]
+
+        if shape == tensor.shape.as_list():
+            serving_inputs.append(tensor)
+        else:
+            serving_inputs.append(tf.placeholder(tensor.dtype, shape=shape))
+
+    if any(x is not y for x, y in zip(inputs, serving_inputs)):
+        outputs = keras_model(serving_inputs if len(inputs) > 1
+                              else serving_inputs[0])
+
+    # Export for tracking
+    if len(serving_inputs) > 1:
+        input_map = {"input{}".format(i): input_tensor
+                     for i, input_tensor in enumerate(serving_inputs)}
+        output_map = {'output': outputs}
+    # Export for panoptic
+    elif isinstance(outputs, list):
+        input_map = {'image': serving_inputs[0]}
+        output_map = {'prediction{}'.format(i): tensor
+                      for i, tensor in enumerate(outputs)}
+    # Export for normal model architectures
+    else:
+        input_map = {"image": serving_inputs[0]}
+        output_map = {"prediction": outputs}
+    return input_map, output_map
+
+
+def freeze_graph(sess, output_names):
+    """Convert the variables of a session graph to constants.
+
+    The Keras learning phase is replaced with a constant ``False``,
+    so that the training-only branches can be removed.
+
+    Args:
+        sess (tensorflow.Session): session with the initialized model
+        output_names (list): names of the output tensors
+
+    Returns:
+        tensorflow.GraphDef: frozen graph of the nodes needed by the outputs
+    """
+    output_nodes = [_get_node_name(n) for n in output_names]
+    graph_def = graph_util.convert_variables_to_constants(
+        sess, sess.graph.as_graph_def(), output_nodes)
+
+    for node in graph_def.node:
+        if node.name == 'keras_learning_phase':
+            node.op = 'Const'
+            del node.input[:]
+            for key in list(node.attr):
+                del node.attr[key]
+            node.attr['dtype'].type = tf.bool.as_datatype_enum
+            node.attr['value'].tensor.CopyFrom(
+                tensor_util.make_tensor_proto(False, dtype=tf.bool))
+
+    return graph_util.extract_sub_graph(graph_def, output_nodes)
+
+
+def optimize_graph(graph_def, input_names, output_names):
+    """Optimize a frozen graph for inference.
+
+    Removes the dead branches and training-only nodes, folds constant
+    subgraphs and folds BatchNormalization into the preceding convolutions.
+
+    Args:
+        graph_def (tensorflow.GraphDef): frozen graph
+        input_names (list): names of the input tensors
+        output_names (list): names of the output tensors
+
+    Returns:
+        tensorflow.GraphDef: optimized graph
+    """
+    output_nodes = [_get_node_name(n) for n in output_names]
+
+    with tf.Graph().as_default() as graph:
+        tf.import_graph_def(graph_def, name='')
+        meta_graph = tf_saver.export_meta_graph(
+            graph_def=graph.as_graph_def(), graph=graph)
+
+    # grappler keeps the nodes in the train_op collection
+    fetches = meta_graph_pb2.CollectionDef()
+    fetches.node_list.value.extend(output_names)
+    meta_graph.collection_def['train_op'].CopyFrom(fetches)
+
+    config = config_pb2.ConfigProto()
+    rewrite_options = config.graph_options.rewrite_options
+    rewrite_options.optimizers.extend(GRAPPLER_OPTIMIZERS)
+    rewrite_options.meta_optimizer_iterations = (
+        rewriter_config_pb2.RewriterConfig.TWO)
+
+    graph_def = tf_optimizer.OptimizeGraph(config, meta_graph)
+
+    graph_def = TransformGraph(
+        graph_def,
+        [_get_node_name(n) for n in input_names],
+        output_nodes,
+        GRAPH_TRANSFORMS)
+
+    return graph_util.extract_sub_graph(graph_def, output_nodes)
+
+
+def get_graph_latency(graph_def, input_names, output_names, sample_input,
+                      num_runs=10):
+    """Get the average CPU latency of a frozen graph.
+
+    Args:
+        graph_def (tensorflow.GraphDef): frozen graph
+        input_names (list): names of the input tensors
+        output_names (list): names of the output tensors
+        sample_input (list): sample data for each input tensor
+        num_runs (int): number of timed runs, after one warm-up run
+
+    Returns:
+        float: average seconds per run
+    """
+    config = tf.ConfigProto(device_count={'GPU': 0})
+    with tf.Graph().as_default() as graph:
+        tf.import_graph_def(graph_def, name='')
+        with tf.Session(graph=graph, config=config) as sess:
+            feed_dict = {graph.get_tensor_by_name(n): x
+                         for n, x in zip(input_names, sample_input)}
+            fetches = [graph.get_tensor_by_name(n) for n in output_names]
+
+            sess.run(fetches, feed_dict=feed_dict)  # warm up
+
+            start = timeit.default_timer()
+            for _ in range(num_runs):
+                sess.run(fetches, feed_dict=feed_dict)
+            return (timeit.default_timer() - start) / num_runs
+
+
+def run_graph(graph_def, input_names, output_names, inputs, batch_size=4):
+    """Run a frozen graph on the CPU in batches.
+
+    Args:
+        graph_def (tensorflow.GraphDef): frozen graph
+        input_names (list): names of the input tensors
+        output_names (list): names of the output tensors
+        inputs (list): data for each input tensor
+        batch_size (int): number of samples in each run
+
+    Returns:
+        list: the values of each output tensor for all samples
+    """
+    config = tf.ConfigProto(device_count={'GPU': 0})
+    with tf.Graph().as_default() as graph:
+        tf.import_graph_def(graph_def, name='')
+        with tf.Session(graph=graph, config=config) as sess:
+            fetches = [graph.get_tensor_by_name(n) for n in output_names]
+            outputs = []
+            for i in range(0, len(inputs[0]), batch_size):
+                feed_dict = {graph.get_tensor_by_name(n): x[i:i + batch_size]
+                             for n, x in zip(input_names, inputs)}
+                outputs.append(sess.run(fetches, feed_dict=feed_dict))
+
+    return [np.concatenate([o[j] for o in outputs], axis=0)
+            for j in range(len(output_names))]
+
+
+def convert_weights_to_float16(graph_def, min_size=16):
+    """Store the float32 constants of a frozen graph as float16.
+
+    Each constant is cast back to float32 when the graph is run, so the
+    weights take half the space without changing any other node.
+
+    Args:
+        graph_def (tensorflow.GraphDef): frozen graph
+        min_size (int): smallest constant to convert, so that scalars
+            such as epsilon values are kept exact.
+
+    Returns:
+        tensorflow.GraphDef: graph with float16 weights
+    """
+    float32 = tf.float32.as_datatype_enum
+    float16 = tf.float16.as_datatype_enum
+
+    converted = tf.GraphDef()
+    converted.versions.CopyFrom(graph_def.versions)
+    converted.library.CopyFrom(graph_def.library)
+
+    for node in graph_def.node:
+        if node.op == 'Const' and node.attr['dtype'].type == float32:
+            value = tensor_util.MakeNdarray(node.attr['value'].tensor)
+            if value.size >= min_size:
+                weights = converted.node.add()
+                weights.op = 'Const'
+                weights.name = '{}/float16'.format(node.name)
+                weights.attr['dtype'].type = float16
+                weights.attr['value'].tensor.CopyFrom(
+                    tensor_util.make_tensor_proto(value.astype('float16')))
+
+                # the cast keeps the name, so the consumers are unchanged
+                cast = converted.node.add()
+                cast.op = 'Cast'
+                cast.name = node.name
+                cast.input.append(weights.name)
+                cast.attr['SrcT'].type = float16
+                cast.attr['DstT'].type = float32
+                continue
+
+        converted.node.extend([node])
+
+    return converted
+
+
+def quantize_graph_int8(graph_def, input_names, output_names,
+                        calibration_inputs, batch_size=4):
+    """Quantize the weights and activations of a frozen graph to 8 bits.
+
+    Supported nodes (e.g. convolutions and activations) are converted to
+    their quantized versions. The ranges of the quantized activations are
+    calibrated on representative data and frozen into the graph.
+
+    Args:
+        graph_def (tensorflow.GraphDef): frozen graph
+        input_names (list): names of the input tensors
+        output_names (list): names of the output tensors
+        calibration_inputs (list): representative data for each input
+        batch_size (int): number of samples in each calibration run
+
+    Returns:
+        tensorflow.GraphDef: quantized graph
+    """
+    input_nodes = [_get_node_name(n) for n in input_names]
+    output_nodes = [_get_node_name(n) for n in output_names]
+
+    graph_def = TransformGraph(graph_def, input_nodes, output_nodes, [
+        'quantize_weights',
+        'quantize_nodes',
+    ])
+
+    range_nodes = [n.name for n in graph_def.node
+                   if n.op == 'RequantizationRange']
+    if not range_nodes:
+        return graph_def
+
+    range_names = ['{}:{}'.format(n, i) for n in range_nodes for i in (0, 1)]
+    ranges = run_graph(graph_def, input_names, range_names,
+                       calibration_inputs, batch_size=batch_size)
+
+    # freeze_requantization_ranges reads the format written by the
+    # insert_logging transform.
+    log_dir = tempfile.mkdtemp()
+    log_file = os.path.join(log_dir, 'requantization_ranges.log')
+    try:
+        with open(log_file, 'w') as f:
+            for i, name in enumerate(range_nodes):
+                f.write(';{}__print__;__requant_min_max:[{:.9g}][{:.9g}]\n'.format(
+                    name, ranges[2 * i].min(), ranges[2 * i + 1].max()))
+
+        graph_def = TransformGraph(graph_def, input_nodes, output_nodes, [
+            'freeze_requantization_ranges(min_max_log_file="{}")'.format(log_file),
+            'fold_constants(ignore_errors=true)',
+        ])
+    finally:
+        shutil.rmtree(log_dir)
+
+    return graph_def
+
+
+def load_calibration_data(calibration_file, num_samples=32, seed=0):
+    """Draw a random sample of images and labels from an npz file.
+
+    Args:
+        calibration_file (str): path to an npz file with X and y arrays
+        num_samples (int): number of images in the sample
+        seed (int): random seed for choosing the images
+
+    Returns:
+        tuple: the sampled X and y arrays
+    """
+    # only the sampled images are read from the file
+    arrays = get_npz_memmap(calibration_file)
+    X, y = arrays['X'], arrays['y']
+
+    num_samples = min(num_samples, X.shape[0])
+    index = np.sort(np.random.RandomState(seed).choice(
+        X.shape[0], num_samples, replace=False))
+    return X[index], y[index]
+
+
+def get_object_scores(y_true, y_pred):
+    """Get the object detection scores of labeled predictions.
+
+    Args:
+        y_true (numpy.array): labeled ground truth, (sample, x, y)
+        y_pred (numpy.array): labeled predictions, (sample, x, y)
+
+    Returns:
+        dict: the recall, precision, f1 and mean jaccard index
+    """
+    # deepcell.metrics imports scikit-learn and pandas, which are only
+    # needed to check the accuracy of quantized graphs
+    from deepcell.metrics import Metrics
+
+    metrics = Metrics('quantization')
+    metrics.calc_object_stats(y_true, y_pred)
+    stats = metrics.stats
+
+    correct = stats['correct_detections'].sum()
+    recall = correct / max(stats['n_true'].sum(), 1)
+    precision = correct / max(stats['n_pred'].sum(), 1)
+    if precision + recall > 0:
+        f1 = 2 * precision * recall / (precision + recall)
+    else:
+        f1 = 0.
+
+    return {
+        'recall': float(recall),
+        'precision': float(precision),
+        'f1': float(f1),
+        'jaccard': float(stats['jaccard'].mean()),
+    }
+
+
+def check_quantized_accuracy(graph_def,
+                             quantized_graph_def,
+                             input_names,
+                             output_names,
+                             X,
+                             y,
+                             postprocessing_fn,
+                             output_index=-1,
+                             score='f1',
+                             max_degradation=0.01):
+    """Compare the object scores of a float and a quantized graph.
+
+    Args:
+        graph_def (tensorflow.GraphDef): frozen float graph
+        quantized_graph_def (tensorflow.GraphDef): frozen quantized graph
+        input_names (list): names of the input tensors
+        output_names (list): names of the output tensors
+        X (numpy.array): sample images
+        y (numpy.array): labeled ground truth of the sample images
+        postprocessing_fn (function): converts the output of each image
+            into a label mask, e.g. ``deepcell_toolbox.pixelwise``.
+        output_index (int): index of the output to post-process
+        score (str): score used to compare the graphs,
+            one of {'recall', 'precision', 'f1', 'jaccard'}.
+        max_degradation (float): largest allowed drop in the score
+
+    Returns:
+        tuple: the scores of the float and quantized graphs
+
+    Raises:
+        ValueError: the score drops by more than max_degradation
+    """
+    if y.ndim == 4:
+        channel_axis = 1 if K.image_data_format() == 'channels_first' else -1
+        y = np.squeeze(y, axis=channel_axis)
+
+    all_scores = []
+    for graph in (graph_def, quantized_graph_def):
+        outputs = run_graph(graph, input_names, output_names, [X])
+        labels = np.stack([np.squeeze(postprocessing_fn(o))
+                           for o in outputs[output_index]], axis=0)
+        all_scores.append(get_object_scores(y, labels.astype(y.dtype)))
+
+    float_scores, quantized_scores = all_scores
+    logging.info('Quantization changed the %s score from %.4f to %.4f.',
+                 score, float_scores[score], quantized_scores[score])
+
+    if float_scores[score] - quantized_scores[score] > max_degradation:
+        raise ValueError('Quantization reduced the {} score from {:.4f} to '
+                         '{:.4f}, more than `max_degradation` {}.'.format(
+                             score, float_scores[score],
+                             quantized_scores[score], max_degradation))
+
+    return float_scores, quantized_scores
+
+
+def _save_graph(builder, graph_def, input_map, output_map):
+    """Add a frozen graph to a SavedModelBuilder"""
+    with tf.Graph().as_default() as graph:
+        tf.import_graph_def(graph_def, name='')
+        with tf.Session(graph=graph) as sess:
+            prediction_signature = tf.saved_model.signature_def_utils.predict_signature_def(
+                {k: graph.get_tensor_by_name(v) for k, v in input_map.items()},
+                {k: graph.get_tensor_by_name(v) for k, v in output_map.items()}
+            )
+
+            builder.add_meta_graph_and_variables(
+                sess, [tag_constants.SERVING],
+                signature_def_map={
+                    signature_constants.DEFAULT_SERVING_SIGNATURE_DEF_KEY:
+                        prediction_signature
+                })
+
+
+def _encode_varint(value):
+    """Encode an integer as a protobuf varint"""
+    encoded = bytearray()
+    while True:
+        bits = value & 0x7f
+        value >>= 7
+        if value:
+            encoded.append(bits | 0x80)
+        else:
+            encoded.append(bits)
+            return bytes(encoded)
+
+
+def _encode_field(number, payload):
+    """Encode a length-delimited protobuf field"""
+    return _encode_varint(number << 3 | 2) + _encode_varint(len(payload)) + payload
+
+
+def get_warmup_request(inputs, model_name, signature_name=None):
+    """Serialize a tensorflow-serving PredictionLog of a PredictRequest.
+
+    The messages are encoded directly, to avoid depending on the
+    tensorflow-serving-api package just for these few fields.
+
+    Args:
+        inputs (dict): data of each input by its signature name
+        model_name (str): name of the served model
+        signature_name (str): name of the signature to predict with,
+            defaults to the default serving signature.
+
+    Returns:
+        bytes: the serialized PredictionLog
+    """
+    if signature_name is None:
+        signature_name = signature_constants.DEFAULT_SERVING_SIGNATURE_DEF_KEY
+
+    # ModelSpec: name = 1, signature_name = 3
+    model_spec = (_encode_field(1, model_name.encode('utf-8')) +
+                  _encode_field(3, signature_name.encode('utf-8')))
+
+    # PredictRequest: model_spec = 1, inputs = 2 (map<string, TensorProto>)
+    request = _encode_field(1, model_spec)
+    for key in sorted(inputs):
+        tensor = tensor_util.make_tensor_proto(inputs[key])
+        request += _encode_field(2, (
+            _encode_field(1, key.encode('utf-8')) +
+            _encode_field(2, tensor.SerializeToString())))
+
+    # PredictionLog: predict_log = 6, PredictLog: request = 1
+    return _encode_field(6, _encode_field(1, request))
+
+
+def write_warmup_requests(export_path, inputs, model_name=None):
+    """Write the warm-up requests of a SavedModel for tensorflow-serving.
+
+    tensorflow-serving runs ``assets.extra/tf_serving_warmup_requests``
+    when it loads a model, so the first real requests are not slowed down
+    by graph initialization. A request is written for each sample, and one
+    for all of the samples to also warm up batched requests.
+
+    Args:
+        export_path (str): directory of the exported model version
+        inputs (dict): representative data of each input by its
+            signature name, with samples in the first dimension.
+        model_name (str): name of the served model, defaults to the name
+            of the parent directory of export_path.
+
+    Returns:
+        str: path of the warm-up requests file
+    """
+    if model_name is None:
+        model_name = os.path.basename(
+            os.path.dirname(os.path.abspath(export_path)))
+
+    assets_dir = os.path.join(export_path, 'assets.extra')
+    tf.gfile.MakeDirs(assets_dir)
+    warmup_file = os.path.join(assets_dir, 'tf_serving_warmup_requests')
+
+    num_samples = len(next(iter(inputs.values())))
+    batches = [slice(i, i + 1) for i in range(num_samples)]
+    if num_samples > 1:
+        batches.append(slice(0, num_samples))
+
+    with tf.python_io.TFRecordWriter(warmup_file) as writer:
+        for batch in batches:
+            writer.write(get_warmup_request(
+                {k: v[batch] for k, v in inputs.items()}, model_name))
+
+    return warmup_file
+
+
+def export_model(keras_model,
+                 export_path,
+                 model_version=0,
+                 weights_path=None,
+                 optimize=False,
+                 sample_input=None,
+                 quantize=None,
+                 calibration_file=None,
+                 postprocessing_fn=None,
+                 num_calibration_samples=32,
+                 max_degradation=0.01,
+                 dynamic_spatial_dims=False,
+                 warmup_inputs=None,
+                 output_index=-1):
     """Export a model for use with tensorflow-serving.
 
     Args:
@@ -46,7 +624,53 @@ def export_model(keras_model, export_path, model_version=0, weights_path=None):
         export_path (str): destination to save the exported model files
         model_version (int): integer version of the model
         weights_path (str): path to a .h5 or .tf weights file
+        optimize (bool): whether to export a frozen graph optimized for
+            inference, see ``optimize_graph``.
+        sample_input (numpy.array): optional sample data used to report
+            the CPU latency of the optimized graph. A list of arrays for
+            models with multiple inputs.
+        dynamic_spatial_dims (bool): whether the serving signature accepts
+            images of any size. The batch dimension is always dynamic.
+        warmup_inputs (numpy.array): optional representative samples
+            written as tensorflow-serving warm-up requests. A list of
+            arrays for models with multiple inputs.
+        quantize (str): optional post-training quantization of the
+            optimized graph, one of {'float16', 'int8'}. 'float16' stores
+            the weights as float16, 'int8' quantizes the weights and the
+            activations, calibrated on a sample of calibration_file.
+        calibration_file (str): npz file with X and y arrays, sampled to
+            calibrate and check the accuracy of the quantized graph.
+        postprocessing_fn (function): converts the output of each image
+            into a label mask, e.g. ``deepcell_toolbox.pixelwise``.
+        output_index (int): index of the model output passed to
+            postprocessing_fn, if the model has multiple outputs.
+        num_calibration_samples (int): number of images sampled from
+            calibration_file.
+        max_degradation (float): the export fails if quantization reduces
+            the object F1 score on the sample by more than this value.
+
+    Returns:
+        dict: if optimize, the node counts and the CPU latency (if
+            sample_input is given) before and after optimization, and
+            the object scores of the float and quantized graphs.
+
+    Raises:
+        ValueError: quantize is not a supported mode
+        ValueError: quantize is set without calibration_file or
+            postprocessing_fn
+        ValueError: quantization reduces the F1 score by more than
+            max_degradation
     """
+    if quantize is not None:
+        if quantize not in {'float16', 'int8'}:
+            raise ValueError('Expected `quantize` to be one of "float16" or '
+                             '"int8". Got {}.'.format(quantize))
+        if calibration_file is None or postprocessing_fn is None:
+            raise ValueError('`calibration_file` and `postprocessing_fn` are '
+                             'required to check the accuracy of a '
+                             'quantized model.')
+        optimize = True
+
     # Start the tensorflow session
     gpu_options = tf.GPUOptions(per_process_gpu_memory_fraction=0.8, allow_growth=False)
     sess = tf.Session(config=tf.ConfigProto(gpu_options=gpu_options))
@@ -57,7 +681,6 @@ def export_model(keras_model, export_path, model_version=0, weights_path=None):
 
     # Create export path if it doesn't exist
     export_path = os.path.join(export_path, str(model_version))
-    builder = SavedModelBuilder(export_path)
     # legacy_init_op = tf.group(tf.tables_initializer(), name='legacy_init_op')
 
     # Initialize global variables and the model
@@ -68,33 +691,86 @@ def export_model(keras_model, export_path, model_version=0, weights_path=None):
     if weights_path is not None:
         keras_model.load_weights(weights_path)
 
-    # Export for tracking
-    if isinstance(keras_model.input, list):
-        input_map = {"input{}".format(i): input_tensor
-                     for i, input_tensor in enumerate(keras_model.input)}
-        output_map = {'output': keras_model.output}
-    # Export for panoptic
-    elif isinstance(keras_model.output, list):
-        input_map = {'image': keras_model.input}
-        output_map = {'prediction{}'.format(i): tensor
-                      for i, tensor in enumerate(keras_model.output)}
-    # Export for normal model architectures
+    input_map, output_map = get_signature_maps(
+        keras_model, dynamic_spatial_dims=dynamic_spatial_dims)
+    input_dtypes = {k: v.dtype.as_numpy_dtype for k, v in input_map.items()}
+
+    report = None
+    if optimize:
+        input_map = {k: v.name for k, v in input_map.items()}
+        output_map = {k: v.name for k, v in output_map.items()}
+        input_names = [input_map[k] for k in _get_signature_keys(input_map)]
+        output_names = [output_map[k] for k in _get_signature_keys(output_map)]
+
+        frozen_graph_def = freeze_graph(sess, output_names)
+        graph_def = optimize_graph(frozen_graph_def, input_names, output_names)
+
+        report = {
+            'nodes_before': len(frozen_graph_def.node),
+            'nodes_after': len(graph_def.node),
+        }
+        logging.info('Optimized graph from %s to %s nodes.',
+                     report['nodes_before'], report['nodes_after'])
+
+        if sample_input is not None:
+            if not isinstance(sample_input, (list, tuple)):
+                sample_input = [sample_input]
+            sample_input = [np.asarray(x) for x in sample_input]
+
+            for key, graph in (('before', frozen_graph_def), ('after', graph_def)):
+                report['latency_{}'.format(key)] = get_graph_latency(
+                    graph, input_names, output_names, sample_input)
+
+            logging.info('CPU latency changed from %.4fs to %.4fs.',
+                         report['latency_before'], report['latency_after'])
+
+        if quantize is not None:
+            X, y = load_calibration_data(calibration_file,
+                                         num_samples=num_calibration_samples)
+
+            if quantize == 'int8':
+                quantized_graph_def = quantize_graph_int8(
+                    graph_def, input_names, output_names, [X])
+            else:
+                quantized_graph_def = convert_weights_to_float16(graph_def)
+
+            # refuse to export if the quantized graph is less accurate
+            scores, quantized_scores = check_quantized_accuracy(
+                graph_def, quantized_graph_def, input_names, output_names,
+                X, y, postprocessing_fn,
+                output_index=output_index,
+                max_degradation=max_degradation)
+
+            report['scores_float'] = scores
+            report['scores_quantized'] = quantized_scores
+            graph_def = quantized_graph_def
+
+        builder = SavedModelBuilder(export_path)
+        _save_graph(builder, graph_def, input_map, output_map)
+
     else:
-        input_map = {"image": keras_model.input}
-        output_map = {"prediction": keras_model.output}
-
-    prediction_signature = tf.saved_model.signature_def_utils.predict_signature_def(
-        input_map,
-        output_map
-    )
-
-    # Add the meta_graph and the variables to the builder
-    builder.add_meta_graph_and_variables(
-        sess, [tag_constants.SERVING],
-        signature_def_map={
-            signature_constants.DEFAULT_SERVING_SIGNATURE_DEF_KEY:
-                prediction_signature
-        })
+        builder = SavedModelBuilder(export_path)
+        prediction_signature = tf.saved_model.signature_def_utils.predict_signature_def(
+            input_map,
+            output_map
+        )
+
+        # Add the meta_graph and the variables to the builder
+        builder.add_meta_graph_and_variables(
+            sess, [tag_constants.SERVING],
+            signature_def_map={
+                signature_constants.DEFAULT_SERVING_SIGNATURE_DEF_KEY:
+                    prediction_signature
+            })
 
     # Save the graph
     builder.save()
+
+    if warmup_inputs is not None:
+        if not isinstance(warmup_inputs, (list, tuple)):
+            warmup_inputs = [warmup_inputs]
+        write_warmup_requests(export_path, {
+            k: np.asarray(x, dtype=input_dtypes[k])
+            for k, x in zip(_get_signature_keys(input_map), warmup_inputs)})
+
+    return report
@@ -0,0 +1,299 @@
+# Copyright 2016-2019 The Van Valen Lab at the California Institute of
+# Technology (Caltech), with support from the Paul Allen Family Foundation,
+# Google, & National Institutes of Health (NIH) under Grant U24CA224309-01.
+# All rights reserved.
+#
+# Licensed under a modified Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.github.com/vanvalenlab/deepcell-tf/LICENSE
+#
+# The Work provided may be used for non-commercial academic purposes only.
+# For any other use of the Work, including commercial use, please contact:
+# vanvalenlab@gmail.com
+#
+# Neither the name of Caltech nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for export_utils"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.python import keras
+from tensorflow.python.keras import backend as K
+from tensorflow.python.platform import test
+from tensorflow.python.saved_model import signature_constants
+from tensorflow.python.saved_model import tag_constants
+from skimage.measure import label
+
+from deepcell import layers
+from deepcell.utils import export_utils
+
+
+def _get_model(input_shape=(32, 32, 1)):
+    inputs = keras.layers.Input(shape=input_shape)
+    x = layers.ImageNormalization2D(norm_method='std', filter_size=7)(inputs)
+    loc = layers.Location2D(in_shape=input_shape)(x)
+    x = keras.layers.Concatenate(axis=-1)([x, loc])
+    x = keras.layers.Conv2D(4, 3, padding='same')(x)
+    x = keras.layers.BatchNormalization(axis=-1)(x)
+    x = keras.layers.Activation('relu')(x)
+    x = keras.layers.Dropout(0.5)(x)
+    outputs = layers.TensorProduct(3)(x)
+    return keras.models.Model(inputs=inputs, outputs=outputs)
+
+
+def _postprocess(prediction):
+    return label(prediction[..., -1] > prediction[..., -1].mean())
+
+
+def _get_frozen_graph(model):
+    input_names = [model.input.name]
+    output_names = [model.output.name]
+    frozen = export_utils.freeze_graph(K.get_session(), output_names)
+    optimized = export_utils.optimize_graph(frozen, input_names, output_names)
+    return optimized, input_names, output_names
+
+
+class ExportUtilsTest(test.TestCase):
+
+    def test_optimize_graph(self):
+        x = np.random.random((2, 32, 32, 1))
+
+        with self.cached_session():
+            model = _get_model()
+            expected = model.predict(x)
+
+            input_names = [model.input.name]
+            output_names = [model.output.name]
+
+            frozen = export_utils.freeze_graph(K.get_session(), output_names)
+            optimized = export_utils.optimize_graph(
+                frozen, input_names, output_names)
+
+        self.assertLess(len(optimized.node), len(frozen.node))
+        ops = {node.op for node in optimized.node}
+        self.assertNotIn('VariableV2', ops)
+        self.assertNotIn('Switch', ops)
+
+        for graph_def in (frozen, optimized):
+            with tf.Graph().as_default() as graph:
+                tf.import_graph_def(graph_def, name='')
+                with tf.Session(graph=graph) as sess:
+                    output = sess.run(output_names[0],
+                                      feed_dict={input_names[0]: x})
+            self.assertAllClose(output, expected, atol=1e-5)
+
+        latency = export_utils.get_graph_latency(
+            optimized, input_names, output_names, [x], num_runs=2)
+        self.assertGreater(latency, 0)
+
+    def test_export_model(self):
+        x = np.random.random((2, 32, 32, 1))
+        export_path = os.path.join(self.get_temp_dir(), 'export')
+
+        with tf.Graph().as_default():
+            model = _get_model()
+            report = export_utils.export_model(
+                model, export_path,
+                model_version=1,
+                optimize=True,
+                sample_input=x)
+            expected = model.predict(x)
+            K.clear_session()
+
+        self.assertLess(report['nodes_after'], report['nodes_before'])
+        self.assertGreater(report['latency_before'], 0)
+        self.assertGreater(report['latency_after'], 0)
+
+        with tf.Graph().as_default() as graph:
+            with tf.Session(graph=graph) as sess:
+                meta_graph = tf.saved_model.loader.load(
+                    sess, [tag_constants.SERVING],
+                    os.path.join(export_path, '1'))
+                signature = meta_graph.signature_def[
+                    signature_constants.DEFAULT_SERVING_SIGNATURE_DEF_KEY]
+
+                output = sess.run(
+                    signature.outputs['prediction'].name,
+                    feed_dict={signature.inputs['image'].name: x})
+
+        self.assertAllClose(output, expected, atol=1e-5)
+
+    def test_quantize_graph(self):
+        x = np.random.random((4, 32, 32, 1))
+
+        with self.cached_session():
+            model = _get_model()
+            expected = model.predict(x)
+            graph_def, input_names, output_names = _get_frozen_graph(model)
+
+        float16_graph = export_utils.convert_weights_to_float16(graph_def)
+        dtypes = {n.attr['dtype'].type for n in float16_graph.node
+                  if n.op == 'Const'}
+        self.assertIn(tf.float16.as_datatype_enum, dtypes)
+
+        int8_graph = export_utils.quantize_graph_int8(
+            graph_def, input_names, output_names, [x])
+        ops = {n.op for n in int8_graph.node}
+        self.assertNotIn('RequantizationRange', ops)
+
+        for graph, atol in ((float16_graph, 1e-2), (int8_graph, 1e-1)):
+            output = export_utils.run_graph(
+                graph, input_names, output_names, [x], batch_size=3)
+            self.assertAllClose(output[0], expected, atol=atol)
+
+    def test_check_quantized_accuracy(self):
+        x = np.random.random((4, 32, 32, 1))
+
+        with self.cached_session():
+            model = _get_model()
+            graph_def, input_names, output_names = _get_frozen_graph(model)
+
+        y = np.stack([_postprocess(o) for o in model.predict(x)])
+        y = np.expand_dims(y, axis=-1)
+
+        scores, quantized_scores = export_utils.check_quantized_accuracy(
+            graph_def, graph_def, input_names, output_names,
+            x, y, _postprocess)
+        self.assertEqual(scores, quantized_scores)
+        self.assertEqual(scores['f1'], 1)
+
+        with self.assertRaises(ValueError):
+            export_utils.check_quantized_accuracy(
+                graph_def, graph_def, input_names, output_names,
+                x, y, _postprocess, max_degradation=-1)
+
+    def test_load_calibration_data(self):
+        x = np.random.random((8, 32, 32, 1))
+        y = np.arange(8)
+        calibration_file = os.path.join(self.get_temp_dir(), 'sample.npz')
+        np.savez(calibration_file, X=x, y=y)
+
+        X_sample, y_sample = export_utils.load_calibration_data(
+            calibration_file, num_samples=3)
+        self.assertEqual(X_sample.shape, (3, 32, 32, 1))
+        self.assertAllEqual(X_sample, x[y_sample])
+
+        X_sample, _ = export_utils.load_calibration_data(
+            calibration_file, num_samples=20)
+        self.assertEqual(X_sample.shape, x.shape)
+
+    def test_export_quantized_model(self):
+        x = np.random.random((8, 32, 32, 1))
+        y = np.stack([label(i > 0.5) for i in x])
+        calibration_file = os.path.join(self.get_temp_dir(), 'data.npz')
+        np.savez(calibration_file, X=x, y=y)
+        export_path = os.path.join(self.get_temp_dir(), 'quantized')
+
+        with tf.Graph().as_default():
+            model = _get_model()
+
+            with self.assertRaises(ValueError):
+                export_utils.export_model(model, export_path, quantize='int4')
+            with self.assertRaises(ValueError):
+                export_utils.export_model(model, export_path, quantize='int8')
+
+            report = export_utils.export_model(
+                model, export_path,
+                quantize='float16',
+                calibration_file=calibration_file,
+                postprocessing_fn=_postprocess,
+                num_calibration_samples=4,
+                max_degradation=1,
+                output_index=0)
+            K.clear_session()
+
+        self.assertIn('scores_float', report)
+        self.assertIn('scores_quantized', report)
+        self.assertTrue(os.path.isdir(os.path.join(export_path, '0')))
+
+    def test_export_dynamic_model(self):
+        x = np.random.random((3, 32, 32, 1))
+        export_path = os.path.join(self.get_temp_dir(), 'dynamic')
+
+        for optimize in (False, True):
+            with tf.Graph().as_default():
+                inputs = keras.layers.Input(batch_shape=(1, 32, 32, 1))
+                x1 = keras.layers.Conv2D(4, 3, padding='same')(inputs)
+                x1 = keras.layers.BatchNormalization(axis=-1)(x1)
+                outputs = layers.TensorProduct(3)(x1)
+                model = keras.models.Model(inputs=inputs, outputs=outputs)
+
+                export_utils.export_model(
+                    model, export_path,
+                    model_version=int(optimize),
+                    optimize=optimize,
+                    dynamic_spatial_dims=True,
+                    warmup_inputs=x)
+                expected = model.predict(x, batch_size=1)
+                K.clear_session()
+
+            version_path = os.path.join(export_path, str(int(optimize)))
+            warmup_file = os.path.join(
+                version_path, 'assets.extra', 'tf_serving_warmup_requests')
+            records = list(tf.python_io.tf_record_iterator(warmup_file))
+            self.assertEqual(len(records), len(x) + 1)
+
+            with tf.Graph().as_default() as graph:
+                with tf.Session(graph=graph) as sess:
+                    meta_graph = tf.saved_model.loader.load(
+                        sess, [tag_constants.SERVING], version_path)
+                    signature = meta_graph.signature_def[
+                        signature_constants.DEFAULT_SERVING_SIGNATURE_DEF_KEY]
+
+                    dims = signature.inputs['image'].tensor_shape.dim
+                    self.assertEqual([d.size for d in dims], [-1, -1, -1, 1])
+
+                    # any batch size and image size
+                    output_name = signature.outputs['prediction'].name
+                    input_name = signature.inputs['image'].name
+                    output = sess.run(output_name, feed_dict={input_name: x})
+                    small = sess.run(output_name,
+                                     feed_dict={input_name: x[:2, :16, :16]})
+
+            self.assertAllClose(output, expected, atol=1e-5)
+            self.assertEqual(small.shape, (2, 16, 16, 3))
+
+    def test_get_warmup_request(self):
+        x = np.random.random((2, 8, 8, 1)).astype('float32')
+        request = export_utils.get_warmup_request({'image': x}, 'model')
+        self.assertEqual(request[:1], b'\x32')  # predict_log field
+
+        try:
+            from tensorflow_serving.apis import prediction_log_pb2
+        except ImportError:
+            return
+
+        log = prediction_log_pb2.PredictionLog.FromString(request)
+        predict_request = log.predict_log.request
+        self.assertEqual(predict_request.model_spec.name, 'model')
+        self.assertEqual(predict_request.model_spec.signature_name,
+                         'serving_default')
+        self.assertAllEqual(
+            tf.make_ndarray(predict_request.inputs['image']), x)
+
+    def test_get_signature_keys(self):
+        signature_map = {'prediction{}'.format(i): i for i in range(12)}
+        keys = export_utils._get_signature_keys(signature_map)
+        self.assertEqual([signature_map[k] for k in keys], list(range(12)))
+        self.assertEqual(export_utils._get_signature_keys({'image': 0}),
+                         ['image'])
+
+
+if __name__ == '__main__':
+    test.main()
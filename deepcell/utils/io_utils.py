@@ -30,12 +30,15 @@ from __future__ import print_function
 from __future__ import division
 
 import os
+import struct
+import zipfile
+
+from multiprocessing.pool import ThreadPool
 
 import numpy as np
 from skimage.io import imread
 from skimage.external import tifffile as tiff
 from skimage.external.tifffile import TiffFile
-from tensorflow.python.keras import backend as K
 
 from deepcell.utils.misc_utils import sorted_nicely
 
@@ -79,19 +82,142 @@ def count_image_files(directory, montage_mode=False):
     return min([count_images(d) for d in get_immediate_subdirs(directory)])
 
 
-def get_image(file_name):
+def _read_tiff_pages(tif, page=None, roi=None, dtype=None):
+    """Read some of the pages of an open TiffFile one page at a time.
+
+    Uncompressed pages are memory-mapped, so only the roi of each page is
+    read from disk. The pages are stacked in the first axis, unless page
+    is an int.
+    """
+    page_indices = np.arange(len(tif.pages))
+    page_indices = page_indices[slice(None) if page is None else page]
+
+    image = None
+    for i, index in enumerate(np.atleast_1d(page_indices)):
+        data = tif.pages[index].asarray(memmap=True)
+        if roi is not None:
+            data = data[tuple(roi)]
+
+        if page_indices.ndim == 0:
+            return np.asarray(data, dtype=dtype)
+
+        if image is None:
+            image = np.empty((page_indices.size,) + data.shape,
+                             dtype=data.dtype if dtype is None else dtype)
+        image[i] = data
+
+    return image
+
+
+def get_image(file_name, page=None, roi=None, dtype='float32'):
     """Read image from file and returns it as a tensor
 
+    If a page or roi is given, TIFF files are read one page at a time and
+    uncompressed pages are memory-mapped, so only the selected region of
+    the selected pages is read from disk.
+
     Args:
         file_name (str): path to image file
+        page (int): page of a multi-page TIFF file to read. A list or slice
+            of pages are read into a stack of pages. Defaults to all pages.
+        roi (tuple): slices of the rows and columns to read, e.g.
+            (slice(0, 256), slice(256, 512)). Defaults to the whole image.
+        dtype (str): dtype of the image data. If None, the dtype of the
+            file is kept.
 
     Returns:
         numpy.array: numpy array of image data
+
+    Raises:
+        ValueError: page is given for a file that is not a TIFF file
+    """
+    ext = os.path.splitext(file_name.lower())[-1]
+    if ext == '.tif' or ext == '.tiff':
+        with TiffFile(file_name) as tif:
+            if page is None and roi is None:
+                image = tif.asarray()
+            else:
+                return _read_tiff_pages(tif, page=page, roi=roi, dtype=dtype)
+    else:
+        if page is not None:
+            raise ValueError('`page` can only be read from TIFF files. '
+                             'Got {}'.format(file_name))
+        image = imread(file_name)
+        if roi is not None:
+            image = image[tuple(roi)]
+
+    return image if dtype is None else image.astype(dtype, copy=False)
+
+
+def get_image_memmap(file_name):
+    """Open an image file as a read-only memory-mapped array.
+
+    Only the parts of the array that are sliced are read from disk,
+    so arrays larger than memory can be processed piece by piece.
+    Compressed TIFF files can not be mapped directly and are decoded
+    into a temporary file first.
+
+    Args:
+        file_name (str): path to a .npy or .tif file
+
+    Returns:
+        numpy.memmap: memory-mapped image data
+
+    Raises:
+        ValueError: file_name is not a .npy or .tif file
     """
     ext = os.path.splitext(file_name.lower())[-1]
+    if ext == '.npy':
+        return np.load(file_name, mmap_mode='r')
     if ext == '.tif' or ext == '.tiff':
-        return np.float32(TiffFile(file_name).asarray())
-    return np.float32(imread(file_name))
+        with TiffFile(file_name) as tif:
+            return tif.asarray(memmap=True)
+    raise ValueError('Expected a .npy or .tif file to memory-map. '
+                     'Got {}'.format(file_name))
+
+
+def get_npz_memmap(file_name):
+    """Open the arrays of an NPZ file as read-only memory-mapped arrays.
+
+    Arrays saved with ``numpy.savez`` are stored uncompressed and are
+    mapped directly from the NPZ file, so no data is read until the
+    arrays are sliced. Arrays saved with ``numpy.savez_compressed``
+    can not be mapped and are read into memory.
+
+    Args:
+        file_name (str): path to NPZ file
+
+    Returns:
+        dict: a numpy.memmap or numpy.array for each array in the file
+    """
+    arrays = {}
+    with zipfile.ZipFile(file_name) as archive, open(file_name, 'rb') as f:
+        for info in archive.infolist():
+            name = info.filename
+            if name.endswith('.npy'):
+                name = name[:-len('.npy')]
+
+            if info.compress_type == zipfile.ZIP_STORED:
+                # skip the local file header to the start of the .npy file
+                f.seek(info.header_offset + 26)
+                name_length, extra_length = struct.unpack('<HH', f.read(4))
+                f.seek(name_length + extra_length, os.SEEK_CUR)
+
+                version = np.lib.format.read_magic(f)
+                if version == (1, 0):
+                    header = np.lib.format.read_array_header_1_0(f)
+                else:
+                    header = np.lib.format.read_array_header_2_0(f)
+                shape, fortran_order, dtype = header
+
+                if not dtype.hasobject and np.prod(shape) > 0:
+                    arrays[name] = np.memmap(
+                        file_name, dtype=dtype, mode='r', shape=shape,
+                        order='F' if fortran_order else 'C', offset=f.tell())
+                    continue
+
+            arrays[name] = np.lib.format.read_array(archive.open(info))
+    return arrays
 
 
 def nikon_getfiles(direc_name, channel_name):
@@ -124,7 +250,13 @@ def get_image_sizes(data_location, channel_names):
     img_list_channels = []
     for channel in channel_names:
         img_list_channels.append(nikon_getfiles(data_location, channel))
-    img_temp = np.asarray(get_image(os.path.join(data_location, img_list_channels[0][0])))
+    img_path = os.path.join(data_location, img_list_channels[0][0])
+    # the shape of a TIFF file is read from its header, without the pixels
+    ext = os.path.splitext(img_path.lower())[-1]
+    if ext == '.tif' or ext == '.tiff':
+        with TiffFile(img_path) as tif:
+            return tuple(tif.series[0].shape)
+    img_temp = get_image(img_path, dtype=None)
     return img_temp.shape
 
 
@@ -138,6 +270,9 @@ def get_images_from_directory(data_location, channel_names):
     Returns:
         numpy.array: numpy array of each image in the directory
     """
+    # TensorFlow is only imported when needed, as it is slow to import
+    from tensorflow.python.keras import backend as K
+
     data_format = K.image_data_format()
     img_list_channels = []
     for channel in channel_names:
@@ -169,56 +304,186 @@ def get_images_from_directory(data_location, channel_names):
     return all_images
 
 
-def save_model_output(output,
-                      output_dir,
-                      feature_name='',
-                      channel=None,
-                      data_format=None):
-    """Save model output as tiff images in the provided directory
+def _save_tiff(task):
+    """Write the data of a (file_path, data, dtype, compress) task"""
+    file_path, data, dtype, compress = task
+    tiff.imsave(file_path, np.asarray(data, dtype=dtype), compress=compress)
 
-    Args:
-        output (numpy.array): output of model. Expects channel to have its own axis
-        output_dir (str): directory to save the model output images
-        feature_name (str): optional description to start each output image filename
-        channel (int): if given, only saves this channel
-    """
-    if data_format is None:
-        data_format = K.image_data_format()
-    channel_axis = 1 if data_format == 'channels_first' else -1
-    z_axis = 2 if data_format == 'channels_first' else 1
 
-    if channel is not None and not 0 < channel < output.shape[channel_axis]:
-        raise ValueError('`channel` must be in the range of the output '
-                         'channels. Got ', channel)
+class ModelOutputWriter(object):
+    """Save model outputs as TIFF files on a background thread pool.
 
-    if not os.path.isdir(output_dir):
-        raise IOError('{} is not a valid output_dir'.format(
-            output_dir))
+    ``write`` returns as soon as the files are queued, so the next batch
+    can be predicted while the last one is written to disk. The queued
+    outputs must not be modified until they are written.
 
-    for b in range(output.shape[0]):
-        # If multiple batches of results, create a numbered subdirectory
-        batch_dir = str(b) if output.shape[0] > 1 else ''
+    Args:
+        num_workers (int): number of threads writing files.
+            If 0, the files are written before ``write`` returns.
+        stack (bool): whether to save the frames of each batch and channel
+            as a single multi-page TIFF, instead of one file per frame.
+            Stacks larger than 4 GB are saved as BigTIFF files.
+        compress (int): zlib compression level from 0 to 9.
+            If 0, the files are not compressed.
+        dtype (str): dtype of the saved data, e.g. 'uint16' for labels.
+        data_format (str): One of 'channels_first', 'channels_last'.
+
+    Raises:
+        ValueError: compress is not in the range 0 to 9
+    """
+
+    def __init__(self,
+                 num_workers=4,
+                 stack=False,
+                 compress=0,
+                 dtype='int32',
+                 data_format=None):
+        if not 0 <= compress <= 9:
+            raise ValueError('`compress` must be in the range 0 to 9. '
+                             'Got {}'.format(compress))
+
+        if data_format is None:
+            # TensorFlow is only imported when needed, as it is slow to import
+            from tensorflow.python.keras import backend as K
+            data_format = K.image_data_format()
+
+        self.stack = stack
+        self.compress = compress
+        self.dtype = dtype
+        self.data_format = data_format
+        self._pool = ThreadPool(num_workers) if num_workers else None
+        self._results = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, output, output_dir, feature_name='', channel=None):
+        """Queue model output to be saved as tiff images in output_dir.
+
+        Args:
+            output (numpy.array): output of model. Expects channel to have its own axis
+            output_dir (str): directory to save the model output images
+            feature_name (str): optional description to start each output image filename
+            channel (int): if given, only saves this channel
+
+        Raises:
+            ValueError: channel is not a channel of output
+            IOError: output_dir is not a directory
+        """
+        channel_axis = 1 if self.data_format == 'channels_first' else -1
+        z_axis = 2 if self.data_format == 'channels_first' else 1
+
+        if channel is not None and not 0 <= channel < output.shape[channel_axis]:
+            raise ValueError('`channel` must be in the range of the output '
+                             'channels. Got {}'.format(channel))
+
+        if not os.path.isdir(output_dir):
+            raise IOError('{} is not a valid output_dir'.format(
+                output_dir))
 
         # If 2D, convert to 3D with only one z-axis
-        if len(output.shape) == 4:
+        if output.ndim == 4:
             output = np.expand_dims(output, axis=z_axis)
 
-        for f in range(output.shape[z_axis]):
-            for c in range(output.shape[channel_axis]):
-                # if only saving one channel, skip the non-equal channels
-                if channel is not None and channel != c:
-                    continue
+        if channel is None:
+            channels = range(output.shape[channel_axis])
+        else:
+            channels = [channel]
 
-                if data_format == 'channels_first':
-                    feature = output[b, c, f, :, :]
+        num_frames = output.shape[z_axis]
+        zpad = max(3, len(str(num_frames)))
+
+        for b in range(output.shape[0]):
+            # If multiple batches of results, create a numbered subdirectory
+            batch_dir = str(b) if output.shape[0] > 1 else ''
+            batch_dir = os.path.join(output_dir, batch_dir)
+            if not os.path.isdir(batch_dir):
+                os.makedirs(batch_dir)
+
+            for c in channels:
+                if self.data_format == 'channels_first':
+                    feature = output[b, c]
                 else:
-                    feature = output[b, f, :, :, c]
+                    feature = output[b, ..., c]
+
+                prefix = '{}_'.format(feature_name) if feature_name else ''
+
+                if self.stack:
+                    cnnout_name = '{}feature_{}.tif'.format(prefix, c)
+                    self._submit(os.path.join(batch_dir, cnnout_name), feature)
+                    continue
 
-                zpad = max(3, len(str(output.shape[z_axis])))
-                cnnout_name = 'feature_{}_frame_{}.tif'.format(c, str(f).zfill(zpad))
-                if feature_name:
-                    cnnout_name = '{}_{}'.format(feature_name, cnnout_name)
+                for f in range(num_frames):
+                    cnnout_name = '{}feature_{}_frame_{}.tif'.format(
+                        prefix, c, str(f).zfill(zpad))
+                    self._submit(os.path.join(batch_dir, cnnout_name), feature[f])
 
-                out_file_path = os.path.join(output_dir, batch_dir, cnnout_name)
-                tiff.imsave(out_file_path, feature.astype('int32'))
-        print('Saved {} frames to {}'.format(output.shape[1], output_dir))
+    def _submit(self, file_path, data):
+        task = (file_path, data, self.dtype, self.compress)
+        if self._pool is None:
+            _save_tiff(task)
+        else:
+            self._results.append(self._pool.apply_async(_save_tiff, (task,)))
+
+    def wait(self):
+        """Wait for all queued files to be written.
+
+        Raises:
+            Exception: the error of any file that failed to be written
+        """
+        results, self._results = self._results, []
+        for result in results:
+            result.get()
+
+    def close(self):
+        """Wait for all queued files to be written and stop the threads."""
+        try:
+            self.wait()
+        finally:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
+
+
+def save_model_output(output,
+                      output_dir,
+                      feature_name='',
+                      channel=None,
+                      data_format=None,
+                      stack=False,
+                      compress=0,
+                      dtype='int32',
+                      num_workers=4):
+    """Save model output as tiff images in the provided directory
+
+    Use a ``ModelOutputWriter`` to save outputs in the background while
+    predicting the next batch.
+
+    Args:
+        output (numpy.array): output of model. Expects channel to have its own axis
+        output_dir (str): directory to save the model output images
+        feature_name (str): optional description to start each output image filename
+        channel (int): if given, only saves this channel
+        data_format (str): One of 'channels_first', 'channels_last'.
+        stack (bool): whether to save the frames of each batch and channel
+            as a single multi-page TIFF, instead of one file per frame.
+        compress (int): zlib compression level from 0 to 9.
+            If 0, the files are not compressed.
+        dtype (str): dtype of the saved data, e.g. 'uint16' for labels.
+        num_workers (int): number of threads writing files.
+    """
+    with ModelOutputWriter(num_workers=num_workers,
+                           stack=stack,
+                           compress=compress,
+                           dtype=dtype,
+                           data_format=data_format) as writer:
+        writer.write(output, output_dir, feature_name=feature_name,
+                     channel=channel)
+
+    z_axis = 2 if writer.data_format == 'channels_first' else 1
+    num_frames = output.shape[z_axis] if output.ndim == 5 else 1
+    print('Saved {} frames to {}'.format(num_frames, output_dir))
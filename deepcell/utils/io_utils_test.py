@@ -117,6 +117,82 @@ class TestIOUtils(test.TestCase):
         _write_image(test_img_path, 400, 400)
         test_img = io_utils.get_image(test_img_path)
         self.assertEqual(np.asarray(test_img).shape, (400, 400))
+        test_img = io_utils.get_image(test_img_path, dtype=None,
+                                      roi=(slice(10, 20), slice(0, 5)))
+        self.assertEqual(test_img.shape, (10, 5))
+        self.assertEqual(test_img.dtype, np.uint8)
+        with self.assertRaises(ValueError):
+            io_utils.get_image(test_img_path, page=0)
+
+    def test_get_image_pages(self):
+        temp_dir = self.get_temp_dir()
+        stack = np.random.randint(0, 1000, size=(5, 30, 40)).astype('uint16')
+        test_img_path = os.path.join(temp_dir, 'stack.tif')
+        tiff.imsave(test_img_path, stack)
+        # the whole stack
+        test_img = io_utils.get_image(test_img_path)
+        self.assertEqual(test_img.dtype, np.float32)
+        self.assertAllEqual(test_img, stack)
+        # a single page
+        test_img = io_utils.get_image(test_img_path, page=3, dtype=None)
+        self.assertEqual(test_img.dtype, np.uint16)
+        self.assertAllEqual(test_img, stack[3])
+        # some of the pages
+        test_img = io_utils.get_image(test_img_path, page=[4, 1])
+        self.assertAllEqual(test_img, stack[[4, 1]])
+        test_img = io_utils.get_image(test_img_path, page=slice(1, None, 2))
+        self.assertAllEqual(test_img, stack[1::2])
+        # a region of interest of some of the pages
+        roi = (slice(5, 25), slice(10, 12))
+        test_img = io_utils.get_image(test_img_path, roi=roi, dtype='int32')
+        self.assertEqual(test_img.dtype, np.int32)
+        self.assertAllEqual(test_img, stack[:, 5:25, 10:12])
+        test_img = io_utils.get_image(test_img_path, page=2, roi=roi)
+        self.assertAllEqual(test_img, stack[2, 5:25, 10:12])
+        # invalid page
+        with self.assertRaises(IndexError):
+            io_utils.get_image(test_img_path, page=5)
+
+    def test_get_image_memmap(self):
+        temp_dir = self.get_temp_dir()
+        array = np.random.random((2, 30, 40, 1)).astype('float32')
+        # test npy files
+        test_img_path = os.path.join(temp_dir, 'image.npy')
+        np.save(test_img_path, array)
+        test_img = io_utils.get_image_memmap(test_img_path)
+        self.assertIsInstance(test_img, np.memmap)
+        self.assertAllEqual(test_img, array)
+        # test tiff files
+        test_img_path = os.path.join(temp_dir, 'image.tif')
+        tiff.imsave(test_img_path, array[0, ..., 0])
+        test_img = io_utils.get_image_memmap(test_img_path)
+        self.assertIsInstance(test_img, np.memmap)
+        self.assertAllEqual(test_img, array[0, ..., 0])
+        # test invalid files
+        with self.assertRaises(ValueError):
+            io_utils.get_image_memmap(os.path.join(temp_dir, 'image.png'))
+
+    def test_get_npz_memmap(self):
+        temp_dir = self.get_temp_dir()
+        X = np.random.random((3, 30, 40, 1)).astype('float32')
+        y = np.asfortranarray(np.random.randint(5, size=(3, 30, 40, 1)))
+        empty = np.zeros((0, 4))
+        # uncompressed arrays are memory-mapped
+        npz_path = os.path.join(temp_dir, 'data.npz')
+        np.savez(npz_path, X=X, y=y, empty=empty)
+        arrays = io_utils.get_npz_memmap(npz_path)
+        self.assertEqual(set(arrays), {'X', 'y', 'empty'})
+        self.assertIsInstance(arrays['X'], np.memmap)
+        self.assertIsInstance(arrays['y'], np.memmap)
+        self.assertAllEqual(arrays['X'], X)
+        self.assertAllEqual(arrays['y'], y)
+        self.assertEqual(arrays['empty'].shape, empty.shape)
+        # compressed arrays are read into memory
+        npz_path = os.path.join(temp_dir, 'compressed.npz')
+        np.savez_compressed(npz_path, X=X)
+        arrays = io_utils.get_npz_memmap(npz_path)
+        self.assertNotIsInstance(arrays['X'], np.memmap)
+        self.assertAllEqual(arrays['X'], X)
 
     def test_nikon_getfiles(self):
         temp_dir = self.get_temp_dir()
@@ -140,6 +216,11 @@ class TestIOUtils(test.TestCase):
         # test with multiple channel names
         sizes = io_utils.get_image_sizes(temp_dir, ['image1', 'image2'])
         self.assertEqual(sizes, (300, 300))
+        # multi-page TIFF files include the number of pages
+        tiff.imsave(os.path.join(temp_dir, 'stack.tif'),
+                    np.zeros((5, 30, 40), dtype='float32'))
+        sizes = io_utils.get_image_sizes(temp_dir, ['stack'])
+        self.assertEqual(sizes, (5, 30, 40))
 
     def test_get_images_from_directory(self):
         temp_dir = self.get_temp_dir()
@@ -201,5 +282,38 @@ class TestIOUtils(test.TestCase):
             bad_dir = os.path.join(temp_dir, 'test')
             io_utils.save_model_output(output, bad_dir, 'test', channel=None)
 
+    def test_save_model_output_stack(self):
+        temp_dir = self.get_temp_dir()
+        batches, features, frames = 2, 3, 5
+        output = np.random.randint(0, 100, size=(batches, frames, 30, 30, features))
+
+        io_utils.save_model_output(output, temp_dir, 'test', stack=True,
+                                   compress=6, dtype='uint16',
+                                   data_format='channels_last')
+
+        for b in range(batches):
+            for c in range(features):
+                path = os.path.join(temp_dir, str(b), 'test_feature_{}.tif'.format(c))
+                saved = io_utils.get_image(path, dtype=None)
+                self.assertEqual(saved.dtype, np.uint16)
+                self.assertAllEqual(saved, output[b, ..., c])
+
+        # one file per frame, written by a single writer
+        with io_utils.ModelOutputWriter(num_workers=2,
+                                        data_format='channels_last') as writer:
+            for b in range(batches):
+                batch_dir = os.path.join(temp_dir, 'frames_{}'.format(b))
+                os.makedirs(batch_dir)
+                writer.write(output[b:b + 1], batch_dir, channel=0)
+
+        for b in range(batches):
+            for f in range(output.shape[1]):
+                path = os.path.join(temp_dir, 'frames_{}'.format(b),
+                                    'feature_0_frame_{:03d}.tif'.format(f))
+                self.assertAllEqual(io_utils.get_image(path), output[b, f, ..., 0])
+
+        with self.assertRaises(ValueError):
+            io_utils.ModelOutputWriter(compress=10)
+
 if __name__ == '__main__':
     test.main()
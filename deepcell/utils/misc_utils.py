@@ -29,7 +29,11 @@ from __future__ import absolute_import
 from __future__ import print_function
 from __future__ import division
 
+import importlib
 import re
+import types
+
+import numpy as np
 
 
 def sorted_nicely(l):
@@ -59,3 +63,99 @@ def get_sorted_keys(dict_to_sort):
     sorted_keys = list(dict_to_sort.keys())
     sorted_keys.sort(key=lambda x: int(x[1:]))
     return sorted_keys
+
+
+def relabel_sequential(y):
+    """Relabel the objects of a label image to be from 1 to N.
+
+    The labels keep their order and 0 is kept as the background.
+    All labels are relabeled at once with a lookup table, or with
+    ``numpy.unique`` if the labels are too large for a lookup table.
+
+    Args:
+        y (numpy.array): tensor of integer labels
+
+    Returns:
+        numpy.array: relabeled tensor with sequential labels,
+            with the same dtype as y.
+    """
+    y = np.asarray(y)
+    if not y.size:
+        return y.copy()
+
+    max_label = y.max()
+    if y.dtype.kind in 'ui' and y.min() >= 0 and max_label < max(y.size, 2 ** 16):
+        # the labels are small, so the cast is safe even for uint64,
+        # which numpy.bincount can not cast to int64 by itself
+        indices = y.astype('int64', copy=False)
+
+        # lookup table of the new label of each label from 0 to max_label
+        is_label = np.bincount(indices.ravel(), minlength=int(max_label) + 1) > 0
+        is_label[0] = False
+        lookup = np.cumsum(is_label).astype(y.dtype)
+        return lookup[indices]
+
+    labels, inverse = np.unique(y, return_inverse=True)
+    new_labels = np.cumsum(labels != 0).astype(y.dtype)
+    new_labels[labels == 0] = 0
+    return new_labels[inverse].reshape(y.shape)
+
+
+class LazyModule(types.ModuleType):
+    """A module that imports its submodules and attributes on first access.
+
+    Replacing a package in ``sys.modules`` with a ``LazyModule`` keeps
+    ``import package`` cheap, as heavy dependencies (e.g. TensorFlow) are
+    only imported once an attribute that needs them is used.
+    Only the given submodules and attributes are resolved, any other
+    name raises an AttributeError without importing anything.
+
+    ``__all__`` lists the public globals, the submodules and the attributes.
+
+    Args:
+        name (str): name of the module being replaced, i.e. ``__name__``
+        module_globals (dict): globals of the module being replaced
+        submodules (list): names of submodules available as attributes
+        attributes (dict): maps each attribute name to the name of the
+            module it is imported from.
+    """
+
+    def __init__(self, name, module_globals, submodules=(), attributes=None):
+        super(LazyModule, self).__init__(name, module_globals.get('__doc__'))
+        self.__dict__.update(module_globals)
+        self._lazy_submodules = set(submodules)
+        self._lazy_attributes = dict(attributes or {})
+
+    def _load(self, name):
+        if name in self._lazy_submodules:
+            return importlib.import_module('{}.{}'.format(self.__name__, name))
+
+        if name in self._lazy_attributes:
+            module = importlib.import_module(self._lazy_attributes[name])
+            return getattr(module, name)
+
+        raise AttributeError('module {} has no attribute {}'.format(
+            self.__name__, name))
+
+    def _get_all(self):
+        names = set(n for n in self.__dict__ if not n.startswith('_'))
+        names.update(self._lazy_submodules)
+        names.update(self._lazy_attributes)
+        return sorted(names)
+
+    def __getattr__(self, name):
+        if name == '__all__':
+            self.__all__ = self._get_all()
+            return self.__all__
+        if name.startswith('_'):
+            raise AttributeError('module {} has no attribute {}'.format(
+                self.__name__, name))
+        value = self._load(name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        names = set(self.__dict__)
+        names.update(self._lazy_submodules)
+        names.update(self._lazy_attributes)
+        return sorted(names)
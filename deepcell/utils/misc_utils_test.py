@@ -28,6 +28,11 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import subprocess
+import sys
+import types
+
+import numpy as np
 from tensorflow.python.platform import test
 
 from deepcell.utils import misc_utils
@@ -48,6 +53,88 @@ class MiscUtilsTest(test.TestCase):
         d = {'C1': 1, 'C3': 2, 'C2': 3}
         self.assertListEqual(misc_utils.get_sorted_keys(d), ['C1', 'C2', 'C3'])
 
+    def test_relabel_sequential(self):
+        y = np.array([[0, 3, 5], [4, 99, 123]], dtype='uint16')
+        expected = np.array([[0, 1, 3], [2, 4, 5]])
+        relabeled = misc_utils.relabel_sequential(y)
+        self.assertEqual(relabeled.dtype, y.dtype)
+        self.assertAllEqual(relabeled, expected)
+        # labels too large for a lookup table
+        relabeled = misc_utils.relabel_sequential(y.astype('int64') * 10 ** 9)
+        self.assertEqual(relabeled.dtype, np.int64)
+        self.assertAllEqual(relabeled, expected)
+        # negative labels and no background
+        y = np.array([[-2, 7], [7, 1]])
+        self.assertAllEqual(misc_utils.relabel_sequential(y), [[1, 3], [3, 2]])
+        # compare to a loop over each label
+        y = np.random.randint(0, 500, size=(3, 16, 16, 1)).astype('int32')
+        expected = np.zeros_like(y)
+        for i, label in enumerate(np.unique(y[y > 0])):
+            expected[y == label] = i + 1
+        self.assertAllEqual(misc_utils.relabel_sequential(y), expected)
+        # uint64 labels can not be safely cast by numpy.bincount
+        for dtype in ['uint16', 'uint64']:
+            relabeled = misc_utils.relabel_sequential(y.astype(dtype))
+            self.assertEqual(relabeled.dtype, np.dtype(dtype))
+            self.assertAllEqual(relabeled, expected)
+        relabeled = misc_utils.relabel_sequential(y.astype('uint64') * 10 ** 9)
+        self.assertAllEqual(relabeled, expected)
+        # empty arrays
+        self.assertEqual(misc_utils.relabel_sequential(np.zeros((0, 3))).shape, (0, 3))
+
+    def test_lazy_module(self):
+        name = 'deepcell_lazy_module_test'
+        self.addCleanup(sys.modules.pop, name, None)
+
+        module = misc_utils.LazyModule(
+            name, {'__doc__': 'lazy test module', 'x': 1},
+            submodules=['test'],
+            attributes={'sorted_nicely': 'deepcell.utils.misc_utils',
+                        'join': 'os.path'})
+        sys.modules[name] = module
+
+        self.assertEqual(module.__doc__, 'lazy test module')
+        self.assertEqual(module.x, 1)
+        self.assertIs(module.sorted_nicely, misc_utils.sorted_nicely)
+        self.assertIs(module.join, __import__('os').path.join)
+        self.assertIn('sorted_nicely', dir(module))
+        self.assertIn('test', dir(module))
+        self.assertIn('join', module.__dict__)  # cached after first use
+
+        self.assertEqual(module.__all__, ['join', 'sorted_nicely', 'test', 'x'])
+
+        # other names are not searched for in any module
+        with self.assertRaises(AttributeError):
+            module.get_sorted_keys  # pylint: disable=pointless-statement
+        with self.assertRaises(AttributeError):
+            module.missing  # pylint: disable=pointless-statement
+        with self.assertRaises(AttributeError):
+            module._private  # pylint: disable=pointless-statement
+        self.assertIsInstance(module, types.ModuleType)
+
+    def test_import_time(self):
+        # importing deepcell or looking up a missing name must not
+        # import TensorFlow
+        code = ('import sys, timeit; '
+                'start = timeit.default_timer(); '
+                'import {0}; '
+                'print(timeit.default_timer() - start); '
+                # e.g. the pytest_plugins lookup of pytest collection
+                'hasattr({0}, "pytest_plugins"); '
+                'print("tensorflow" in sys.modules)')
+
+        def get_import_time(module):
+            output = subprocess.check_output(
+                [sys.executable, '-c', code.format(module)])
+            seconds, imported_tf = output.decode().split()[-2:]
+            return float(seconds), imported_tf == 'True'
+
+        deepcell_time, imported_tf = get_import_time('deepcell')
+        self.assertFalse(imported_tf)
+
+        tensorflow_time, _ = get_import_time('tensorflow')
+        self.assertLess(deepcell_time, tensorflow_time)
+
 
 if __name__ == '__main__':
     test.main()
@@ -39,6 +39,32 @@ from tensorflow.python.keras import backend as K
 
 from deepcell_toolbox import erode_edges
 
+from deepcell.utils.misc_utils import relabel_sequential
+
+
+def normalize_by_label(distance, label_matrix):
+    """Divide the distance of each pixel by the maximum distance of its label.
+
+    The maximum of every label is found in a single pass with
+    ``scipy.ndimage.maximum``, then gathered for each pixel.
+
+    Args:
+        distance (numpy.array): distance transform of the label mask
+        label_matrix (numpy.array): sequential labels, e.g. from ``label``
+
+    Returns:
+        numpy.array: distance normalized to be at most 1 in each label,
+            with the background unchanged.
+    """
+    num_labels = int(label_matrix.max()) if label_matrix.size else 0
+    if num_labels < 1:
+        return distance
+
+    max_distance = np.ones(num_labels + 1, dtype=distance.dtype)
+    max_distance[1:] = ndimage.maximum(distance, label_matrix,
+                                       index=np.arange(1, num_labels + 1))
+    return distance / max_distance[label_matrix]
+
 
 def pixelwise_transform(mask, dilation_radius=None, data_format=None,
                         separate_edge_classes=False):
@@ -66,18 +92,21 @@ def pixelwise_transform(mask, dilation_radius=None, data_format=None,
         channel_axis = -1
 
     # Detect the edges and interiors
-    new_mask = np.zeros(mask.shape)
     strel = ball(1) if mask.ndim > 2 else disk(1)
-    for cell_label in np.unique(mask):
-        if cell_label != 0:
-            # get the cell interior
-            img = mask == cell_label
-            img = binary_erosion(img, strel)
-            new_mask += img
+    interior = np.zeros(mask.shape, dtype='bool')
+
+    # erode each cell inside its bounding box, padded by the radius of
+    # strel so the erosion is the same as on the whole image
+    labels = relabel_sequential(np.where(mask > 0, mask, 0).astype('int64'))
+    for i, bbox in enumerate(ndimage.find_objects(labels)):
+        if bbox is None:
+            continue
+        bbox = tuple(slice(max(s.start - 1, 0), s.stop + 1) for s in bbox)
+        img = labels[bbox] == i + 1
+        interior[bbox] |= binary_erosion(img, strel)
 
-    interior = np.multiply(new_mask, mask)
-    edge = (mask - interior > 0).astype('int')
-    interior = (interior > 0).astype('int')
+    edge = np.logical_and(mask > 0, ~interior).astype('int')
+    interior = interior.astype('int')
 
     if not separate_edge_classes:
         if dilation_radius:
@@ -152,10 +181,7 @@ def distance_transform_2d(mask, bins=16, erosion_width=None):
     # uniquely label each cell and normalize the distance values
     # by that cells maximum distance value
     label_matrix = label(mask)
-    for prop in regionprops(label_matrix):
-        labeled_distance = distance[label_matrix == prop.label]
-        normalized_distance = labeled_distance / np.amax(labeled_distance)
-        distance[label_matrix == prop.label] = normalized_distance
+    distance = normalize_by_label(distance, label_matrix)
 
     # bin each distance value into a class from 1 to bins
     min_dist = np.amin(distance)
@@ -186,10 +212,7 @@ def distance_transform_continuous_2d(mask, erosion_width=None):
     # uniquely label each cell and normalize the distance values
     # by that cells maximum distance value
     label_matrix = label(mask)
-    for prop in regionprops(label_matrix):
-        labeled_distance = distance[label_matrix == prop.label]
-        normalized_distance = labeled_distance / np.amax(labeled_distance)
-        distance[label_matrix == prop.label] = normalized_distance
+    distance = normalize_by_label(distance, label_matrix)
 
     return distance  # minimum distance should be 0, not 1
 
@@ -205,27 +228,37 @@ def distance_transform_continuous_movie(mask, erosion_width=None):
         numpy.array: a mask of same shape as input mask,
             with each label being a distance class from 1 to bins
     """
-    distances = []
-    for frame in range(mask.shape[0]):
-        mask_frame = mask[frame]
-        mask_frame = np.squeeze(mask_frame)  # squeeze the channels
-        mask_frame = erode_edges(mask_frame, erosion_width)
+    distances = [distance_transform_continuous_2d(frame, erosion_width)
+                 for frame in mask]
+    distances = np.stack(distances, axis=0)
 
-        distance = ndimage.distance_transform_edt(mask_frame)
-        distance = distance.astype(K.floatx())  # normalized distances are floats
+    return distances  # minimum distance should be 0, not 1
 
-        # uniquely label each cell and normalize the distance values
-        # by that cells maximum distance value
-        label_matrix = label(mask_frame)
-        for prop in regionprops(label_matrix):
-            labeled_distance = distance[label_matrix == prop.label]
-            normalized_distance = labeled_distance / np.amax(labeled_distance)
-            distance[label_matrix == prop.label] = normalized_distance
-        distances.append(distance)
 
-    distances = np.stack(distances, axis=0)
+def _centroid_transform(distance, label_matrix, alpha=0.1):
+    """Transform each pixel of each label into 1 / (1 + alpha * d ** 2),
+    where d is its distance to the weighted centroid of its label.
 
-    return distances  # minimum distance should be 0, not 1
+    The centroids of all labels are computed at once with ``np.bincount``.
+    Centroids are found in the last two axes, so a stack of frames with
+    unique labels in each frame is transformed frame by frame.
+    """
+    inner_distance = np.zeros(distance.shape, dtype=K.floatx())
+
+    foreground = np.nonzero(label_matrix)
+    labels = label_matrix[foreground]
+    weights = distance[foreground].astype('float64')
+
+    total_weight = np.bincount(labels, weights=weights)
+    total_weight[total_weight == 0] = 1  # unused labels
+
+    distance_to_center = np.zeros(labels.shape)
+    for coords in foreground[-2:]:
+        center = np.bincount(labels, weights=weights * coords) / total_weight
+        distance_to_center += (coords - center[labels]) ** 2
+
+    inner_distance[foreground] = 1 / (1 + alpha * distance_to_center)
+    return inner_distance
 
 
 def centroid_transform_continuous_2d(mask, erosion_width=None, alpha=0.1):
@@ -248,17 +281,7 @@ def centroid_transform_continuous_2d(mask, erosion_width=None, alpha=0.1):
 
     label_matrix = label(mask)
 
-    inner_distance = np.zeros(distance.shape, dtype=K.floatx())
-    for prop in regionprops(label_matrix, distance):
-        coords = prop.coords
-        center = prop.weighted_centroid
-        distance_to_center = np.sum((coords - center) ** 2, axis=1)
-        center_transform = 1 / (1 + alpha * distance_to_center)
-        coords_x = coords[:, 0]
-        coords_y = coords[:, 1]
-        inner_distance[coords_x, coords_y] = center_transform
-
-    return inner_distance
+    return _centroid_transform(distance, label_matrix, alpha=alpha)
 
 
 def centroid_transform_continuous_movie(mask, erosion_width=None, alpha=0.1):
@@ -273,7 +296,9 @@ def centroid_transform_continuous_movie(mask, erosion_width=None, alpha=0.1):
         numpy.array: a mask of same shape as input mask,
             with each label being a distance class from 1 to bins
     """
-    inner_distances = []
+    distances = []
+    label_matrices = []
+    num_labels = 0
 
     for frame in range(mask.shape[0]):
         mask_frame = mask[frame]
@@ -281,24 +306,18 @@ def centroid_transform_continuous_movie(mask, erosion_width=None, alpha=0.1):
         mask_frame = erode_edges(mask_frame, erosion_width)
 
         distance = ndimage.distance_transform_edt(mask_frame)
-        distance = distance.astype(K.floatx())
+        distances.append(distance.astype(K.floatx()))
 
+        # offset the labels of each frame to be unique in the movie
         label_matrix = label(mask_frame)
+        label_matrices.append(np.where(label_matrix > 0,
+                                       label_matrix + num_labels, 0))
+        num_labels += label_matrix.max()
 
-        inner_distance = np.zeros(distance.shape, dtype=K.floatx())
-        for prop in regionprops(label_matrix, distance):
-            coords = prop.coords
-            center = prop.weighted_centroid
-            distance_to_center = np.sum((coords - center) ** 2, axis=1)
-            center_transform = 1 / (1 + alpha * distance_to_center)
-            coords_x = coords[:, 0]
-            coords_y = coords[:, 1]
-            inner_distance[coords_x, coords_y] = center_transform
-        inner_distances.append(inner_distance)
-
-    inner_distances = np.stack(inner_distances, axis=0)
-
-    return inner_distances
+    # transform all frames at once
+    distances = np.stack(distances, axis=0)
+    label_matrices = np.stack(label_matrices, axis=0)
+    return _centroid_transform(distances, label_matrices, alpha=alpha)
 
 
 def distance_transform_3d(maskstack, bins=4, erosion_width=None):
@@ -319,11 +338,8 @@ def distance_transform_3d(maskstack, bins=4, erosion_width=None):
     distance = ndimage.distance_transform_edt(maskstack, sampling=[0.5, 0.217, 0.217])
 
     # normalize by maximum distance
-    for cell_label in np.unique(maskstack):
-        if cell_label == 0:  # distance is only found for non-zero regions
-            continue
-        index = np.nonzero(maskstack == cell_label)
-        distance[index] = distance[index] / np.amax(distance[index])
+    label_matrix = relabel_sequential(maskstack.astype('int64'))
+    distance = normalize_by_label(distance, label_matrix)
     # divide into bins
     min_dist = np.amin(distance.flatten())
     max_dist = np.amax(distance.flatten())
@@ -426,6 +442,58 @@ def rotate_array_270(arr):
     return arr[tuple(slices)].transpose(axes_order)
 
 
+def flip_array(arr):
+    """Flip array along its last axis
+
+    Args:
+        arr (numpy.array): input array
+
+    Returns:
+        numpy.array: flipped array
+    """
+    return arr[..., ::-1]
+
+
+def get_dihedral_transforms(square=True):
+    """Get the transforms of the dihedral group and their inverses.
+
+    The transforms are applied to the last two axes of an array.
+    Rotating by 90 or 270 degrees swaps these axes, so these transforms
+    are only included if the last two axes are the same size.
+
+    Args:
+        square (bool): whether the last two axes are the same size.
+            If False, only the 4 transforms that keep the shape are returned.
+
+    Returns:
+        list: (transform, inverse) pairs of functions
+    """
+    if square:
+        rotations = [
+            (rotate_array_0, rotate_array_0),
+            (rotate_array_90, rotate_array_270),
+            (rotate_array_180, rotate_array_180),
+            (rotate_array_270, rotate_array_90),
+        ]
+    else:
+        rotations = [
+            (rotate_array_0, rotate_array_0),
+            (rotate_array_180, rotate_array_180),
+        ]
+
+    def _flipped(rotate):
+        return lambda arr: flip_array(rotate(arr))
+
+    def _unflipped(inverse):
+        return lambda arr: inverse(flip_array(arr))
+
+    transforms = []
+    for rotate, inverse in rotations:
+        transforms.append((rotate, inverse))
+        transforms.append((_flipped(rotate), _unflipped(inverse)))
+    return transforms
+
+
 def to_categorical(y, num_classes=None):
     """Converts a class vector (integers) to binary class matrix.
     E.g. for use with categorical_crossentropy.
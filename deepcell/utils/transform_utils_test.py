@@ -28,8 +28,14 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import time
+
 import numpy as np
+from scipy import ndimage
 from skimage.measure import label
+from skimage.measure import regionprops
+from skimage.morphology import ball, disk
+from skimage.morphology import binary_erosion
 from tensorflow.python.platform import test
 from tensorflow.python.keras import backend as K
 
@@ -52,7 +58,49 @@ def _generate_test_masks():
     return mask_images
 
 
+def _get_edge_and_interior(mask):
+    """Erode each cell over the whole image, to compare to the
+    bounding box erosion of pixelwise_transform"""
+    new_mask = np.zeros(mask.shape)
+    strel = ball(1) if mask.ndim > 2 else disk(1)
+    for cell_label in np.unique(mask):
+        if cell_label != 0:
+            new_mask += binary_erosion(mask == cell_label, strel)
+
+    interior = np.multiply(new_mask, mask)
+    edge = (mask - interior > 0).astype('int')
+    interior = (interior > 0).astype('int')
+    return edge, interior
+
+
+def _generate_cell_mask(num_cells, img_size=512, radius=4, ndim=2):
+    """Label mask of num_cells touching square cells on a grid"""
+    cells_per_axis = int(np.ceil(num_cells ** (1. / ndim)))
+    size = max(img_size, cells_per_axis * 2 * radius)
+    mask = np.zeros((size,) * ndim, dtype='int32')
+    for i, index in enumerate(np.ndindex(*(cells_per_axis,) * ndim)):
+        if i == num_cells:
+            break
+        bbox = tuple(slice(2 * radius * j, 2 * radius * (j + 1)) for j in index)
+        mask[bbox] = i + 1
+    return mask
+
+
 class TransformUtilsTest(test.TestCase):
+    def test_pixelwise_transform_bounding_boxes(self):
+        K.set_image_data_format('channels_last')
+        masks = [np.squeeze(label(img)) for img in _generate_test_masks()]
+        # touching cells, sparse labels and cells on the image border
+        masks.append(_generate_cell_mask(50, img_size=30, radius=3) * 7)
+        masks.append(_generate_cell_mask(30, img_size=12, radius=2, ndim=3))
+
+        for mask in masks:
+            edge, interior = _get_edge_and_interior(mask)
+            pw_img = transform_utils.pixelwise_transform(mask)
+            self.assertAllEqual(pw_img[..., 0], edge)
+            self.assertAllEqual(pw_img[..., 1], interior)
+            self.assertAllEqual(pw_img[..., 2], 1 - edge - interior)
+
     def test_pixelwise_transform_2d(self):
         with self.cached_session():
             K.set_image_data_format('channels_last')
@@ -148,6 +196,26 @@ class TransformUtilsTest(test.TestCase):
                     pw_img_dil[..., 0].sum() + pw_img_dil[..., 1].sum(),
                     pw_img[..., 0].sum() + pw_img[..., 1].sum())
 
+    def test_normalize_by_label(self):
+        for ndim in (2, 3):
+            mask = _generate_cell_mask(30, img_size=20, radius=2, ndim=ndim)
+            distance = np.random.random(mask.shape).astype('float32')
+
+            expected = distance.copy()
+            for cell_label in np.unique(mask[mask > 0]):
+                index = mask == cell_label
+                expected[index] = distance[index] / distance[index].max()
+
+            normalized = transform_utils.normalize_by_label(distance, mask)
+            self.assertEqual(normalized.dtype, distance.dtype)
+            self.assertAllEqual(normalized, expected)
+
+        # no labels
+        distance = np.random.random((10, 10))
+        normalized = transform_utils.normalize_by_label(
+            distance, np.zeros(distance.shape, dtype='int'))
+        self.assertAllEqual(normalized, distance)
+
     def test_distance_transform_3d(self):
         mask_stack = np.array(_generate_test_masks())
         unique = np.zeros(mask_stack.shape)
@@ -252,6 +320,22 @@ class TransformUtilsTest(test.TestCase):
         self.assertEqual(str(centroids.dtype), str(K.floatx()))
         self.assertEqual(centroids.shape, img.shape[:-1])
 
+        # compare each frame to the weighted centroids of regionprops
+        alpha = 0.1
+        for frame, centroid in zip(img, centroids):
+            frame = label(np.squeeze(frame))
+            distance = ndimage.distance_transform_edt(frame)
+            expected = np.zeros(frame.shape, dtype=K.floatx())
+            for prop in regionprops(frame, distance):
+                distance_to_center = np.sum(
+                    (prop.coords - prop.weighted_centroid) ** 2, axis=1)
+                expected[tuple(prop.coords.T)] = 1 / (1 + alpha * distance_to_center)
+
+            self.assertAllClose(centroid, expected)
+            self.assertAllClose(
+                transform_utils.centroid_transform_continuous_2d(frame),
+                expected)
+
     def test_distance_transform_continuous_2d(self):
         for img in _generate_test_masks():
             K.set_image_data_format('channels_last')
@@ -332,5 +416,52 @@ class TransformUtilsTest(test.TestCase):
         rotated_image2 = transform_utils.rotate_array_180(img)
         self.assertAllEqual(rotated_image1, rotated_image2)
 
+    def test_get_dihedral_transforms(self):
+        img = np.random.random((2, 3, 8, 8))
+        transforms = transform_utils.get_dihedral_transforms()
+        self.assertEqual(len(transforms), 8)
+
+        transformed = [transform(img) for transform, _ in transforms]
+        for i, (_, inverse) in enumerate(transforms):
+            self.assertAllEqual(inverse(transformed[i]), img)
+            # every transform is unique
+            for j in range(i):
+                self.assertFalse(np.array_equal(transformed[i], transformed[j]))
+
+        # non-square images keep their shape
+        img = np.random.random((2, 3, 8, 5))
+        transforms = transform_utils.get_dihedral_transforms(square=False)
+        self.assertEqual(len(transforms), 4)
+        for transform, inverse in transforms:
+            self.assertEqual(transform(img).shape, img.shape)
+            self.assertAllEqual(inverse(transform(img)), img)
+
+
+class PixelwiseTransformBenchmark(test.Benchmark):
+    """Benchmark of pixelwise_transform as the number of cells grows.
+
+    Run with ``python transform_utils_test.py --benchmarks=.``
+    """
+
+    def _benchmark(self, ndim, img_size, cell_counts, num_runs=3):
+        for num_cells in cell_counts:
+            mask = _generate_cell_mask(num_cells, img_size=img_size, ndim=ndim)
+            start = time.time()
+            for _ in range(num_runs):
+                transform_utils.pixelwise_transform(
+                    mask, data_format='channels_last')
+            self.report_benchmark(
+                name='pixelwise_transform_{}d_{}_cells'.format(ndim, num_cells),
+                iters=num_runs,
+                wall_time=(time.time() - start) / num_runs,
+                extras={'num_cells': num_cells, 'image_size': mask.shape})
+
+    def benchmark_pixelwise_transform_2d(self):
+        self._benchmark(2, 2048, [100, 1000, 10000])
+
+    def benchmark_pixelwise_transform_3d(self):
+        self._benchmark(3, 64, [10, 100, 1000])
+
+
 if __name__ == '__main__':
     test.main()